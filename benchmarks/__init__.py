@@ -0,0 +1,8 @@
+""" Jackal end-to-end benchmarks
+
+Synthetic gateway files (generators), a local stub of the IEnergyDa REST API
+(stub) and the measures of the plugins and of the JApp/JThread pipeline
+(pipeline). Run them from the repository root with
+
+    python -m benchmarks --help
+"""
@@ -0,0 +1,133 @@
+""" Runs the benchmarks and prints the report
+
+    python -m benchmarks [--plugins pod deval ...] [--files 4] [--scale 1]
+                         [--latency 0.05] [--errors 0.01]
+                         [-o chunkrecords=1000] [-p processes=2] [--json]
+
+Run it from the repository root. Every plugin gets its own processes: the
+parse rate is measured first, then the whole pipeline against a stub of the
+REST API running in this process.
+"""
+
+import argparse
+import concurrent.futures
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+
+from benchmarks import generators, pipeline, stub
+
+PLUGINS = ['pod', 'deval', 'schneider', 'solarlog1', 'solarlog2']
+
+
+def options(pairs):
+    parsed = {}
+    for pair in pairs:
+        (key, sep, value) = pair.partition('=')
+        if not sep:
+            raise argparse.ArgumentTypeError('option %s is not key=value' % pair)
+        parsed[key.strip()] = value.strip()
+    return parsed
+
+
+def percentile(values, p):
+    # nearest rank
+    if not values:
+        return float('nan')
+    values = sorted(values)
+    return values[max(0, min(len(values) - 1, int(round(p / 100.0 * len(values))) - 1))]
+
+
+def isolated(function, *args, **kwargs):
+    context = multiprocessing.get_context('spawn')
+    with concurrent.futures.ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+        return executor.submit(function, *args, **kwargs).result()
+
+
+def bench(plugin, directory, server, args):
+    names = generators.generate(plugin, directory, args.files, args.scale)
+    jackal_options = options(args.option)
+    plugin_options = options(args.plugin_option)
+    batch = int(plugin_options.get('batch', jackal_options.get('batch', 10000)))
+    processes = int(plugin_options.get('processes', jackal_options.get('processes', 0)))
+    parsed = isolated(pipeline.parse, plugin, directory, names, batch, processes > 0)
+    server.reset()
+    run = isolated(pipeline.pipeline, plugin, directory, names, server.url, jackal_options, plugin_options, args.loglevel, args.timeout)
+    stats = dict(server.stats)
+    latencies = [latency * 1000 for latency in run['latencies']]
+    return {
+        'plugin': plugin,
+        'files': len(names),
+        'bytes': sum(os.path.getsize(os.path.join(directory, name)) for name in names),
+        'records': parsed['records'],
+        'parse_rps': parsed['records'] / parsed['seconds'] if parsed['seconds'] else float('nan'),
+        'pipeline_rps': stats['records'] / run['seconds'] if run['seconds'] else float('nan'),
+        'pipeline_seconds': run['seconds'],
+        'submits': len(latencies),
+        'p50_ms': percentile(latencies, 50),
+        'p90_ms': percentile(latencies, 90),
+        'p99_ms': percentile(latencies, 99),
+        'parse_rss_mb': parsed['rss'] / 1048576.0,
+        'pipeline_rss_mb': run['rss'] / 1048576.0,
+        'children_rss_mb': run['children'] / 1048576.0,
+        'ok': run['ok'],
+        'ko': run['ko'],
+        'requests': stats['requests'],
+        'errors': stats['errors'],
+        'sent_records': stats['records'],
+    }
+
+
+def report(results):
+    header = '%-10s %5s %9s %10s %10s %7s %8s %8s %8s %8s %8s %5s %5s' % ('plugin', 'files', 'records', 'parse r/s', 'e2e r/s', 'submits', 'p50 ms', 'p90 ms', 'p99 ms', 'parse MB', 'e2e MB', 'ok', 'ko')
+    print(header)
+    print('-' * len(header))
+    for r in results:
+        print('%-10s %5d %9d %10.0f %10.0f %7d %8.1f %8.1f %8.1f %8.1f %8.1f %5d %5d' % (r['plugin'], r['files'], r['records'], r['parse_rps'], r['pipeline_rps'], r['submits'], r['p50_ms'], r['p90_ms'], r['p99_ms'], r['parse_rss_mb'], r['pipeline_rss_mb'], r['ok'], r['ko']))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description='Jackal end-to-end benchmarks')
+    parser.add_argument('--plugins', nargs='+', default=PLUGINS, choices=PLUGINS)
+    parser.add_argument('--files', type=int, default=4, help='files per plugin')
+    parser.add_argument('--scale', type=float, default=1.0, help='size multiplier of each file')
+    parser.add_argument('--latency', type=float, default=0.0, help='stub latency per request, in seconds')
+    parser.add_argument('--errors', type=float, default=0.0, help='fraction of requests failed by the stub with 502')
+    parser.add_argument('-o', '--option', action='append', default=[], help='key=value of the jackal configuration section')
+    parser.add_argument('-p', '--plugin-option', action='append', default=[], help='key=value of the plugin configuration section')
+    parser.add_argument('--loglevel', default='WARNING')
+    parser.add_argument('--timeout', type=float, default=600, help='maximum seconds of each pipeline run')
+    parser.add_argument('--tz', default='Europe/Rome', help='local time zone of the gateways')
+    parser.add_argument('--json', action='store_true', help='print the results as JSON')
+    parser.add_argument('--keep', action='store_true', help='keep the generated files')
+    args = parser.parse_args(argv)
+
+    # inherited by the benchmark processes
+    os.environ['TZ'] = args.tz
+    server = stub.start(latency=args.latency, errors=args.errors)
+    directory = tempfile.mkdtemp(prefix='jackal-bench-')
+    results = []
+    try:
+        for plugin in args.plugins:
+            workdir = os.path.join(directory, plugin)
+            os.makedirs(workdir)
+            results.append(bench(plugin, workdir, server, args))
+            if not args.json:
+                print('%s done in %.2f s' % (plugin, results[-1]['pipeline_seconds']), file=sys.stderr)
+    finally:
+        server.shutdown()
+        if args.keep:
+            print('Generated files kept in %s' % directory, file=sys.stderr)
+        else:
+            shutil.rmtree(directory, ignore_errors=True)
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        report(results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+""" Synthetic gateway files
+
+Each generator writes a file in the format parsed by a plugin, with random
+values from a seeded generator: the same arguments always give the same file.
+The months of March and October include the DST transition days.
+"""
+
+import calendar
+import datetime
+import os
+import random
+
+SOLARLOG1 = ['Pac', 'DaySum', 'Status', 'Error', 'Pdc1', 'Pdc2', 'Udc1', 'Udc2', 'Temp', 'Uac']
+SOLARLOG2 = SOLARLOG1[:-1]
+
+
+def last_sunday(year, month):
+    days = calendar.monthrange(year, month)[1]
+    return max(day for day in range(days - 6, days + 1) if datetime.date(year, month, day).weekday() == 6)
+
+
+def decimal(value):
+    # decimal comma, as written by the Italian DSOs
+    return ('%.3f' % value).replace('.', ',')
+
+
+def pod(filename, pods=10, year=2020, month=3, seed=0):
+    """ E-distribuzione POD XML, Curva and Misura elements """
+    rnd = random.Random(seed)
+    days = calendar.monthrange(year, month)[1]
+    sunday = last_sunday(year, month)
+    with open(filename, 'w') as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n<FlussoMisure>\n')
+        f.write('<IdentificativiFlusso><CodFlusso>BENCH</CodFlusso></IdentificativiFlusso>\n')
+        for p in range(pods):
+            f.write('<DatiPod>\n<Pod>IT001E%08d</Pod>\n<MeseAnno>%02d/%d</MeseAnno>\n<Motivazione>1</Motivazione>\n' % (p, month, year))
+            f.write('<DatiPdp><PotDisp>%s</PotDisp><Tensione>220</Tensione></DatiPdp>\n' % decimal(rnd.random() * 100))
+            f.write('<Consumo><EaM>%s</EaM><DataInizioPeriodo>%02d/%d</DataInizioPeriodo></Consumo>\n' % (decimal(rnd.random() * 1000), month, year))
+            tag = 'Curva' if p % 2 else 'Misura'
+            f.write('<%s><TipoDato>E</TipoDato><Validato>S</Validato>\n' % tag)
+            if tag == 'Misura':
+                for name in ('PotMax', 'EaF1', 'EaF2', 'EaF3', 'ErF1', 'ErF2', 'ErF3', 'PotF1', 'PotF2', 'PotF3'):
+                    f.write('<%s>%s</%s>\n' % (name, decimal(rnd.random() * 50), name))
+            for day in range(1, days + 1):
+                parts = [('0', range(1, 97))]
+                if month == 3 and day == sunday:
+                    # 02:00 ~ 03:00 does not exist
+                    parts = [('1', list(range(1, 9)) + list(range(13, 97)))]
+                if month == 10 and day == sunday:
+                    # 02:00 ~ 03:00 twice
+                    parts = [('2', range(1, 13)), ('3', range(9, 97))]
+                for (dst, quarters) in parts:
+                    attribute = '' if dst == '0' else ' Dst="%s"' % dst
+                    for name in ('Ea', 'Er'):
+                        values = ' '.join('E%d="%s"' % (quarter, decimal(rnd.random())) for quarter in quarters)
+                        f.write('<%s%s %s>%d</%s>\n' % (name, attribute, values, day, name))
+            f.write('</%s>\n</DatiPod>\n' % tag)
+        f.write('</FlussoMisure>\n')
+
+
+def deval(filename, pods=10, year=2020, month=3, seed=0):
+    """ Deval CSV, a row of 96 quarter-hours per POD and day """
+    rnd = random.Random(seed)
+    days = calendar.monthrange(year, month)[1]
+    sunday = last_sunday(year, month)
+    with open(filename, 'w') as f:
+        for p in range(pods):
+            for day in range(1, days + 1):
+                count = 96
+                if month == 3 and day == sunday:
+                    count = 92
+                values = ['%.3f' % rnd.random() for quarter in range(count)]
+                date = datetime.date(year, month, day)
+                f.write(';'.join(['IT001E%08d' % p, str(day), 'Ea', date.strftime('%d.%m.%y'), '00:15'] + values) + '\n')
+
+
+def schneider(filename, rows=5000, bulks=8, year=2020, month=3, seed=0):
+    """ Schneider EGX300 CSV export, a row every 5 minutes """
+    rnd = random.Random(seed)
+    start = datetime.datetime(year, month, last_sunday(year, month)) - datetime.timedelta(minutes=5 * rows // 2)
+    transition = datetime.datetime(year, month, last_sunday(year, month), 2)
+    with open(filename, 'w', newline='') as f:
+        f.write('Gateway Name;Gateway NS;Gateway IP;Gateway MAC;Device Name;Device ID;Device Type;Device Type Name;Time;Cron\r\n')
+        f.write('EGX300;BENCH;10.0.0.1;00:80:F4:00:00:01;PM5100;12;PM;PM5100;%s;Daily\r\n' % start.strftime('%Y-%m-%d %H:%M:%S'))
+        f.write('\r\nTopic ID\r\n')
+        f.write('Error;UTC Offset (minutes);Local Time Stamp;%s\r\n' % ';'.join('Bulk%d' % bulk for bulk in range(bulks)))
+        f.write('\r\n\r\n')
+        for row in range(rows):
+            dt = start + datetime.timedelta(minutes=5 * row)
+            offset = 60 if (dt < transition) == (month == 3) else 120
+            values = [decimal(rnd.random() * 10000) for bulk in range(bulks)]
+            f.write(';'.join(['0', str(offset), dt.strftime('%Y-%m-%d %H:%M:%S')] + values) + '\r\n')
+
+
+def solarlog(filename, names=SOLARLOG1, inverters=5, rows=2000, year=2020, month=10, seed=0):
+    """ Solar-Log 1000 (names=SOLARLOG1) or 2000 (names=SOLARLOG2) CSV export """
+    rnd = random.Random(seed)
+    start = datetime.datetime(year, month, last_sunday(year, month)) - datetime.timedelta(minutes=5 * rows // 2)
+    with open(filename, 'w') as f:
+        header = ['Datum', 'Uhrzeit']
+        for inverter in range(inverters):
+            header += ['WR'] + names
+        f.write(';'.join(header) + '\n')
+        for row in range(rows):
+            dt = start + datetime.timedelta(minutes=5 * row)
+            cells = [dt.strftime('%d/%m/%y'), dt.strftime('%H:%M:%S')]
+            for inverter in range(inverters):
+                cells += [str(inverter)] + [str(rnd.randint(0, 5000)) for name in names]
+            f.write(';'.join(cells) + '\n')
+
+
+def generate(plugin, directory, files=1, scale=1.0):
+    """ Writes files for plugin in directory, scale multiplies their size
+
+    Returns the names of the files written.
+    """
+    names = []
+    for n in range(files):
+        # alternate the DST transitions of March and October
+        month = (3, 10)[n % 2]
+        if plugin == 'pod':
+            name = 'bench%04d.xml' % n
+            pod(os.path.join(directory, name), max(1, int(10 * scale)), month=month, seed=n)
+        elif plugin == 'deval':
+            name = 'bench%04d.csv' % n
+            deval(os.path.join(directory, name), max(1, int(10 * scale)), month=month, seed=n)
+        elif plugin == 'schneider':
+            name = 'bench%04d.csv' % n
+            schneider(os.path.join(directory, name), max(1, int(5000 * scale)), month=month, seed=n)
+        elif plugin == 'solarlog1':
+            name = 'bench%04d.csv' % n
+            solarlog(os.path.join(directory, name), SOLARLOG1, rows=max(1, int(2000 * scale)), month=month, seed=n)
+        elif plugin == 'solarlog2':
+            name = 'bench%04d.csv' % n
+            solarlog(os.path.join(directory, name), SOLARLOG2, rows=max(1, int(2000 * scale)), month=month, seed=n)
+        else:
+            raise ValueError('No generator for plugin %s' % plugin)
+        names.append(name)
+    return names
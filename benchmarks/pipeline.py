@@ -0,0 +1,94 @@
+""" Measures run in a fresh process each
+
+parse() times the plugin alone over the files, pipeline() processes them
+with the real JApp/JThread pipeline against the REST API at baseurl, until
+every file has been moved into okdir or kodir.
+"""
+
+import importlib
+import os
+import resource
+import shutil
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def peak():
+    # peak RSS in bytes of this process and of its parsing processes
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * 1024
+    return rss, children
+
+
+def parse(plugin, directory, names, batch=10000, whole=False):
+    module = importlib.import_module('jackal.plugins.%s' % plugin)
+    loaded_class = getattr(module, plugin)
+    loaded_class.clientid = '1'
+    loaded_class.name = plugin
+    loaded_class.filtr = None
+    loaded_class.batchsize = batch
+    parser = loaded_class()
+    records = 0
+    start = time.perf_counter()
+    for name in names:
+        with open(os.path.join(directory, name), 'r') as f:
+            if hasattr(parser, 'iterparse') and not whole:
+                for (data, method) in parser.iterparse(f):
+                    records += len(data)
+            else:
+                (data, method) = parser.parse(f.read())
+                records += len(data)
+    seconds = time.perf_counter() - start
+    (rss, children) = peak()
+    return {'records': records, 'seconds': seconds, 'rss': rss}
+
+
+def pipeline(plugin, directory, names, baseurl, options={}, plugin_options={}, loglevel='WARNING', timeout=600):
+    basedir = os.path.join(directory, plugin)
+    os.makedirs(os.path.join(basedir, 'ok'))
+    os.makedirs(os.path.join(basedir, 'ko'))
+    for name in names:
+        shutil.copy(os.path.join(directory, name), basedir)
+    ini = os.path.join(directory, 'jackal-%s.ini' % plugin)
+    with open(ini, 'w') as f:
+        f.write('[jackal]\nloglevel = %s\nbaseurl = %s\n' % (loglevel, baseurl))
+        f.writelines('%s = %s\n' % option for option in options.items())
+        f.write('[%s]\nclientid = 1\nbasedir = %s\nokdir = ok\nkodir = ko\n' % (plugin, basedir))
+        f.writelines('%s = %s\n' % option for option in plugin_options.items())
+
+    # plugins are loaded from the jackal directory of the current one
+    os.chdir(ROOT)
+    import jackal
+    jackal.setup(ini)
+
+    latencies = []
+    submit = jackal.rest.submit
+
+    def timed(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return submit(*args, **kwargs)
+        finally:
+            latencies.append(time.perf_counter() - start)
+
+    jackal.rest.submit = timed
+    app = jackal.JApp()
+    start = time.perf_counter()
+    app.start()
+    app.periodic()
+    while any(os.path.isfile(os.path.join(basedir, name)) for name in names):
+        if time.perf_counter() - start > timeout:
+            break
+        time.sleep(0.01)
+    seconds = time.perf_counter() - start
+    app.stop()
+    (rss, children) = peak()
+    return {
+        'seconds': seconds,
+        'latencies': latencies,
+        'ok': len(os.listdir(os.path.join(basedir, 'ok'))),
+        'ko': len([name for name in os.listdir(os.path.join(basedir, 'ko')) if name in names]),
+        'rss': rss,
+        'children': children,
+    }
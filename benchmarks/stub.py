@@ -0,0 +1,109 @@
+""" Local stub of the IEnergyDa REST API
+
+Answers GET /token with a CSRF token and the POST/PUT/PATCH/DELETE requests
+to /organization/measuresmatrix with 201, after an optional latency and
+failing a fraction of them with 502. Run it alone with
+
+    python -m benchmarks.stub [port] [latency] [errors]
+"""
+
+import gzip
+import http.server
+import json
+import random
+import sys
+import threading
+import time
+
+
+class StubHandler(http.server.BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def __reply(self, status, body=b'', headers={}):
+        self.send_response(status)
+        for (name, value) in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        server = self.server
+        if not self.path.endswith('/token'):
+            return self.__reply(404)
+        with server.lock:
+            server.stats['tokens'] += 1
+        self.__reply(200, headers={'x-csrf-token': server.token})
+
+    def do_POST(self):
+        server = self.server
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if not self.path.endswith('/organization/measuresmatrix'):
+            return self.__reply(404)
+        if self.headers.get('X-CSRF-TOKEN') != server.token:
+            return self.__reply(403)
+        if self.headers.get('Content-Encoding') == 'gzip':
+            body = gzip.decompress(body)
+        if server.latency:
+            time.sleep(server.latency)
+        if server.errors and server.random.random() < server.errors:
+            with server.lock:
+                server.stats['errors'] += 1
+            return self.__reply(502)
+        try:
+            records = json.loads(body)
+        except ValueError:
+            return self.__reply(400, b'invalid JSON')
+        with server.lock:
+            server.stats['requests'] += 1
+            server.stats['records'] += len(records)
+            server.stats['measures'] += sum(len(record['measures']) for record in records)
+            server.stats['bytes'] += len(body)
+        self.__reply(201, b'Created')
+
+    do_PUT = do_POST
+    do_PATCH = do_POST
+    do_DELETE = do_POST
+
+
+class StubServer(http.server.ThreadingHTTPServer):
+
+    daemon_threads = True
+
+    def __init__(self, port=0, latency=0.0, errors=0.0, seed=0):
+        super(StubServer, self).__init__(('127.0.0.1', port), StubHandler)
+        self.latency = latency
+        self.errors = errors
+        self.random = random.Random(seed)
+        self.token = 'bench'
+        self.lock = threading.Lock()
+        self.reset()
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:%d' % self.server_address[1]
+
+    def reset(self):
+        with self.lock:
+            self.stats = {'tokens': 0, 'requests': 0, 'errors': 0, 'records': 0, 'measures': 0, 'bytes': 0}
+
+
+def start(port=0, latency=0.0, errors=0.0):
+    """ Starts a stub server in a daemon thread """
+    server = StubServer(port, latency, errors)
+    threading.Thread(target=server.serve_forever, name='stub', daemon=True).start()
+    return server
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    server = StubServer(int(args[0]) if args else 8080, float(args[1]) if len(args) > 1 else 0.0, float(args[2]) if len(args) > 2 else 0.0)
+    print('Stub IEnergyDa listening on %s' % server.url)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(json.dumps(server.stats))
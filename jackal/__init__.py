@@ -31,29 +31,45 @@ __title__       = 'IEnergyDa Jackal'
 __uri__         = 'https://github.com/myna-project/Jackal'
 __version__     = 'v1.5.1'
 
+import argparse
+import codecs
+import collections
+import concurrent.futures
 import configparser
+import cProfile
 import datetime
 import fnmatch
+import functools
 import glob
+import gzip
+import hashlib
 import io
+import itertools
 import json
 import logging
+import lzma
+import mmap
+import multiprocessing
 import os
 import pkgutil
-import pyinotify
 import queue
 import requests
 from requests.packages.urllib3.util.retry import Retry
 from requests.exceptions import ConnectionError, ConnectTimeout, HTTPError, Timeout, ReadTimeout
-import schedule
 import signal
+import sys
 import shutil
+import sqlite3
+import struct
 import threading
 import time
 import urllib3
 import zipfile
 import zlib
 
+from jackal import batch
+from jackal.batch import MeasureBatch
+
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
 class JLogger(logging.Logger):
@@ -89,7 +105,42 @@ class JConfig(configparser.ConfigParser):
         self.retries = 3
         self.backoff = 0.3
         self.interval = 3600
+        self.debounce = 0.5
         self.timeout = 60
+        self.chunkrecords = 0
+        self.chunkbytes = 0
+        self.chunkworkers = 1
+        self.gzip = 0
+        self.engine = 'requests'
+        self.connections = 10
+        self.poolsize = 10
+        self.keepalive = True
+        self.tokenttl = 0
+        self.adaptive = False
+        self.maxinflight = 0
+        self.maxrate = 0
+        self.latency = 15
+        self.batch = 10000
+        self.encoding = 'utf-8'
+        self.mmapsize = 67108864
+        self.processes = 0
+        self.outbox = None
+        self.outboxsize = 104857600
+        self.ledger = None
+        self.ledgerdays = 0
+        self.archive = None
+        self.archivekodir = False
+        self.archivedays = 0
+        self.archiveinterval = 3600
+        self.node = None
+        self.nodes = None
+        self.lease = 600
+        self.metrics = None
+        self.statsfile = None
+        self.statsinterval = 60
+        self.profile = 0
+        self.profileslow = 0
+        self.profiledir = 'profiles'
         super(JConfig, self).__init__()
 
     def read(self, filename):
@@ -108,11 +159,468 @@ class JConfig(configparser.ConfigParser):
         self.retries = self.getint(__name__, 'retries', fallback = self.retries)
         self.backoff = self.getfloat(__name__, 'backoff', fallback = self.backoff)
         self.interval = self.getint(__name__, 'interval', fallback = self.interval)
+        self.debounce = self.getfloat(__name__, 'debounce', fallback = self.debounce)
         self.timeout = self.getint(__name__, 'timeout', fallback = self.timeout)
+        self.chunkrecords = self.getint(__name__, 'chunkrecords', fallback = self.chunkrecords)
+        self.chunkbytes = self.getint(__name__, 'chunkbytes', fallback = self.chunkbytes)
+        self.chunkworkers = max(1, self.getint(__name__, 'chunkworkers', fallback = self.chunkworkers))
+        self.gzip = self.getint(__name__, 'gzip', fallback = self.gzip)
+        self.engine = self.get(__name__, 'engine', fallback = self.engine)
+        self.connections = max(1, self.getint(__name__, 'connections', fallback = self.connections))
+        self.poolsize = max(1, self.getint(__name__, 'poolsize', fallback = self.poolsize))
+        self.keepalive = self.getboolean(__name__, 'keepalive', fallback = self.keepalive)
+        self.tokenttl = self.getint(__name__, 'tokenttl', fallback = self.tokenttl)
+        self.adaptive = self.getboolean(__name__, 'adaptive', fallback = self.adaptive)
+        self.maxinflight = self.getint(__name__, 'maxinflight', fallback = self.maxinflight)
+        self.maxrate = self.getfloat(__name__, 'maxrate', fallback = self.maxrate)
+        self.latency = self.getfloat(__name__, 'latency', fallback = self.latency)
+        self.batch = self.getint(__name__, 'batch', fallback = self.batch)
+        self.encoding = self.get(__name__, 'encoding', fallback = self.encoding)
+        self.mmapsize = self.getint(__name__, 'mmapsize', fallback = self.mmapsize)
+        self.processes = self.getint(__name__, 'processes', fallback = self.processes)
+        self.outbox = self.get(__name__, 'outbox', fallback = self.outbox)
+        self.outboxsize = self.getint(__name__, 'outboxsize', fallback = self.outboxsize)
+        self.ledger = self.get(__name__, 'ledger', fallback = self.ledger)
+        self.ledgerdays = self.getint(__name__, 'ledgerdays', fallback = self.ledgerdays)
+        self.archive = self.get(__name__, 'archive', fallback = self.archive)
+        self.archivekodir = self.getboolean(__name__, 'archivekodir', fallback = self.archivekodir)
+        self.archivedays = self.getint(__name__, 'archivedays', fallback = self.archivedays)
+        self.archiveinterval = self.getint(__name__, 'archiveinterval', fallback = self.archiveinterval)
+        self.node = self.get(__name__, 'node', fallback = self.node)
+        self.nodes = self.get(__name__, 'nodes', fallback = self.nodes)
+        self.lease = max(3, self.getint(__name__, 'lease', fallback = self.lease))
+        self.metrics = self.get(__name__, 'metrics', fallback = self.metrics)
+        self.statsfile = self.get(__name__, 'statsfile', fallback = self.statsfile)
+        self.statsinterval = self.getint(__name__, 'statsinterval', fallback = self.statsinterval)
+        self.profile = self.getint(__name__, 'profile', fallback = self.profile)
+        self.profileslow = self.getfloat(__name__, 'profileslow', fallback = self.profileslow)
+        self.profiledir = self.get(__name__, 'profiledir', fallback = self.profiledir)
         self.token = '%s/token' % self.baseurl
         self.drain = '%s/organization/measuresmatrix' % self.baseurl
         logger.info('%s processing interval %s seconds' % (__title__, self.interval))
         logger.info('%s base REST API URL %s' % (__title__, self.baseurl))
+        if self.chunkrecords or self.chunkbytes:
+            logger.info('%s submitting chunks of max %s records %s bytes, %d in flight' % (__title__, self.chunkrecords or 'unlimited', self.chunkbytes or 'unlimited', self.chunkworkers))
+        if self.engine == 'asyncio':
+            logger.info('%s submitting with asyncio over max %d connections' % (__title__, self.connections))
+        if self.adaptive:
+            logger.info('%s adapting requests in flight (max %s) and records/s (max %s) to the backend, latency target %s seconds' % (__title__, self.maxinflight or 'unlimited', '%g' % self.maxrate if self.maxrate else 'unlimited', '%g' % self.latency))
+        elif self.maxinflight or self.maxrate:
+            logger.info('%s submitting max %s requests in flight, %s records/s' % (__title__, self.maxinflight or 'unlimited', '%g' % self.maxrate if self.maxrate else 'unlimited'))
+        if not -1 <= self.gzip <= 9:
+            # zlib would reject every request body
+            logger.critical('%s gzip level must be between -1 and 9 (0 disables compression), not %d' % (__title__, self.gzip))
+            os._exit(1)
+        if self.gzip:
+            logger.info('%s compressing request bodies with gzip level %d' % (__title__, self.gzip))
+        if self.ledger:
+            logger.info('%s skipping accepted files and measures recorded in %s' % (__title__, self.ledger))
+        if self.archive and self.archive not in ('day', 'month'):
+            logger.error('%s archive must be day or month, not %s: archiving disabled' % (__title__, self.archive))
+            self.archive = None
+        if self.archive:
+            logger.info('%s archiving processed files by %s%s' % (__title__, self.archive, ', for %d days' % self.archivedays if self.archivedays else ''))
+        if self.node:
+            logger.info('%s claiming files as node %s, lease %d seconds%s' % (__title__, self.node, self.lease, ', sharded among %s' % self.nodes if self.nodes else ''))
+
+
+class JMetrics():
+    """ Runtime counters, histograms and gauges in Prometheus text format
+
+    Served over HTTP at /metrics if metrics is set ([address:]port), and/or
+    written every statsinterval seconds into statsfile (eg. for the
+    node_exporter textfile collector).
+    """
+
+    buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+    help = {
+        'jackal_files_total': ('counter', 'Files processed'),
+        'jackal_files_ok_total': ('counter', 'Files moved into okdir after being accepted'),
+        'jackal_files_queued_total': ('counter', 'Files moved into okdir with data queued into the outbox'),
+        'jackal_files_ko_total': ('counter', 'Files moved into kodir'),
+        'jackal_archived_files_total': ('counter', 'Files moved into the archives of okdir and kodir'),
+        'jackal_bytes_read_total': ('counter', 'Bytes of the files processed'),
+        'jackal_records_total': ('counter', 'Records parsed'),
+        'jackal_parse_seconds': ('histogram', 'Parsing time of a file'),
+        'jackal_submit_seconds': ('histogram', 'Submission time of parsed data'),
+        'jackal_http_responses_total': ('counter', 'HTTP responses of the REST API'),
+        'jackal_http_errors_total': ('counter', 'HTTP requests failed without response'),
+        'jackal_http_retries_total': ('counter', 'HTTP requests retried'),
+        'jackal_token_requests_total': ('counter', 'CSRF token requests'),
+        'jackal_queue_depth': ('gauge', 'Files waiting to be processed'),
+        'jackal_oldest_file_age_seconds': ('gauge', 'Age of the oldest file in basedir'),
+        'jackal_outbox_bytes': ('gauge', 'Size of the outbox'),
+        'jackal_requests_in_flight': ('gauge', 'REST API requests in flight'),
+        'jackal_requests_window': ('gauge', 'Maximum REST API requests in flight, 0 unlimited'),
+        'jackal_records_rate_limit': ('gauge', 'Maximum records sent per second, 0 unlimited'),
+        'jackal_records_delivered_rate': ('gauge', 'Records accepted per second, moving average'),
+    }
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__counters = {}
+        self.__histograms = {}
+        self.__gauges = {}
+
+    def __key(self, name, labels):
+        return (name, tuple(sorted(labels.items())))
+
+    def inc(self, name, value=1, **labels):
+        key = self.__key(name, labels)
+        with self.__lock:
+            self.__counters[key] = self.__counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = self.__key(name, labels)
+        with self.__lock:
+            histogram = self.__histograms.get(key)
+            if not histogram:
+                # buckets counts, sum and count
+                histogram = self.__histograms[key] = [0] * (len(self.buckets) + 2)
+            for (idx, bucket) in enumerate(self.buckets):
+                if value <= bucket:
+                    histogram[idx] += 1
+            histogram[-2] += value
+            histogram[-1] += 1
+
+    def gauge(self, name, function, **labels):
+        """ Registers a function returning the value of the gauge """
+        with self.__lock:
+            self.__gauges[self.__key(name, labels)] = function
+
+    def __labels(self, labels, extra=()):
+        labels = tuple(labels) + tuple(extra)
+        if not labels:
+            return ''
+        return '{%s}' % ','.join('%s="%s"' % (name, str(value).replace('\\', '\\\\').replace('"', '\\"')) for (name, value) in labels)
+
+    def render(self):
+        with self.__lock:
+            counters = dict(self.__counters)
+            histograms = {key: list(value) for (key, value) in self.__histograms.items()}
+            gauges = dict(self.__gauges)
+        samples = {}
+        for ((name, labels), value) in counters.items():
+            samples.setdefault(name, []).append('%s%s %s' % (name, self.__labels(labels), value))
+        for ((name, labels), histogram) in histograms.items():
+            lines = samples.setdefault(name, [])
+            for (idx, bucket) in enumerate(self.buckets):
+                lines.append('%s_bucket%s %d' % (name, self.__labels(labels, [('le', bucket)]), histogram[idx]))
+            lines.append('%s_bucket%s %d' % (name, self.__labels(labels, [('le', '+Inf')]), histogram[-1]))
+            lines.append('%s_sum%s %s' % (name, self.__labels(labels), histogram[-2]))
+            lines.append('%s_count%s %d' % (name, self.__labels(labels), histogram[-1]))
+        for ((name, labels), function) in gauges.items():
+            try:
+                value = function()
+            except Exception as e:
+                logger.debug('Cannot compute metric %s: %s' % (name, str(e)))
+                continue
+            samples.setdefault(name, []).append('%s%s %s' % (name, self.__labels(labels), value))
+        lines = []
+        for name in sorted(samples):
+            (kind, text) = self.help.get(name, ('untyped', name))
+            lines.append('# HELP %s %s' % (name, text))
+            lines.append('# TYPE %s %s' % (name, kind))
+            lines.extend(sorted(samples[name]))
+        return '\n'.join(lines) + '\n'
+
+    def dump(self, filename):
+        # atomically, the file is read by other processes
+        try:
+            with open('%s.tmp' % filename, 'w') as f:
+                f.write(self.render())
+            os.replace('%s.tmp' % filename, filename)
+        except OSError as e:
+            logger.error('Cannot write stats file "%s": %s' % (filename, str(e)))
+
+    def serve(self, listen):
+        import http.server
+        (address, sep, port) = listen.rpartition(':')
+        metrics = self
+
+        class handler(http.server.BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                if self.path.split('?')[0] not in ('/', '/metrics'):
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                logger.debug('Metrics %s' % (format % args))
+
+        try:
+            server = http.server.ThreadingHTTPServer((address or '127.0.0.1', int(port)), handler)
+        except (OSError, ValueError) as e:
+            logger.error('Cannot serve metrics on %s: %s' % (listen, str(e)))
+            return
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name='metrics', daemon=True).start()
+        logger.info('%s serving metrics on http://%s:%d/metrics' % (__title__, server.server_address[0], server.server_address[1]))
+
+
+class JProgress():
+    """ Chunks of an input file already accepted by the server
+
+    The progress is saved beside the file moved into kodir, so that the
+    accepted chunks are skipped if the file is moved back into basedir with
+    the same content (by SHA-256) and neither the parsing (streamed batches
+    of batchsize records or whole file) nor the chunking layout changed in the
+    meantime: the chunks are numbered in order of both.
+    """
+
+    def __init__(self, filename=None, infile=None, parsing=None):
+        self.filename = filename
+        self.infile = infile
+        self.parsing = parsing or []
+        self.layout = None
+        self.accepted = set()
+        self.chunks = 0
+        # chunks not accepted, and whether sending them again could succeed
+        self.unsent = []
+        self.retryable = True
+        self.__lock = threading.Lock()
+        if not filename or not os.path.isfile(filename):
+            return
+        try:
+            with open(filename, 'r') as f:
+                saved = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning('Cannot read chunks progress "%s": %s' % (filename, str(e)))
+            return
+        if saved.get('size') == os.path.getsize(infile) and saved.get('digest') == JLedger.digest(infile):
+            self.layout = saved.get('layout')
+            self.accepted = set(saved.get('accepted', []))
+
+    def next(self):
+        seq = self.chunks
+        self.chunks += 1
+        return seq
+
+    def accept(self, seq):
+        with self.__lock:
+            self.accepted.add(seq)
+
+    def save(self):
+        if not self.filename:
+            return
+        try:
+            saved = {'size': os.path.getsize(self.infile), 'digest': JLedger.digest(self.infile), 'layout': self.layout, 'chunks': self.chunks, 'accepted': sorted(self.accepted)}
+            with open(self.filename, 'w') as f:
+                json.dump(saved, f)
+        except OSError as e:
+            logger.error('Cannot save chunks progress "%s": %s' % (self.filename, str(e)))
+
+    def clear(self):
+        if self.filename and os.path.isfile(self.filename):
+            os.unlink(self.filename)
+
+
+class JLedger():
+    """ Files and measures already accepted by the server
+
+    Files are recorded by the SHA-256 of their content, measures by client id,
+    device id, measure id and timestamp. Before a POST, the timestamps range of
+    each device and measure is looked up and the measures already accepted are
+    dropped: the server would answer 409 for them anyway.
+    """
+
+    def __init__(self, filename, days=0):
+        self.filename = filename
+        self.__lock = threading.Lock()
+        self.__db = sqlite3.connect(filename, check_same_thread=False)
+        with self.__db:
+            self.__db.execute('PRAGMA journal_mode=WAL')
+            self.__db.execute('CREATE TABLE IF NOT EXISTS files (digest TEXT PRIMARY KEY, name TEXT, accepted TEXT)')
+            self.__db.execute('CREATE TABLE IF NOT EXISTS measures (client_id TEXT, device_id TEXT, measure_id TEXT, at TEXT, PRIMARY KEY (client_id, device_id, measure_id, at)) WITHOUT ROWID')
+        if days > 0:
+            since = (datetime.datetime.now() - datetime.timedelta(days=days)).isoformat()
+            with self.__db:
+                self.__db.execute('DELETE FROM files WHERE accepted < ?', (since,))
+                self.__db.execute('DELETE FROM measures WHERE at < ?', (since,))
+
+    @staticmethod
+    def digest(infile):
+        sha = hashlib.sha256()
+        with open(infile, 'rb') as f:
+            for block in iter(lambda: f.read(1048576), b''):
+                sha.update(block)
+        return sha.hexdigest()
+
+    def known(self, digest):
+        with self.__lock:
+            return self.__db.execute('SELECT 1 FROM files WHERE digest = ?', (digest,)).fetchone() is not None
+
+    def done(self, digest, infile):
+        with self.__lock, self.__db:
+            self.__db.execute('INSERT OR REPLACE INTO files VALUES (?, ?, ?)', (digest, os.path.basename(infile), datetime.datetime.now().isoformat()))
+
+    def filter(self, data, method):
+        """ data without the measures already accepted """
+        if method != 'POST':
+            return data
+        entries = list(batch.entries(data))
+        ranges = {}
+        for (clientid, at, device, measures) in entries:
+            for (measure, value) in measures:
+                key = (str(clientid), str(device), str(measure))
+                (first, last) = ranges.get(key, (at, at))
+                ranges[key] = (min(first, at), max(last, at))
+        accepted = set()
+        with self.__lock:
+            for (key, (first, last)) in ranges.items():
+                for (at,) in self.__db.execute('SELECT at FROM measures WHERE client_id = ? AND device_id = ? AND measure_id = ? AND at BETWEEN ? AND ?', key + (first, last)):
+                    accepted.add(key + (at,))
+        if not accepted:
+            return data
+        if isinstance(data, MeasureBatch):
+            filtered = MeasureBatch(data.clientid)
+        else:
+            filtered = []
+        skipped = 0
+        for (record, (clientid, at, device, measures)) in enumerate(entries):
+            left = [(measure, value) for (measure, value) in measures if (str(clientid), str(device), str(measure), at) not in accepted]
+            skipped += len(measures) - len(left)
+            if not left:
+                continue
+            if isinstance(data, MeasureBatch):
+                filtered.append(at, device, left)
+            else:
+                filtered.append(dict(data[record], measures=[{'measure_id': measure, 'value': value} for (measure, value) in left]))
+        logger.info('Skipping %d measures already accepted' % skipped)
+        return filtered
+
+    def accept(self, data, method):
+        rows = [(str(clientid), str(device), str(measure), at) for (clientid, at, device, measures) in batch.entries(data) for (measure, value) in measures]
+        with self.__lock, self.__db:
+            if method == 'DELETE':
+                self.__db.executemany('DELETE FROM measures WHERE client_id = ? AND device_id = ? AND measure_id = ? AND at = ?', rows)
+            else:
+                self.__db.executemany('INSERT OR IGNORE INTO measures VALUES (?, ?, ?, ?)', rows)
+
+
+class JRate():
+    """ Paces the records sent to the REST API at most rate per second
+
+    Each chunk reserves the time its records take at the given rate: a chunk
+    larger than a second worth of records is sent at once, and the next one
+    waits accordingly.
+    """
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.__next = time.monotonic()
+        self.__lock = threading.Lock()
+
+    def delay(self, records):
+        # seconds to wait before sending the records
+        if not self.rate:
+            return 0
+        with self.__lock:
+            now = time.monotonic()
+            start = max(now, self.__next)
+            self.__next = start + records / self.rate
+        return start - now
+
+
+class JThrottle():
+    """ Requests in flight and records per second towards the REST API
+
+    Shared by every thread. maxinflight bounds the requests in flight and
+    maxrate the records sent per second (0 unlimited). If adaptive, both
+    follow the backend with AIMD: the window of requests in flight doubles
+    at each round trip until the first congestion, then every request
+    answered within latency seconds adds one request per round trip to the
+    window and 5% of maxrate to the rate. A congestion (5xx, 408 or 429
+    status, no response, or a response slower than latency) halves both, at
+    most once per round trip.
+    """
+
+    def __init__(self, adaptive=False, maxinflight=0, maxrate=0, latency=0):
+        self.adaptive = adaptive
+        self.maxinflight = maxinflight
+        self.maxrate = maxrate
+        self.latency = latency
+        self.window = min(2, maxinflight or 2) if adaptive else maxinflight
+        self.inflight = 0
+        self.pace = JRate(maxrate)
+        self.delivered = 0.0
+        self.__threshold = None
+        self.__decreased = 0
+        self.__records = 0
+        self.__since = time.monotonic()
+        self.__cond = threading.Condition()
+        metrics.gauge('jackal_requests_in_flight', lambda: self.inflight)
+        metrics.gauge('jackal_requests_window', lambda: int(self.window))
+        metrics.gauge('jackal_records_rate_limit', lambda: self.pace.rate)
+        metrics.gauge('jackal_records_delivered_rate', lambda: self.delivered)
+
+    def limit(self, maxrate):
+        with self.__cond:
+            self.maxrate = maxrate
+            if not self.pace.rate or self.pace.rate > maxrate:
+                self.pace.rate = maxrate
+
+    def acquire(self, records):
+        """ Waits for a request slot and for the pace of the records, returns
+        the time the request starts
+        """
+        with self.__cond:
+            while self.window and self.inflight >= int(self.window):
+                self.__cond.wait()
+            self.inflight += 1
+        delay = self.pace.delay(records)
+        if delay > 0:
+            time.sleep(delay)
+        return time.monotonic()
+
+    def release(self, records, started, congested):
+        now = time.monotonic()
+        latency = now - started
+        with self.__cond:
+            self.inflight -= 1
+            # the window may grow by more than the request released
+            self.__cond.notify_all()
+            if not congested:
+                self.__delivery(records, now)
+            if not self.adaptive:
+                return
+            if congested or (self.latency and latency > self.latency):
+                # the requests in flight meanwhile saw the same congestion
+                if now - self.__decreased < latency:
+                    return
+                self.__decreased = now
+                self.window = max(1.0, self.window / 2.0)
+                self.__threshold = self.window
+                if self.maxrate:
+                    self.pace.rate = max(self.maxrate / 64.0, self.pace.rate / 2.0)
+                logger.info('Backend congested (%s in %.2f s), %.1f requests in flight, %s records/s' % ('failed' if congested else 'answered', latency, self.window, '%.0f' % self.pace.rate if self.pace.rate else 'unlimited'))
+                return
+            ceiling = self.maxinflight or float('inf')
+            if self.__threshold is None:
+                # slow start
+                self.window = min(ceiling, self.window + 1)
+            else:
+                self.window = min(ceiling, self.window + 1.0 / self.window)
+            if self.maxrate:
+                # back to maxrate in 10 round trips from half of it
+                self.pace.rate = min(self.maxrate, self.pace.rate + self.maxrate / 20.0 / self.window)
+
+    def __delivery(self, records, now):
+        # records accepted per second, moving average over 1 s samples
+        self.__records += records
+        elapsed = now - self.__since
+        if elapsed >= 1:
+            sample = self.__records / elapsed
+            self.delivered = sample if not self.delivered else 0.7 * self.delivered + 0.3 * sample
+            self.__records = 0
+            self.__since = now
 
 
 class JRest:
@@ -126,8 +634,30 @@ class JRest:
         self.backoff = config.backoff
         self.retries = config.retries
         self.timeout = config.timeout
+        self.chunkrecords = config.chunkrecords
+        self.chunkbytes = config.chunkbytes
+        self.chunkworkers = config.chunkworkers
+        self.gzip = config.gzip
+        self.throttle = None
+        if config.adaptive or config.maxinflight or config.maxrate:
+            self.throttle = JThrottle(config.adaptive, config.maxinflight, config.maxrate, config.latency)
+        self.ledger = None
+        if config.ledger:
+            self.ledger = JLedger(os.path.normpath(config.ledger), config.ledgerdays)
+        self.tokenttl = config.tokenttl
         self.__csrf = None
-        self.__recursion = False
+        self.__fetched = 0
+        self.__tokenlock = threading.Lock()
+        self.__pool = None
+        self.__engine = None
+        if config.engine == 'asyncio':
+            try:
+                from jackal.aio import JAsyncClient
+                self.__engine = JAsyncClient()
+            except ImportError:
+                logger.error('%s asyncio engine requires aiohttp, submitting with requests' % __title__)
+        if self.chunkworkers > 1:
+            self.__pool = concurrent.futures.ThreadPoolExecutor(max_workers=self.chunkworkers, thread_name_prefix='chunk')
         self.proxies = {}
         try:
             self.proxies = urllib.request.getproxies()
@@ -140,101 +670,1070 @@ class JRest:
             backoff_factor = self.backoff,
             status_forcelist = (500, 502, 504),
         )
+        # a kept alive connection for each concurrent request
+        poolsize = max(config.poolsize, self.chunkworkers, config.maxinflight)
         for protocol in ['http://', 'https://']:
-            self.__client.adapters[protocol].max_retries = retry
+            self.__client.mount(protocol, requests.adapters.HTTPAdapter(pool_maxsize=poolsize, max_retries=retry))
+        if not config.keepalive:
+            self.__client.headers['Connection'] = 'close'
+
+    def close(self):
+        # the connections, and the event loop of the asyncio engine
+        if self.__engine:
+            self.__engine.close()
+        if self.__pool:
+            self.__pool.shutdown()
+        self.__client.close()
 
     def __get_token(self):
         try:
+            metrics.inc('jackal_token_requests_total')
             response = self.__client.get(self.token, timeout=self.timeout, verify=False, proxies=self.proxies)
             logger.debug('GET %s' % self.token)
         except (ConnectionError, ConnectTimeout, ReadTimeout) as e:
             logger.error (str(e))
+            metrics.inc('jackal_http_errors_total', method='GET')
             return False
         except TypeError as e:
             # workaround for urllib3 Retry() bug
             logger.error (str(e.__context__))
+            metrics.inc('jackal_http_errors_total', method='GET')
             return False
+        self.__count(response, 'GET')
         if 'x-csrf-token' in response.headers:
             self.__csrf = response.headers['x-csrf-token']
+            self.__fetched = time.monotonic()
             logger.debug('Got token %s' % self.__csrf)
             return True
         return False
 
-    def __submit(self, data, method, url):
-        if not self.__csrf:
-            if not self.__get_token():
+    def __token(self, stale=None):
+        # one request for all the threads waiting for a new token
+        with self.__tokenlock:
+            if self.__csrf == stale:
+                self.__csrf = None
+                self.__get_token()
+            return self.__csrf
+
+    def __renew(self):
+        # before it expires, while the other threads go on with the current one
+        if not self.__tokenlock.acquire(blocking=False):
+            return
+        try:
+            if time.monotonic() - self.__fetched > 0.8 * self.tokenttl:
+                logger.debug('Renewing token %s' % self.__csrf)
+                self.__get_token()
+        finally:
+            self.__tokenlock.release()
+
+    def __submit(self, body, method, url, recursion=False):
+        if self.__csrf and self.tokenttl and time.monotonic() - self.__fetched > 0.8 * self.tokenttl:
+            self.__renew()
+        csrf = self.__csrf
+        if not csrf:
+            csrf = self.__token()
+            if not csrf:
                 logger.error('Server %s forbids GET token requests. Check plugin and server configuration.' % (config.baseurl))
                 return False
         headers = {}
-        headers['X-CSRF-TOKEN'] = self.__csrf
+        headers['X-CSRF-TOKEN'] = csrf
+        headers['Content-Type'] = 'application/json'
+        if self.gzip:
+            headers['Content-Encoding'] = 'gzip'
         try:
             auth = None
             if self.username and self.password:
                 auth = (self.username, self.password)
-            if method == 'POST':
-                response = self.__client.post(url, auth=auth, json=data, headers=headers, timeout=self.timeout, verify=False, proxies=self.proxies)
-            if method == 'PUT':
-                response = self.__client.put(url, auth=auth, json=data, headers=headers, timeout=self.timeout, verify=False, proxies=self.proxies)
-            if method == 'PATCH':
-                response = self.__client.patch(url, auth=auth, json=data, headers=headers, timeout=self.timeout, verify=False, proxies=self.proxies)
-            if method == 'DELETE':
-                response = self.__client.delete(url, auth=auth, json=data, headers=headers, timeout=self.timeout, verify=False, proxies=self.proxies)
-            logger.debug('%s %s JSON: %s' % (method, url, data))
+            response = self.__client.request(method, url, auth=auth, data=body, headers=headers, timeout=self.timeout, verify=False, proxies=self.proxies)
+            logger.debug('%s %s %d bytes' % (method, url, len(body)))
         except (ConnectionError, ConnectTimeout, ReadTimeout) as e:
             logger.error (str(e))
+            metrics.inc('jackal_http_errors_total', method=method)
             return False
         except TypeError as e:
             # workaround for urllib3 Retry() bug
             logger.error (str(e.__context__))
+            metrics.inc('jackal_http_errors_total', method=method)
             return False
+        self.__count(response, method)
         if response.status_code == 403:
-            if not self.__recursion:
-                self.__recursion = True
-                self.__csrf = None
-                return self.__submit(data, method, url)
+            if not recursion:
+                self.__token(csrf)
+                return self.__submit(body, method, url, recursion=True)
             else:
                 logger.error('Server %s forbids %s requests. Check plugin and server configuration (eg. authentication).' % (config.baseurl, method))
-        self.__recursion = False
         return (response.status_code, response.text)
 
-    def submit(self, data, method = 'POST'):
-        if not data:
-            return True
-        if not method in ['POST', 'PUT', 'PATCH', 'DELETE']:
+    def __count(self, response, method):
+        metrics.inc('jackal_http_responses_total', method=method, status=response.status_code)
+        # retries done by urllib3 before the response
+        retries = getattr(response.raw, 'retries', None)
+        if retries and retries.history:
+            metrics.inc('jackal_http_retries_total', len(retries.history), method=method)
+
+    def __chunks(self, data):
+        # chunks of records, with the JSON of each record if needed to size them
+        if not self.chunkbytes:
+            step = self.chunkrecords or len(data)
+            for start in range(0, len(data), step):
+                yield (data[start:start + step], None)
+            return
+        pieces = batch.pieces(data)
+        start = 0
+        size = 2
+        for idx in range(len(data)):
+            # each record is followed by a ', ' separator in the JSON array
+            length = len(pieces[idx]) + 2
+            if idx > start and size + length > self.chunkbytes:
+                yield (data[start:idx], pieces[start:idx])
+                start = idx
+                size = 2
+            size += length
+            if self.chunkrecords and idx + 1 - start >= self.chunkrecords:
+                yield (data[start:idx + 1], pieces[start:idx + 1])
+                start = idx + 1
+                size = 2
+        if start < len(data):
+            yield (data[start:], pieces[start:])
+
+    def __body(self, data, pieces):
+        # serialized once, the same bytes are sent again on retries
+        body = batch.dumps(data) if pieces is None else batch.join(pieces)
+        if self.gzip:
+            body = gzip.compress(body, compresslevel=self.gzip)
+        return body
+
+    def __send(self, data, pieces, method, seq, count, progress, abort):
+        if abort.is_set():
             return False
+        throttle = self.throttle
+        started = throttle.acquire(len(data)) if throttle else None
+        response = None
+        try:
+            response = self.__submit(self.__body(data, pieces), method, self.drain)
+        finally:
+            if throttle:
+                throttle.release(len(data), started, self.__congested(response))
+        return self.__result(data, method, seq, count, progress, abort, response)
+
+    async def __asend(self, data, pieces, method, seq, count, progress, abort):
+        async with self.__engine.slot():
+            if abort.is_set():
+                return False
+            throttle = self.throttle
+            started = await self.__engine.blocking(throttle.acquire, len(data)) if throttle else None
+            response = None
+            try:
+                response = await self.__engine.submit(self.__body(data, pieces), method, self.drain)
+            finally:
+                if throttle:
+                    throttle.release(len(data), started, self.__congested(response))
+        return self.__result(data, method, seq, count, progress, abort, response)
+
+    def __congested(self, response):
+        if not response:
+            return True
+        status = response[0]
+        return status >= 500 or status in (408, 429)
+
+    def __result(self, data, method, seq, count, progress, abort, response):
         first = data[0]
         last = data[-1]
-        response = self.__submit(data, method, self.drain)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('%s %s JSON: %s' % (method, self.drain, data))
         if response:
             status, text = response
-            logger.info('%s client id: %s timestamp interval: %s ~ %s measures: %d HTTP status code: %s %s' % (method, first['client_id'], first['at'], last['at'], len(data), status, text.splitlines()))
-        else:
+            chunk = ''
+            if count > 1:
+                chunk = ' chunk: %d/%d' % (seq + 1, count)
+            logger.info('%s client id: %s timestamp interval: %s ~ %s measures: %d%s HTTP status code: %s %s' % (method, first['client_id'], first['at'], last['at'], len(data), chunk, status, text.splitlines()))
+            if status in (200, 201, 409):
+                return True
+            if status < 500 and status not in (408, 429):
+                progress.retryable = False
+        # don't waste time on the remaining chunks, the file will be retried
+        abort.set()
+        return False
+
+    def submit(self, data, method = 'POST', progress = None):
+        if not data:
+            return True
+        if not method in ['POST', 'PUT', 'PATCH', 'DELETE']:
             return False
-        if status in (200, 201, 409):
+        if self.ledger:
+            data = self.ledger.filter(data, method)
+            if not data:
+                return True
+        if progress is None:
+            progress = JProgress()
+        layout = progress.parsing + [self.chunkrecords, self.chunkbytes]
+        if progress.layout != layout:
+            progress.layout = layout
+            progress.accepted.clear()
+        chunks = [(progress.next(), chunk, pieces) for (chunk, pieces) in self.__chunks(data)]
+        count = progress.chunks
+        pending = [(seq, chunk, pieces) for (seq, chunk, pieces) in chunks if seq not in progress.accepted]
+        if len(pending) < len(chunks):
+            logger.info('Skipping %d chunks already accepted' % (len(chunks) - len(pending)))
+        abort = threading.Event()
+        if self.__engine:
+            sends = [self.__asend(chunk, pieces, method, seq, count, progress, abort) for (seq, chunk, pieces) in pending]
+            results = dict(zip([seq for (seq, chunk, pieces) in pending], self.__engine.run(sends)))
+        elif self.__pool and len(pending) > 1:
+            futures = {self.__pool.submit(self.__send, chunk, pieces, method, seq, count, progress, abort): seq for (seq, chunk, pieces) in pending}
+            results = {futures[future]: future.result() for future in concurrent.futures.as_completed(futures)}
+        else:
+            results = {seq: self.__send(chunk, pieces, method, seq, count, progress, abort) for (seq, chunk, pieces) in pending}
+        for (seq, chunk, pieces) in pending:
+            if results[seq]:
+                progress.accept(seq)
+                if self.ledger:
+                    self.ledger.accept(chunk, method)
+            else:
+                progress.unsent.append((chunk, method))
+        return all(results.values())
+
+
+class JOutbox():
+    """ Durable queue of the parsed data the server did not accept
+
+    Each entry is compressed, checksummed and appended to the active segment
+    file, which is fsync'ed before returning. Entries are read back in order
+    from a cursor saved atomically after each acknowledge, and every segment is
+    deleted once drained. Torn writes left by a crash fail the checksum and
+    end their segment.
+    """
+
+    header = struct.Struct('>4sII')
+    magic = b'JOBX'
+
+    def __init__(self, directory, maxsize):
+        self.directory = directory
+        self.maxsize = maxsize
+        self.segsize = min(16777216, max(maxsize // 4, 1))
+        self.__lock = threading.Lock()
+        self.__writer = None
+        self.__active = None
+        self.__cursor = (-1, 0)
+        self.arrived = threading.Event()
+        os.makedirs(directory, exist_ok=True)
+        cursor = os.path.join(directory, 'cursor')
+        if os.path.isfile(cursor):
+            try:
+                with open(cursor, 'r') as f:
+                    self.__cursor = tuple(json.load(f))
+            except (OSError, ValueError) as e:
+                logger.error('Cannot read outbox cursor "%s", replaying from start: %s' % (cursor, str(e)))
+        segments = self.__segments()
+        # segment numbers never go back below the cursor
+        self.__last = max(segments + [self.__cursor[0]])
+        self.size = sum(os.path.getsize(self.__path(segment)) for segment in segments)
+        logger.info('Outbox "%s" size %d of %d bytes' % (directory, self.size, maxsize))
+
+    def __segments(self):
+        names = glob.glob(os.path.join(self.directory, '*.seg'))
+        return sorted(int(os.path.basename(name)[:-4]) for name in names)
+
+    def __path(self, segment):
+        return os.path.join(self.directory, '%012d.seg' % segment)
+
+    def __sync(self):
+        fd = os.open(self.directory, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def put(self, data, method, name=None):
+        entry = '{"method": %s, "file": %s, "data": ' % (json.dumps(method), json.dumps(name))
+        payload = zlib.compress(entry.encode('utf-8') + batch.dumps(data) + b'}')
+        entry = self.header.pack(self.magic, len(payload), zlib.crc32(payload)) + payload
+        with self.__lock:
+            if self.size + len(entry) > self.maxsize:
+                logger.error('Outbox "%s" full (%d bytes), cannot queue %d bytes' % (self.directory, self.size, len(entry)))
+                return False
+            try:
+                if not self.__writer or self.__writer.tell() >= self.segsize:
+                    self.__rotate()
+                self.__writer.write(entry)
+                self.__writer.flush()
+                os.fsync(self.__writer.fileno())
+            except OSError as e:
+                logger.error('Cannot write outbox "%s": %s' % (self.directory, str(e)))
+                if self.__writer:
+                    try:
+                        self.__writer.close()
+                    except OSError:
+                        # failing again on the data left in its buffer
+                        pass
+                self.__writer = None
+                self.__active = None
+                return False
+            self.size += len(entry)
+        self.arrived.set()
+        return True
+
+    def close(self):
+        """ Closes the active segment, the next put() starts a new one """
+        with self.__lock:
+            if not self.__writer:
+                return
+            try:
+                self.__writer.close()
+            except OSError as e:
+                logger.error('Cannot close outbox "%s": %s' % (self.directory, str(e)))
+            self.__writer = None
+            self.__active = None
+
+    def __rotate(self):
+        if self.__writer:
+            self.__writer.close()
+        self.__last += 1
+        self.__active = self.__last
+        self.__writer = open(self.__path(self.__active), 'ab')
+        self.__sync()
+
+    def get(self):
+        """ Oldest entry as (segment, end offset, method, data, file name) """
+        with self.__lock:
+            (segment, offset) = self.__cursor
+            for current in self.__segments():
+                if current < segment:
+                    self.__drop(current)
+                    continue
+                if current > segment:
+                    (segment, offset) = (current, 0)
+                path = self.__path(current)
+                with open(path, 'rb') as f:
+                    f.seek(offset)
+                    header = f.read(self.header.size)
+                    if len(header) == self.header.size:
+                        (magic, length, crc) = self.header.unpack(header)
+                        payload = f.read(length)
+                        if magic == self.magic and len(payload) == length and zlib.crc32(payload) == crc:
+                            entry = json.loads(zlib.decompress(payload).decode('utf-8'))
+                            return (current, offset + self.header.size + length, entry['method'], entry['data'], entry['file'])
+                if current == self.__active:
+                    if header:
+                        break
+                    # drained: next entries go to a new segment
+                    self.__writer.close()
+                    self.__writer = None
+                    self.__active = None
+                elif header:
+                    logger.error('Outbox segment "%s" corrupted at offset %d, discarding the rest' % (path, offset))
+                self.__drop(current)
+            return None
+
+    def __drop(self, segment):
+        path = self.__path(segment)
+        self.size -= os.path.getsize(path)
+        os.unlink(path)
+
+    def ack(self, segment, offset):
+        with self.__lock:
+            self.__cursor = (segment, offset)
+            cursor = os.path.join(self.directory, 'cursor')
+            with open('%s.tmp' % cursor, 'w') as f:
+                json.dump(self.__cursor, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace('%s.tmp' % cursor, cursor)
+
+    def reject(self, segment, offset, method, data, name):
+        rejected = os.path.join(self.directory, 'rejected')
+        os.makedirs(rejected, exist_ok=True)
+        filename = os.path.join(rejected, '%012d-%d-%s.json' % (segment, offset, os.path.basename(name or 'data')))
+        logger.error('Server rejected outbox entry, saving it into "%s"' % filename)
+        with open(filename, 'w') as f:
+            json.dump({'method': method, 'data': data}, f)
+        self.ack(segment, offset)
+
+
+class JReplayer(threading.Thread):
+    """ Drains the outbox, backing off exponentially while the server fails """
+
+    def __init__(self, outbox):
+        threading.Thread.__init__(self, name='outbox', daemon=True)
+        self.outbox = outbox
+        self.backoff = 10
+        self.maxbackoff = max(config.interval, self.backoff)
+        self.stopped = threading.Event()
+
+    def run(self):
+        try:
+            self.__replay()
+        finally:
+            self.outbox.close()
+
+    def stop(self):
+        self.stopped.set()
+        self.outbox.arrived.set()
+
+    def __replay(self):
+        delay = self.backoff
+        while not self.stopped.is_set():
+            self.outbox.arrived.clear()
+            try:
+                entry = self.outbox.get()
+            except (OSError, ValueError, zlib.error) as e:
+                logger.error('Cannot read outbox "%s": %s' % (self.outbox.directory, str(e)))
+                entry = None
+            if not entry:
+                self.outbox.arrived.wait(self.maxbackoff)
+                continue
+            (segment, offset, method, data, name) = entry
+            progress = JProgress()
+            if rest.submit(data, method, progress):
+                logger.info('Replayed outbox entry of "%s" (%d bytes left)' % (name, self.outbox.size))
+                self.outbox.ack(segment, offset)
+                delay = self.backoff
+            elif not progress.retryable:
+                self.outbox.reject(segment, offset, method, data, name)
+            else:
+                logger.warning('Cannot replay outbox entry of "%s", retrying in %d seconds' % (name, delay))
+                self.stopped.wait(delay)
+                delay = min(delay * 2, self.maxbackoff)
+
+
+class JInput():
+    """ Input file of a plugin, read without copies of the whole content
+
+    Files of at least mmapsize bytes (0 never) are memory mapped. The plugins
+    get the lines decoded one at a time (iterparse), a binary stream or the
+    buffer (parseinput and iterparseinput, eg. lxml honours the encoding
+    declared by the XML), and the whole decoded text only if they have just
+    parse(). The lines are decoded with encoding, which must be ASCII
+    compatible.
+
+    Files compressed with gzip or xz, detected by their magic bytes, are
+    decompressed while read. A zip archive holds a logical file for each of
+    its members: member is the one read.
+    """
+
+    # magic bytes of the compressed files
+    magic = ((b'\x1f\x8b', 'gz'), (b'\xfd7zXZ\x00', 'xz'), (b'PK\x03\x04', 'zip'), (b'PK\x05\x06', 'zip'))
+    # extensions of the compressed files, matched by the name without them
+    extensions = ('.gz', '.xz')
+    # raised reading corrupted compressed files
+    errors = (EOFError, gzip.BadGzipFile, lzma.LZMAError, zipfile.BadZipFile, zlib.error)
+
+    def __init__(self, filename, encoding='utf-8', mmapsize=0, member=None):
+        self.filename = filename
+        self.encoding = encoding
+        self.member = member
+        self.__raw = open(filename, 'rb')
+        self.__file = self.__raw
+        self.__archive = None
+        self.__map = None
+        self.size = os.fstat(self.__raw.fileno()).st_size
+        try:
+            self.compression = self.__compression(self.__raw)
+            if self.compression == 'gz':
+                self.__file = gzip.GzipFile(fileobj=self.__raw, mode='rb')
+            elif self.compression == 'xz':
+                self.__file = lzma.LZMAFile(self.__raw)
+            elif self.compression == 'zip':
+                self.__archive = zipfile.ZipFile(self.__raw)
+                if member is None:
+                    raise ValueError('Archive "%s" read without a member' % filename)
+                self.__file = self.__archive.open(member)
+            elif mmapsize and self.size >= mmapsize:
+                self.__map = mmap.mmap(self.__raw.fileno(), 0, access=mmap.ACCESS_READ)
+        except BaseException:
+            self.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        if self.__map:
+            self.__map.close()
+        if self.__file is not self.__raw:
+            self.__file.close()
+        if self.__archive:
+            self.__archive.close()
+        self.__raw.close()
+
+    @staticmethod
+    def __compression(f):
+        head = f.read(6)
+        f.seek(0)
+        return next((compression for (magic, compression) in JInput.magic if head.startswith(magic)), None)
+
+    @staticmethod
+    def members(filename, pattern='*'):
+        """ Members of the zip archive filename matching pattern (all of
+        them if the archive name does), [None] if filename is not a zip
+        """
+        with open(filename, 'rb') as f:
+            if JInput.__compression(f) != 'zip':
+                return [None]
+            with zipfile.ZipFile(f) as archive:
+                names = [info.filename for info in archive.infolist() if not info.is_dir()]
+        if fnmatch.fnmatch(os.path.basename(filename), pattern):
+            return names
+        return [name for name in names if fnmatch.fnmatch(os.path.basename(name), pattern)]
+
+    @staticmethod
+    def matches(filename, pattern):
+        """ Whether filename matches pattern, by its name without the
+        extension if compressed or by its members names if a zip archive
+        """
+        name = os.path.basename(filename)
+        if fnmatch.fnmatch(name, pattern):
             return True
+        (root, extension) = os.path.splitext(name)
+        if extension.lower() in JInput.extensions:
+            return fnmatch.fnmatch(root, pattern)
+        if extension.lower() == '.zip':
+            try:
+                return bool(JInput.members(filename, pattern))
+            except zipfile.BadZipFile:
+                # moved into kodir by the processing
+                return True
+            except OSError:
+                return False
         return False
 
+    @staticmethod
+    def find(directory, pattern):
+        """ Files in directory matching pattern, see matches() """
+        found = glob.glob(os.path.join(directory, pattern))
+        try:
+            names = os.listdir(directory)
+        except OSError:
+            return found
+        for name in names:
+            infile = os.path.join(directory, name)
+            if os.path.splitext(name)[1].lower() in JInput.extensions + ('.zip',) and infile not in found and JInput.matches(infile, pattern):
+                found.append(infile)
+        return found
+
+    def buffer(self):
+        """ The content, the map itself if mapped """
+        if self.__map:
+            return self.__map
+        self.__file.seek(0)
+        return self.__file.read()
+
+    def stream(self):
+        """ Binary file object at the beginning of the content """
+        stream = self.__map or self.__file
+        stream.seek(0)
+        return stream
+
+    def lines(self):
+        """ The lines, decoded one at a time """
+        if self.__map:
+            self.__map.seek(0)
+            yield from codecs.iterdecode(iter(self.__map.readline, b''), self.encoding)
+            return
+        self.__file.seek(0)
+        text = io.TextIOWrapper(self.__file, encoding=self.encoding)
+        try:
+            yield from text
+        finally:
+            # the file is closed by close(), maybe already when the
+            # generator is collected after an error
+            if not self.__file.closed:
+                text.detach()
+
+    def text(self):
+        """ The whole content decoded, with universal newlines like open() """
+        text = str(self.buffer(), self.encoding)
+        if '\r' in text:
+            text = text.replace('\r\n', '\n').replace('\r', '\n')
+        return text
+
+    def batches(self, plugin):
+        """ Batches of data and method, from iterparseinput() if the plugin
+        has it, from iterparse() of the lines otherwise
+        """
+        if hasattr(plugin, 'iterparseinput'):
+            return plugin.iterparseinput(self)
+        return plugin.iterparse(self.lines())
+
+    def parse(self, plugin):
+        """ Data and method of the whole file, through the best input the
+        plugin takes: parseinput(), the batches of iterparseinput() or
+        iterparse(), or parse()
+        """
+        if hasattr(plugin, 'parseinput'):
+            return plugin.parseinput(self)
+        if hasattr(plugin, 'iterparseinput') or hasattr(plugin, 'iterparse'):
+            data = None
+            method = 'POST'
+            for (batch, method) in self.batches(plugin):
+                if data is None:
+                    data = batch
+                else:
+                    data.extend(batch)
+            return (MeasureBatch(plugin.clientid) if data is None else data, method)
+        return plugin.parse(self.text())
+
+
+class JPool():
+    """ Worker processes parsing input files outside of the GIL
+
+    Only plugin.parse() runs in the workers: the parsed data (of each member,
+    for zip archives) is sent back to the plugin thread, which submits it and
+    moves the file.
+    """
+
+    def __init__(self, processes):
+        self.processes = processes
+        self.__executor = None
+        self.__lock = threading.Lock()
+
+    def submit(self, plugin, infile, profile=None):
+        # the class attributes set by JApp are not pickled with the plugin
+        args = (parse_file, plugin, infile, profile, plugin.encoding, config.mmapsize, plugin.pattern)
+        with self.__lock:
+            if self.__executor:
+                try:
+                    return self.__executor.submit(*args)
+                except concurrent.futures.BrokenExecutor:
+                    logger.error('Parsing processes pool broken, restarting it')
+            self.__executor = concurrent.futures.ProcessPoolExecutor(max_workers=self.processes, mp_context=multiprocessing.get_context('spawn'), initializer=parse_init)
+            return self.__executor.submit(*args)
+
+    def shutdown(self):
+        with self.__lock:
+            if self.__executor:
+                self.__executor.shutdown()
+                self.__executor = None
+
+
+class JProfiler():
+    """ cProfile of the processing of every Nth file, and of the slow ones
+
+    With slow set, every file is profiled and the profile is kept, with a copy
+    of the file, if parsing it took more than slow seconds. The profiles are
+    named by plugin, time and input file.
+    """
+
+    def __init__(self, directory, every=0, slow=0):
+        self.directory = directory
+        self.every = every
+        self.slow = slow
+        self.__counts = collections.Counter()
+        self.__lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        logger.info('%s profiling %s%s into "%s"' % (__title__, 'every %d files' % every if every else 'no file', ', keeping parsing over %s seconds' % slow if slow else '', directory))
+
+    def wanted(self, name):
+        """ None if the next file is not profiled, whether it is sampled otherwise """
+        sampled = False
+        if self.every:
+            with self.__lock:
+                sampled = self.__counts[name] % self.every == 0
+                self.__counts[name] += 1
+        if sampled or self.slow:
+            return sampled
+        return None
+
+    def parsefile(self, name, infile):
+        # profile of the parsing in a worker process
+        return os.path.join(self.directory, '.%s-%s-%d.parse' % (name, os.path.basename(infile), threading.get_ident()))
+
+    def save(self, name, infile, current, sampled, seconds, profiles, parsefile=None):
+        """ Keeps the profiles if sampled or slow, and a copy of current (the
+        input file, moved meanwhile) if slow
+        """
+        slow = bool(self.slow) and seconds > self.slow
+        sources = [profile for profile in profiles if profile and profile.getstats()]
+        if parsefile and os.path.isfile(parsefile):
+            sources.append(parsefile)
+        try:
+            if not (sampled or slow) or not sources:
+                return
+            import pstats
+            stem = os.path.join(self.directory, '%s-%s-%s' % (name, time.strftime('%Y%m%d%H%M%S'), os.path.basename(infile)))
+            pstats.Stats(*sources).dump_stats('%s.prof' % stem)
+            if not slow:
+                logger.info('Profile of "%s" saved into "%s.prof"' % (infile, stem))
+                return
+            if current and os.path.isfile(current):
+                shutil.copy2(current, stem)
+            logger.warning('Slow parsing of "%s" (%.1f seconds), profile and copy saved into "%s"' % (infile, seconds, self.directory))
+        except OSError as e:
+            logger.error('Cannot save profile of "%s": %s' % (infile, str(e)))
+        finally:
+            if parsefile and os.path.isfile(parsefile):
+                os.unlink(parsefile)
+
+class JQueue():
+    """ Files waiting to be processed, by plugin
+
+    Files are queued by the inotify watchers and by the reconciliation scans:
+    a file queued again while it is waiting is not duplicated, and it is
+    handed out only when no event for it arrived for delay seconds.
+    """
+
+    def __init__(self):
+        self.__cond = threading.Condition()
+        self.__pending = {}
+        self.__stopped = False
+
+    def put(self, plugin, infile, delay=0):
+        with self.__cond:
+            files = self.__pending.setdefault(plugin, {})
+            due = time.monotonic() + delay
+            files[infile] = max(files.get(infile, due), due)
+            self.__cond.notify_all()
+
+    def get(self, plugin):
+        """ Waits for the files of plugin that are due, None when stopped """
+        with self.__cond:
+            while not self.__stopped:
+                files = self.__pending.get(plugin)
+                now = time.monotonic()
+                due = [infile for infile in files or () if files[infile] <= now]
+                if due:
+                    for infile in due:
+                        del files[infile]
+                    return due
+                self.__cond.wait(min(files.values()) - now if files else None)
+            return None
+
+    def depth(self, plugin):
+        with self.__cond:
+            return len(self.__pending.get(plugin, ()))
+
+    def stop(self):
+        with self.__cond:
+            self.__stopped = True
+            self.__cond.notify_all()
+
+
+class JArchiver(threading.Thread):
+    """ Compacts the processed files into an archive for each day or month
+
+    The files of okdir (and kodir) are added, by their modification time,
+    to the zip archive of their day or month in the archive subdirectory,
+    once the day or month is over, and removed. The index.tsv of the archive
+    directory lists the name, archive, modification time and size of each
+    file. The archives are deleted days after the end of their period, if
+    days is set.
+
+    The thread runs at the lowest CPU priority and only while idle() is true,
+    ie. while no file is waiting or processed.
+    """
+
+    def __init__(self, directories, period='day', days=0, interval=3600, idle=None):
+        threading.Thread.__init__(self, name='archive', daemon=True)
+        self.directories = directories
+        self.period = period
+        self.days = days
+        self.interval = interval
+        self.idle = idle or (lambda: True)
+        self.stopped = threading.Event()
+
+    def run(self):
+        try:
+            # on Linux the nice value of a thread is its own
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 19)
+        except (AttributeError, OSError) as e:
+            logger.debug('Cannot lower the archiving thread priority: %s' % str(e))
+        while not self.stopped.wait(self.interval):
+            for directory in self.directories:
+                try:
+                    self.compact(directory)
+                    self.expire(directory)
+                except OSError as e:
+                    logger.error('Cannot archive "%s": %s' % (directory, str(e)))
+
+    def stop(self):
+        self.stopped.set()
+
+    def partition(self, mtime):
+        dt = datetime.datetime.fromtimestamp(mtime)
+        return dt.strftime('%Y-%m-%d' if self.period == 'day' else '%Y-%m')
+
+    def __wait(self):
+        # gives way to the processing threads, False when stopped
+        while not self.idle():
+            if self.stopped.wait(1):
+                return False
+        return not self.stopped.is_set()
+
+    def compact(self, directory):
+        """ Archives the files of the periods over """
+        current = self.partition(time.time())
+        partitions = {}
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                # the chunks progress of the files in kodir, kept for their retry
+                if entry.is_file(follow_symlinks=False) and not entry.name.endswith('.chunks'):
+                    partition = self.partition(entry.stat().st_mtime)
+                    if partition < current:
+                        partitions.setdefault(partition, []).append(entry.path)
+        for partition in sorted(partitions):
+            if not self.__wait():
+                return
+            self.__append(directory, partition, sorted(partitions[partition]))
+
+    def __append(self, directory, partition, infiles):
+        # the archive is replaced at once, never left half written
+        archivedir = os.path.join(directory, 'archive')
+        os.makedirs(archivedir, exist_ok=True)
+        archive = os.path.join(archivedir, '%s.zip' % partition)
+        tmp = '%s.tmp' % archive
+        if os.path.isfile(archive):
+            shutil.copyfile(archive, tmp)
+        archived = []
+        try:
+            with zipfile.ZipFile(tmp, 'a', zipfile.ZIP_DEFLATED) as zf:
+                names = set(zf.namelist())
+                for infile in infiles:
+                    if not self.__wait():
+                        return
+                    try:
+                        stat = os.stat(infile)
+                    except FileNotFoundError:
+                        continue
+                    name = os.path.basename(infile)
+                    # the same name processed again
+                    (arcname, copy) = (name, 0)
+                    while arcname in names:
+                        copy += 1
+                        arcname = '%s~%d' % (name, copy)
+                    zf.write(infile, arcname)
+                    names.add(arcname)
+                    archived.append((infile, arcname, stat))
+            with open(tmp, 'rb') as f:
+                os.fsync(f.fileno())
+            os.replace(tmp, archive)
+        finally:
+            if os.path.isfile(tmp):
+                os.unlink(tmp)
+        with open(os.path.join(archivedir, 'index.tsv'), 'a') as index:
+            for (infile, arcname, stat) in archived:
+                index.write('%s\t%s\t%s\t%d\n' % (arcname, os.path.basename(archive), datetime.datetime.fromtimestamp(stat.st_mtime).isoformat(timespec='seconds'), stat.st_size))
+        for (infile, arcname, stat) in archived:
+            # unless replaced meanwhile by a file with the same name
+            try:
+                current = os.stat(infile)
+                if (current.st_ino, current.st_size, current.st_mtime_ns) == (stat.st_ino, stat.st_size, stat.st_mtime_ns):
+                    os.unlink(infile)
+            except FileNotFoundError:
+                pass
+        metrics.inc('jackal_archived_files_total', len(archived))
+        logger.info('Archived %d files of "%s" into "%s"' % (len(archived), directory, archive))
+
+    def expire(self, directory):
+        """ Deletes the archives ended more than days ago """
+        archivedir = os.path.join(directory, 'archive')
+        if not self.days or not os.path.isdir(archivedir):
+            return
+        expired = set()
+        limit = datetime.date.today() - datetime.timedelta(days=self.days)
+        for name in os.listdir(archivedir):
+            (partition, extension) = os.path.splitext(name)
+            if extension != '.zip':
+                continue
+            try:
+                if self.period == 'day':
+                    end = datetime.datetime.strptime(partition, '%Y-%m-%d').date() + datetime.timedelta(days=1)
+                else:
+                    start = datetime.datetime.strptime(partition, '%Y-%m').date()
+                    end = (start + datetime.timedelta(days=31)).replace(day=1)
+            except ValueError:
+                continue
+            if end <= limit:
+                expired.add(name)
+        if not expired:
+            return
+        index = os.path.join(archivedir, 'index.tsv')
+        if os.path.isfile(index):
+            with open(index, 'r') as f:
+                lines = [line for line in f if (line.split('\t') + [''])[1] not in expired]
+            with open('%s.tmp' % index, 'w') as f:
+                f.writelines(lines)
+            os.replace('%s.tmp' % index, index)
+        for name in sorted(expired):
+            logger.info('Deleting archive "%s", older than %d days' % (os.path.join(archivedir, name), self.days))
+            os.unlink(os.path.join(archivedir, name))
+
+
+class JCluster():
+    """ Basedirs shared by several nodes, each file processed by one of them
+
+    A node claims a file by renaming it into its own directory, .claims/NODE
+    of basedir: the rename is atomic, also over NFS, so only one node gets
+    it. Each node touches .claims/NODE.alive every lease/3 seconds, the files
+    claimed by a node not alive for lease seconds are moved back into
+    basedir. The times are compared as set by the file server.
+
+    With nodes, the list of all the node names, each node claims the files
+    whose name hashes to it and the other files only when they wait for more
+    than lease seconds (their node being down).
+    """
+
+    def __init__(self, node, lease=600, nodes=None):
+        self.node = node
+        self.lease = lease
+        self.nodes = [name.strip() for name in nodes.split(',') if name.strip()] if nodes else []
+        if self.nodes and node not in self.nodes:
+            logger.error('Node %s not among the nodes %s, claiming every file' % (node, ', '.join(self.nodes)))
+            self.nodes = []
+        # file server time minus local time
+        self.skew = 0
+
+    def claims(self, basedir, node=None):
+        return os.path.join(basedir, '.claims', node or self.node)
+
+    def __alive(self, basedir, node=None):
+        return '%s.alive' % self.claims(basedir, node)
+
+    def now(self):
+        """ Time of the file server """
+        return time.time() + self.skew
+
+    def heartbeat(self, basedir):
+        os.makedirs(self.claims(basedir), exist_ok=True)
+        alive = self.__alive(basedir)
+        with open(alive, 'a'):
+            os.utime(alive, None)
+        self.skew = os.stat(alive).st_mtime - time.time()
+
+    def wanted(self, infile):
+        # the files of the shard of this node, the others once abandoned
+        if not self.nodes:
+            return True
+        name = os.path.basename(infile)
+        if self.nodes[zlib.crc32(name.encode('utf-8', 'surrogateescape')) % len(self.nodes)] == self.node:
+            return True
+        try:
+            return self.now() - os.path.getmtime(infile) > self.lease
+        except OSError:
+            return False
+
+    def claim(self, infile):
+        """ Path of infile claimed by this node, None if another node has it """
+        if not self.wanted(infile):
+            return None
+        claimed = os.path.join(self.claims(os.path.dirname(infile)), os.path.basename(infile))
+        try:
+            os.rename(infile, claimed)
+        except FileNotFoundError:
+            return None
+        return claimed
+
+    def release(self, claimed):
+        """ Moves a claimed file, not processed, back into basedir """
+        basedir = os.path.dirname(os.path.dirname(os.path.dirname(claimed)))
+        infile = os.path.join(basedir, os.path.basename(claimed))
+        if os.path.exists(infile):
+            logger.error('Cannot release "%s", "%s" exists' % (claimed, infile))
+            return None
+        try:
+            os.rename(claimed, infile)
+        except FileNotFoundError:
+            return None
+        return infile
+
+    def recover(self, basedir, own=False):
+        """ Releases the files of the nodes not alive (of this node if own),
+        returns them
+        """
+        self.heartbeat(basedir)
+        now = os.path.getmtime(self.__alive(basedir))
+        released = []
+        root = os.path.join(basedir, '.claims')
+        for node in sorted(os.listdir(root)):
+            if not os.path.isdir(os.path.join(root, node)) or (node == self.node) != own:
+                continue
+            try:
+                alive = os.path.getmtime(self.__alive(basedir, node))
+            except OSError:
+                alive = 0
+            if not own and now - alive <= self.lease:
+                continue
+            count = 0
+            with os.scandir(self.claims(basedir, node)) as entries:
+                claimed = [entry.path for entry in entries if entry.is_file()]
+            for path in claimed:
+                infile = self.release(path)
+                if infile:
+                    released.append(infile)
+                    count += 1
+            if count:
+                logger.warning('Released %d files claimed by node %s into "%s"' % (count, node, basedir))
+        return released
+
+
+class JLease(threading.Thread):
+    """ Heartbeat of the node and recovery of the claims of the nodes gone
+
+    Calls recover every interval seconds on a thread of its own: the lease
+    of the node is renewed also while the scheduler is blocked, eg. while
+    the processing threads complete their files when the daemon stops.
+    """
+
+    def __init__(self, recover, interval):
+        threading.Thread.__init__(self, name='lease', daemon=True)
+        self.recover = recover
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                self.recover()
+            except Exception as e:
+                logger.error('Cannot renew the lease: %s' % str(e))
+
+    def stop(self):
+        self.stopped.set()
+
 
 class JApp():
 
     def __init__(self):
+        started = time.monotonic()
         self.__threads = {}
         self.__plugins = []
+        self.__pools = {}
+        self.__queue = JQueue()
+        self.__outbox = None
+        self.__replayer = None
+        self.__archiver = None
+        self.__cluster = None
+        self.__lease = None
+        self.__profiler = None
+        if config.node:
+            self.__cluster = JCluster(config.node, config.lease, config.nodes)
+        if config.profile or config.profileslow:
+            self.__profiler = JProfiler(os.path.normpath(config.profiledir), config.profile, config.profileslow)
+        if config.outbox:
+            self.__outbox = JOutbox(os.path.normpath(config.outbox), config.outboxsize)
+        pool = None
+        if config.processes > 0:
+            logger.info('%s parsing with %d processes' % (__title__, config.processes))
+            pool = JPool(config.processes)
         path = os.path.join(os.getcwd(), __name__, 'plugins')
         logger.debug('%s plugins path %s' % (__title__, path))
         modules = pkgutil.iter_modules(path = [path])
         for loader, name, ispkg in modules:
-            try:
-                loaded_mod = __import__('jackal.plugins.%s' % name, fromlist=[name])
-            except SyntaxError as e:
-                logger.warning('Plugin %s disabled: %s' % (name, str(e)))
-                continue
+            # only the configured plugins are imported, with their dependencies
             if name in config.sections():
                 logger.debug('Section %s found in configuration' % name)
             else:
                 logger.debug('Section %s not found in configuration' % name)
                 logger.info('Plugin %s disabled: not configured' % name)
                 continue
+            loaded = time.monotonic()
+            try:
+                loaded_mod = __import__('jackal.plugins.%s' % name, fromlist=[name])
+            except SyntaxError as e:
+                logger.warning('Plugin %s disabled: %s' % (name, str(e)))
+                continue
             try:
                 clientid = config.get(name, 'clientid')
                 okdir = config.get(name, 'okdir')
@@ -243,6 +1742,9 @@ class JApp():
                 pattern = os.path.normpath(config.get(name, 'pattern', fallback='*'))
                 inotify = config.getboolean(name, 'inotify', fallback=False)
                 filtr = config.get(name, 'filter', fallback=None)
+                batch = config.getint(name, 'batch', fallback=config.batch)
+                encoding = config.get(name, 'encoding', fallback=config.encoding)
+                processes = config.getint(name, 'processes', fallback=None)
                 if not self.checkdir(basedir):
                     logger.warning('Plugin %s disabled' % name)
                     continue
@@ -269,12 +1771,46 @@ class JApp():
             loaded_class.pattern = pattern
             loaded_class.inotify = inotify
             loaded_class.filtr = filtr
-            self.__plugins.append(loaded_class())
+            loaded_class.batchsize = batch
+            loaded_class.encoding = encoding
+            plugin = loaded_class()
+            self.__plugins.append(plugin)
+            logger.debug('Plugin %s loaded in %.1f ms' % (name, (time.monotonic() - loaded) * 1000))
+            metrics.gauge('jackal_queue_depth', functools.partial(self.__queue.depth, plugin), plugin=name)
+            metrics.gauge('jackal_oldest_file_age_seconds', functools.partial(self.oldest, plugin), plugin=name)
+            if processes is None:
+                self.__pools[plugin] = pool
+            elif processes > 0:
+                logger.info('Plugin %s parsing with %d processes' % (name, processes))
+                self.__pools[plugin] = JPool(processes)
         if not self.__plugins:
             logger.critical('No plugins enabled!')
+        if self.__outbox:
+            metrics.gauge('jackal_outbox_bytes', lambda: self.__outbox.size)
+        if config.archive:
+            directories = [plugin.okdir for plugin in self.__plugins]
+            if config.archivekodir:
+                directories += [plugin.kodir for plugin in self.__plugins]
+            # plugins may share their directories
+            directories = sorted(set(os.path.realpath(directory) for directory in directories))
+            self.__archiver = JArchiver(directories, config.archive, config.archivedays, config.archiveinterval, self.idle)
+        logger.debug('%s plugins loaded in %.1f ms' % (__title__, (time.monotonic() - started) * 1000))
 
     def run(self):
+        started = time.monotonic()
+        import schedule
+        if self.__outbox:
+            self.__replayer = JReplayer(self.__outbox)
+            self.__replayer.start()
+        if self.__archiver:
+            self.__archiver.start()
+        if config.metrics:
+            metrics.serve(config.metrics)
+        self.start()
+        logger.debug('%s threads started in %.1f ms' % (__title__, (time.monotonic() - started) * 1000))
         schedule.clear()
+        if config.statsfile:
+            schedule.every(config.statsinterval).seconds.do(metrics.dump, config.statsfile)
         schedule.every(config.interval).seconds.do(self.periodic)
         schedule.every().day.do(self.update)
         self.periodic()
@@ -282,19 +1818,76 @@ class JApp():
             schedule.run_pending()
             time.sleep(1)
 
+    def start(self):
+        # long-lived processing threads, fed by the queue
+        if self.__cluster:
+            # the claims left by the last run of this node
+            self.recover(own=True)
+            self.__lease = JLease(self.recover, max(1, config.lease // 3))
+            self.__lease.start()
+        for plugin in self.__plugins:
+            self.__threads[plugin] = JThread(plugin, self.__queue, self.__pools.get(plugin), self.__outbox, self.__profiler, self.__cluster)
+            self.__threads[plugin].start()
+        logger.debug('Processing threads running')
+
+    def recover(self, own=False):
+        # heartbeat, and files of the nodes gone queued again
+        for basedir in sorted(set(plugin.basedir for plugin in self.__plugins)):
+            try:
+                released = self.__cluster.recover(basedir, own)
+            except OSError as e:
+                logger.error('Cannot recover the claims of "%s": %s' % (basedir, str(e)))
+                continue
+            for infile in released:
+                for plugin in self.__plugins:
+                    if plugin.basedir == basedir and JInput.matches(infile, plugin.pattern):
+                        self.__queue.put(plugin, infile)
+
+    def idle(self):
+        # no file waiting or being processed
+        if any(self.__queue.depth(plugin) for plugin in self.__plugins):
+            return False
+        return not any(thread.busy for thread in self.__threads.values())
+
     def periodic(self):
+        # reconciliation scan, for the files the watchers missed (or for the
+        # plugins without inotify)
+        for plugin in self.__plugins:
+            for infile in JInput.find(plugin.basedir, plugin.pattern):
+                if infile not in (plugin.okdir, plugin.kodir) and os.path.isfile(infile):
+                    self.__queue.put(plugin, infile)
+
+    def stop(self):
+        # the threads complete the files they are processing
+        if self.__archiver:
+            self.__archiver.stop()
+        self.__queue.stop()
         for thread in self.__threads:
             self.__threads[thread].join()
             self.__threads[thread].stop()
-        logger.debug('Processing threads running')
-        self.__threads = {}
-        for plugin in self.__plugins:
-            self.__threads[plugin] = JThread(plugin)
-            self.__threads[plugin].start()
-        for plugin in self.__plugins:
-            self.__threads[plugin].join()
+        # the claims of this node stay alive until its threads are done
+        if self.__lease:
+            self.__lease.stop()
+        for pool in set(self.__pools.values()):
+            if pool:
+                pool.shutdown()
+        if self.__replayer:
+            self.__replayer.stop()
+        if self.__outbox:
+            self.__outbox.close()
         logger.debug('Processing threads ended')
 
+    def oldest(self, plugin):
+        # seconds since the last change of the oldest file waiting in basedir
+        mtimes = []
+        for infile in JInput.find(plugin.basedir, plugin.pattern):
+            try:
+                if os.path.isfile(infile):
+                    mtimes.append(os.path.getmtime(infile))
+            except OSError:
+                continue
+        return time.time() - min(mtimes) if mtimes else 0
+
     def checkdir(self,directory):
         if not os.path.exists(directory):
             logger.warning('Directory %s does not exist' % directory)
@@ -308,73 +1901,475 @@ class JApp():
         update = JWebUpdate()
         if update.update(force=force):
             logger.info('%s updated, exiting and waiting systemd restart...' % __name__)
-            for thread in self.__threads:
-                self.__threads[thread].join()
+            self.stop()
             os._exit(0)
 
-class JThread(threading.Thread, pyinotify.ProcessEvent):
+class JThread(threading.Thread):
 
-    def __init__(self, plugin):
+    def __init__(self, plugin, queue, pool=None, outbox=None, profiler=None, cluster=None):
         threading.Thread.__init__(self)
         self.plugin = plugin
+        self.queue = queue
+        self.pool = pool
+        self.outbox = outbox
+        self.profiler = profiler
+        self.cluster = cluster
+        self.__seconds = 0
+        self.__profile = None
         self.name = plugin.name
-        self.wm = pyinotify.WatchManager()
-        self.notifier = pyinotify.ThreadedNotifier(self.wm, self)
-        self.notifier.name = plugin.name
+        self.notifier = None
+        # processing files, the archiver waits meanwhile
+        self.busy = False
+        # submits a batch while the following one is parsed
+        self.submitter = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix='%s-submit' % plugin.name)
         if plugin.inotify:
+            # imported only by the plugins watching their directory
+            import pyinotify
+            self.__mask = pyinotify.IN_CLOSE_WRITE | pyinotify.IN_MOVED_TO
+            self.wm = pyinotify.WatchManager()
+            self.notifier = pyinotify.ThreadedNotifier(self.wm, self.__process_event)
+            self.notifier.name = plugin.name
             logger.debug('Watching directory "%s" for %s' % (plugin.basedir, plugin.pattern))
             self.notifier.start()
-            self.wm.add_watch(plugin.basedir, pyinotify.IN_CLOSE_WRITE | pyinotify.IN_MOVED_TO)
+            self.wm.add_watch(plugin.basedir, self.__mask)
 
     def run(self):
         logger.debug('Plugin %s thread started' % self.plugin.name)
-        infiles = glob.glob(os.path.join(self.plugin.basedir, self.plugin.pattern))
-        for infile in infiles:
-            self.process_file(infile)
+        while True:
+            infiles = self.queue.get(self.plugin)
+            if infiles is None:
+                break
+            # already processed, when queued again meanwhile
+            infiles = [infile for infile in infiles if os.path.isfile(infile)]
+            self.busy = True
+            claimed = []
+            if self.cluster:
+                infiles = self.__claim(infiles, claimed)
+            try:
+                if self.pool:
+                    self.__parallel(infiles)
+                else:
+                    for infile in infiles:
+                        self.process_file(infile)
+            except Exception:
+                # the thread is not recreated, the files left are queued
+                # again by the next scan
+                logger.exception('Plugin %s cannot process the files queued' % self.plugin.name)
+            finally:
+                self.busy = False
+                # not moved into okdir or kodir, eg. parsing process died
+                for infile in claimed:
+                    if os.path.isfile(infile):
+                        self.cluster.release(infile)
         logger.debug('Plugin %s thread ended' % self.plugin.name)
 
-    def process_file(self, infile):
+    def __claim(self, infiles, claimed):
+        # each file is claimed just before parsing it, the files claimed
+        # first by other nodes are theirs
+        for infile in infiles:
+            infile = self.cluster.claim(infile)
+            if infile:
+                claimed.append(infile)
+                yield infile
+
+    def __parallel(self, infiles):
+        # keep the pool busy parsing the next files while sending in order
+        window = collections.deque()
+        for infile in infiles:
+            if len(window) >= 2 * self.pool.processes:
+                self.process_file(*window.popleft())
+            parsed = None
+            sampled = None
+            if infile not in (self.plugin.okdir, self.plugin.kodir) and os.path.isfile(infile):
+                if self.profiler:
+                    sampled = self.profiler.wanted(self.plugin.name)
+                profile = None if sampled is None else self.profiler.parsefile(self.plugin.name, infile)
+                parsed = self.pool.submit(self.plugin, infile, profile)
+            window.append((infile, parsed, sampled))
+        while window:
+            self.process_file(*window.popleft())
+
+    def process_file(self, infile, parsed=None, sampled=False):
+        try:
+            self.__profiled(infile, parsed, sampled)
+        except Exception:
+            # eg. a plugin bug or an I/O error, the thread goes on with the
+            # next files
+            logger.exception('Cannot process "%s", moving into "%s"' % (infile, self.plugin.kodir))
+            metrics.inc('jackal_files_ko_total', plugin=self.plugin.name)
+            if infile not in (self.plugin.okdir, self.plugin.kodir) and os.path.isfile(infile):
+                try:
+                    os.rename(infile, os.path.join(self.plugin.kodir, os.path.basename(infile)))
+                except OSError as e:
+                    logger.error('Cannot move "%s" into "%s": %s' % (infile, self.plugin.kodir, str(e)))
+
+    def __profiled(self, infile, parsed=None, sampled=False):
+        if not self.profiler:
+            self.__process(infile, parsed)
+            return
+        if parsed is None:
+            sampled = self.profiler.wanted(self.plugin.name)
+        if sampled is None:
+            self.__process(infile, parsed)
+            return
+        self.__seconds = 0
+        profile = cProfile.Profile()
+        # the batches are submitted by another thread
+        self.__profile = cProfile.Profile() if (hasattr(self.plugin, 'iterparseinput') or hasattr(self.plugin, 'iterparse')) and not self.pool else None
+        profile.enable()
+        try:
+            self.__process(infile, parsed)
+        finally:
+            profile.disable()
+            submit = self.__profile
+            self.__profile = None
+            basename = os.path.basename(infile)
+            current = next((path for path in (infile, os.path.join(self.plugin.okdir, basename), os.path.join(self.plugin.kodir, basename)) if os.path.isfile(path)), None)
+            parsefile = self.profiler.parsefile(self.plugin.name, infile) if parsed else None
+            self.profiler.save(self.plugin.name, infile, current, sampled, self.__seconds, [profile, submit], parsefile)
+
+    def __process(self, infile, parsed=None):
         okdir = self.plugin.okdir
         kodir = self.plugin.kodir
         if infile in (okdir, kodir):
             return
-        if os.path.isfile(infile):
-            with open(infile, 'r') as f:
-                buf = f.read()
-            f.close()
-            logger.info('Processing "%s"' % infile)
-        else:
+        if not os.path.isfile(infile):
             logger.error('Cannot open "%s"' % (infile))
             return
+        logger.info('Processing "%s"' % infile)
+        name = self.plugin.name
+        metrics.inc('jackal_files_total', plugin=name)
+        metrics.inc('jackal_bytes_read_total', os.path.getsize(infile), plugin=name)
+        ledger = rest.ledger
+        digest = None
+        if ledger:
+            digest = ledger.digest(infile)
+            if ledger.known(digest):
+                logger.info('Same content already accepted, moving "%s" into "%s"' % (infile, okdir))
+                metrics.inc('jackal_files_ok_total', plugin=name)
+                os.rename(infile, os.path.join(okdir, os.path.basename(infile)))
+                return
+            # the ledger knows the accepted measures, chunks progress is not needed
+            progress = JProgress()
+        else:
+            # streamed batches are numbered after batchsize
+            streamed = not self.pool and (hasattr(self.plugin, 'iterparseinput') or hasattr(self.plugin, 'iterparse'))
+            parsing = ['stream', self.plugin.batchsize] if streamed else ['whole']
+            progress = JProgress(os.path.join(kodir, '%s.chunks' % os.path.basename(infile)), infile, parsing)
+        submitted = None
+        deferred = False
         try:
-            (data, method) = self.plugin.parse(buf)
-        except (IndexError, ValueError, AttributeError) as e:
+            if self.pool:
+                (parts, seconds) = (parsed or self.pool.submit(self.plugin, infile)).result()
+                self.__seconds = seconds
+                self.__parsed(parts, seconds)
+            elif hasattr(self.plugin, 'iterparseinput') or hasattr(self.plugin, 'iterparse'):
+                timer = [0, 0]
+                members = self.__batches(infile)
+                batches = self.__timed(members, timer)
+                try:
+                    submitted = self.__stream(batches, progress)
+                    if not submitted:
+                        deferred = self.__defer(infile, progress, batches)
+                finally:
+                    members.close()
+                    self.__seconds = timer[0]
+                    metrics.inc('jackal_records_total', timer[1], plugin=name)
+                    metrics.observe('jackal_parse_seconds', timer[0], plugin=name)
+            else:
+                start = time.monotonic()
+                parts = []
+                for member in JInput.members(infile, self.plugin.pattern):
+                    with JInput(infile, self.plugin.encoding, config.mmapsize, member) as source:
+                        parts.append(source.parse(self.plugin))
+                self.__seconds = time.monotonic() - start
+                self.__parsed(parts, self.__seconds)
+        except (IndexError, ValueError, AttributeError) + JInput.errors as e:
             logger.error('Cannot parse "%s", moving into "%s" (%s)' % (infile, kodir, str(e)))
-            os.rename(infile, os.path.join(kodir, os.path.basename(infile)))
+            self.__failed(infile, progress)
+            return
+        except concurrent.futures.BrokenExecutor as e:
+            logger.error('Cannot parse "%s", parsing process died (%s)' % (infile, str(e)))
             return
-        if rest.submit(data, method):
+        if submitted is None:
+            for (idx, (data, method)) in enumerate(parts):
+                submitted = self.__submit(data, method, progress)
+                if not submitted:
+                    deferred = self.__defer(infile, progress, parts[idx + 1:])
+                    break
+            else:
+                submitted = True
+        if submitted:
+            progress.clear()
+            if digest:
+                ledger.done(digest, infile)
             logger.info('Moving "%s" into "%s"' % (infile, okdir))
+            metrics.inc('jackal_files_ok_total', plugin=name)
+            os.rename(infile, os.path.join(okdir, os.path.basename(infile)))
+        elif deferred:
+            progress.clear()
+            metrics.inc('jackal_files_queued_total', plugin=name)
+            logger.warning('Cannot send "%s" data to server, queued into outbox, moving into "%s"' % (infile, okdir))
             os.rename(infile, os.path.join(okdir, os.path.basename(infile)))
         else:
             logger.error('Cannot send "%s" data to server, moving into "%s"' % (infile, kodir))
-            os.rename(infile, os.path.join(kodir, os.path.basename(infile)))
+            self.__failed(infile, progress)
+
+    def __stream(self, batches, progress):
+        pending = None
+        try:
+            for (data, method) in batches:
+                if pending and not pending.result():
+                    progress.unsent.append((data, method))
+                    return False
+                pending = self.submitter.submit(self.__submit, data, method, progress)
+        finally:
+            # the chunks of a batch in flight must be tracked by progress
+            if pending:
+                concurrent.futures.wait([pending])
+        return pending.result() if pending else True
 
-    def process_IN_CLOSE_WRITE(self, event):
-        self.__process_event(event)
+    def __timed(self, batches, timer):
+        # parsing time and records of the batches pulled
+        while True:
+            start = time.monotonic()
+            try:
+                (data, method) = next(batches)
+            except StopIteration:
+                return
+            finally:
+                timer[0] += time.monotonic() - start
+            timer[1] += len(data)
+            yield (data, method)
 
-    def process_IN_MOVED_TO(self, event):
-        self.__process_event(event)
+    def __batches(self, infile):
+        # batches of each logical file, the members of zip archives
+        for member in JInput.members(infile, self.plugin.pattern):
+            with JInput(infile, self.plugin.encoding, config.mmapsize, member) as source:
+                batches = source.batches(self.plugin)
+                try:
+                    yield from batches
+                finally:
+                    # the plugin stops reading before the file is closed,
+                    # when the stream is aborted
+                    batches.close()
+
+    def __parsed(self, parts, seconds):
+        metrics.inc('jackal_records_total', sum(len(data) for (data, method) in parts), plugin=self.plugin.name)
+        metrics.observe('jackal_parse_seconds', seconds, plugin=self.plugin.name)
+
+    def __submit(self, data, method, progress):
+        profile = self.__profile
+        if profile:
+            profile.enable()
+        start = time.monotonic()
+        try:
+            return rest.submit(data, method, progress)
+        finally:
+            metrics.observe('jackal_submit_seconds', time.monotonic() - start, plugin=self.plugin.name)
+            if profile:
+                profile.disable()
+
+    def __defer(self, infile, progress, batches=()):
+        # queue what the server did not accept, and what is left to parse:
+        # if the outbox fills up, the file goes to kodir and the entries
+        # already queued are harmless duplicates (409) when it is retried
+        if not self.outbox or not progress.retryable:
+            return False
+        name = os.path.basename(infile)
+        for (data, method) in itertools.chain(progress.unsent, batches):
+            if not self.outbox.put(data, method, name):
+                return False
+        return True
+
+    def __failed(self, infile, progress):
+        kodir = self.plugin.kodir
+        metrics.inc('jackal_files_ko_total', plugin=self.plugin.name)
+        if progress.accepted:
+            logger.error('Server accepted %d of %d chunks of "%s"' % (len(progress.accepted), progress.chunks, infile))
+            progress.save()
+        else:
+            progress.clear()
+        os.rename(infile, os.path.join(kodir, os.path.basename(infile)))
 
     def __process_event(self, event):
-        if not event.dir and event.path == self.plugin.basedir:
-            if fnmatch.fnmatch(event.name, self.plugin.pattern):
+        if event.mask & self.__mask and not event.dir and event.path == self.plugin.basedir:
+            if JInput.matches(event.pathname, self.plugin.pattern):
                 logger.info('Moved file detected: "%s"' % event.pathname)
-                self.process_file(event.pathname)
+                # duplicated events (eg. written then moved) are merged
+                self.queue.put(self.plugin, event.pathname, config.debounce)
 
     def stop(self):
-        if self.notifier.ident:
+        if self.notifier:
             logger.debug('Unwatching directory "%s" for %s' % (self.plugin.basedir, self.plugin.pattern))
             self.notifier.stop()
+        self.submitter.shutdown()
+
+class JBackfill():
+    """ Submits an archive of input files with a configured plugin
+
+    The files under directory matching the plugin pattern are parsed by
+    workers processes and submitted with as many files in flight, paced at
+    rate records per second if set. The files are never moved: the accepted
+    ones are appended to the checkpoint file and skipped when the backfill is
+    run again, the failed ones are retried.
+    """
+
+    interval = 10
+
+    def __init__(self, name, directory, workers=2, rate=0, checkpoint=None):
+        self.name = name
+        self.directory = os.path.realpath(directory)
+        self.workers = max(1, workers)
+        self.rate = rate
+        self.checkpoint = checkpoint or os.path.join(os.getcwd(), '%s-backfill-%s.checkpoint' % (__name__, name))
+        self.plugin = None
+        self.__lock = threading.Lock()
+        self.__done = set()
+        self.__total = [0, 0]
+        self.__sent = [0, 0, 0]
+        self.__failed = []
+        self.__started = None
+
+    def load(self):
+        name = self.name
+        if name not in config.sections():
+            logger.error('Plugin %s not configured' % name)
+            return False
+        try:
+            loaded_mod = __import__('jackal.plugins.%s' % name, fromlist=[name])
+            loaded_class = getattr(loaded_mod, name)
+            loaded_class.clientid = config.get(name, 'clientid')
+        except (ImportError, AttributeError, SyntaxError, configparser.NoOptionError) as e:
+            logger.error('Plugin %s not available: %s' % (name, str(e)))
+            return False
+        # the daemon directories are left alone, neither inside nor containing them
+        basedir = config.get(name, 'basedir', fallback=None)
+        if basedir:
+            for option in ('basedir', 'okdir', 'kodir'):
+                daemondir = config.get(name, option, fallback=None)
+                if not daemondir:
+                    continue
+                # okdir and kodir are relative to basedir
+                daemondir = os.path.realpath(daemondir if option == 'basedir' else os.path.join(basedir, daemondir))
+                if os.path.commonpath([daemondir, self.directory]) in (daemondir, self.directory):
+                    logger.error('Directory %s overlaps the %s %s of plugin %s, backfill an archive directory instead' % (self.directory, option, daemondir, name))
+                    return False
+        loaded_class.name = name
+        loaded_class.pattern = os.path.normpath(config.get(name, 'pattern', fallback='*'))
+        loaded_class.filtr = config.get(name, 'filter', fallback=None)
+        loaded_class.batchsize = config.getint(name, 'batch', fallback=config.batch)
+        loaded_class.encoding = config.get(name, 'encoding', fallback=config.encoding)
+        self.plugin = loaded_class()
+        return True
+
+    def files(self):
+        checkpoint = os.path.realpath(self.checkpoint)
+        for (dirpath, dirnames, filenames) in os.walk(self.directory):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                infile = os.path.join(dirpath, filename)
+                if infile != checkpoint and infile not in self.__done and JInput.matches(infile, self.plugin.pattern):
+                    yield infile
+
+    def run(self):
+        if not self.load():
+            return False
+        if not os.path.isdir(self.directory):
+            logger.error('Directory %s does not exist' % self.directory)
+            return False
+        if os.path.isfile(self.checkpoint):
+            with open(self.checkpoint, 'r') as f:
+                self.__done = set(line.rstrip('\n') for line in f)
+            logger.info('Resuming from "%s", %d files already accepted' % (self.checkpoint, len(self.__done)))
+        infiles = list(self.files())
+        self.__total = [len(infiles), sum(os.path.getsize(infile) for infile in infiles)]
+        logger.info('Backfilling %d files (%.1f MB) of %s with plugin %s, %d workers, %s records/s' % (self.__total[0], self.__total[1] / 1048576.0, self.directory, self.name, self.workers, '%g' % self.rate if self.rate else 'unlimited'))
+        if self.rate:
+            if not rest.throttle:
+                rest.throttle = JThrottle()
+            rest.throttle.limit(self.rate)
+        pool = JPool(self.workers)
+        submitter = concurrent.futures.ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='backfill')
+        # files parsed or sent at the same time, the others wait on disk
+        window = threading.BoundedSemaphore(2 * self.workers)
+        stopped = threading.Event()
+        reporter = threading.Thread(target=self.__reporter, args=(stopped,), name='report', daemon=True)
+        self.__started = time.monotonic()
+        reporter.start()
+        try:
+            with open(self.checkpoint, 'a') as checkpoint:
+                for infile in infiles:
+                    window.acquire()
+                    parsed = pool.submit(self.plugin, infile)
+                    future = submitter.submit(self.__process, infile, parsed, checkpoint)
+                    future.add_done_callback(lambda future: window.release())
+                submitter.shutdown()
+        finally:
+            stopped.set()
+            pool.shutdown()
+        self.report()
+        for infile in self.__failed:
+            logger.error('Backfill of "%s" failed' % infile)
+        return not self.__failed
+
+    def __process(self, infile, parsed, checkpoint):
+        size = os.path.getsize(infile)
+        ledger = rest.ledger
+        digest = None
+        records = 0
+        try:
+            if ledger:
+                digest = ledger.digest(infile)
+                if ledger.known(digest):
+                    parsed.cancel()
+                    logger.info('Same content already accepted, skipping "%s"' % infile)
+                    self.__accepted(infile, size, records, checkpoint)
+                    return
+            (parts, seconds) = parsed.result()
+            records = sum(len(data) for (data, method) in parts)
+            submitted = all(rest.submit(data, method) for (data, method) in parts)
+        except (IndexError, ValueError, AttributeError) + JInput.errors as e:
+            logger.error('Cannot parse "%s" (%s)' % (infile, str(e)))
+            submitted = False
+        except concurrent.futures.BrokenExecutor as e:
+            logger.error('Cannot parse "%s", parsing process died (%s)' % (infile, str(e)))
+            submitted = False
+        except Exception as e:
+            logger.error('Cannot backfill "%s" (%s)' % (infile, str(e)))
+            submitted = False
+        if submitted:
+            if digest:
+                ledger.done(digest, infile)
+            self.__accepted(infile, size, records, checkpoint)
+        else:
+            with self.__lock:
+                self.__failed.append(infile)
+                self.__sent[0] += size
+
+    def __accepted(self, infile, size, records, checkpoint):
+        with self.__lock:
+            # flushed at once, the process may be terminated anytime
+            checkpoint.write('%s\n' % infile)
+            checkpoint.flush()
+            self.__sent[0] += size
+            self.__sent[1] += records
+            self.__sent[2] += 1
+
+    def __reporter(self, stopped):
+        while not stopped.wait(self.interval):
+            self.report()
+
+    def report(self):
+        """ Logs the files sent, the throughput and the remaining time """
+        with self.__lock:
+            (done, records, accepted) = self.__sent
+            files = accepted + len(self.__failed)
+        elapsed = time.monotonic() - self.__started
+        rate = done / elapsed if elapsed else 0
+        eta = datetime.timedelta(seconds=int((self.__total[1] - done) / rate)) if rate else 'unknown'
+        logger.info('Backfill %s: %d/%d files (%d failed), %d records, %.0f records/s, %.2f MB/s, elapsed %s, ETA %s' % (self.name, files, self.__total[0], len(self.__failed), records, records / elapsed if elapsed else 0, rate / 1048576.0, datetime.timedelta(seconds=int(elapsed)), eta))
+
 
 class JWebUpdate():
 
@@ -478,6 +2473,32 @@ class JWebUpdate():
             logger.info('%s already up to date' % __name__)
         return False
 
+# Parsing processes
+
+def parse_init():
+    # the main process handles the signals and terminates the pool
+    for signum in (signal.SIGHUP, signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, signal.SIG_DFL)
+
+def parse_file(plugin, infile, profile=None, encoding='utf-8', mmapsize=0, pattern='*'):
+    # parsed data and method of each logical file and parsing time, the
+    # profile is dumped into a file
+    profiler = None
+    if profile:
+        profiler = cProfile.Profile()
+        profiler.enable()
+    start = time.monotonic()
+    try:
+        parsed = []
+        for member in JInput.members(infile, pattern):
+            with JInput(infile, encoding, mmapsize, member) as source:
+                parsed.append(source.parse(plugin))
+    finally:
+        if profiler:
+            profiler.disable()
+            profiler.dump_stats(profile)
+    return (parsed, time.monotonic() - start)
+
 # Signals handlers
 
 def terminate(signum=None, frame=None):
@@ -490,8 +2511,8 @@ signal.signal(signal.SIGINT, terminate)
 
 # Init main app
 
-def main(argv=None):
-    global config, logger, rest
+def setup(filename):
+    global config, logger, metrics, rest
 
     # Logging setup
     logging.setLoggerClass(JLogger)
@@ -499,14 +2520,49 @@ def main(argv=None):
     logger.info('%s starting up as %s' % (__title__, __name__))
 
     # Check and read config file
+    started = time.monotonic()
     config = JConfig()
-    config.read(os.path.join(os.getcwd(), '%s.ini' % __name__))
+    config.read(filename)
 
     # Logging level setup
     logger.setup()
+    logger.debug('%s configuration read in %.1f ms' % (__title__, (time.monotonic() - started) * 1000))
+
+    # Runtime metrics
+    metrics = JMetrics()
 
     # Init REST APIs
+    started = time.monotonic()
     rest = JRest()
+    logger.debug('%s REST client ready in %.1f ms' % (__title__, (time.monotonic() - started) * 1000))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog=__name__, description=__summary__)
+    parser.add_argument('--profile', type=int, metavar='N', help='profile every Nth file of each plugin')
+    parser.add_argument('--profile-slow', type=float, metavar='SECONDS', help='keep profile and copy of the files parsed in more than SECONDS')
+    parser.add_argument('--profile-dir', metavar='DIRECTORY', help='directory of the profiles')
+    commands = parser.add_subparsers(dest='command', metavar='command')
+    backfill = commands.add_parser('backfill', help='submit the files of an archive directory with a configured plugin, without moving them')
+    backfill.add_argument('plugin', help='configured plugin parsing the files')
+    backfill.add_argument('directory', help='archive directory, walked recursively')
+    backfill.add_argument('--workers', type=int, default=2, help='parsing processes and files submitted at the same time (default 2)')
+    backfill.add_argument('--rate', type=float, default=0, metavar='RECORDS', help='maximum records sent per second (default unlimited)')
+    backfill.add_argument('--checkpoint', metavar='FILE', help='accepted files, skipped when resuming (default %s-backfill-PLUGIN.checkpoint)' % __name__)
+    args = parser.parse_args(argv)
+
+    setup(os.path.join(os.getcwd(), '%s.ini' % __name__))
+
+    # command line overrides configuration file
+    if args.profile is not None:
+        config.profile = args.profile
+    if args.profile_slow is not None:
+        config.profileslow = args.profile_slow
+    if args.profile_dir is not None:
+        config.profiledir = args.profile_dir
+
+    if args.command == 'backfill':
+        backfill = JBackfill(args.plugin, args.directory, args.workers, args.rate, args.checkpoint)
+        sys.exit(0 if backfill.run() else 1)
 
     app = JApp()
     app.run()
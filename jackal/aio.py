@@ -0,0 +1,166 @@
+""" asyncio transport of JRest
+
+Imported only with engine = asyncio: aiohttp and asyncio are slow to import,
+and most installations never need them.
+"""
+
+import asyncio
+import concurrent.futures
+import threading
+import time
+
+import aiohttp
+from requests.packages.urllib3.util.retry import Retry
+
+import jackal
+
+
+class JAsyncClient():
+    """ asyncio transport of JRest
+
+    An event loop thread multiplexes the submissions of every thread over a
+    bounded pool of keep-alive connections. The CSRF token is fetched once for
+    all of them, and the requests are retried like the requests session does
+    (urllib3 Retry: connection errors, read errors and 500/502/504 statuses of
+    idempotent methods, exponential backoff).
+    """
+
+    def __init__(self):
+        self.token = jackal.config.token
+        self.timeout = jackal.config.timeout
+        self.retries = jackal.config.retries
+        self.backoff = jackal.config.backoff
+        self.connections = jackal.config.connections
+        self.auth = None
+        if jackal.config.username and jackal.config.password:
+            self.auth = aiohttp.BasicAuth(jackal.config.username, jackal.config.password)
+        self.__retry = Retry(total=self.retries, status_forcelist=(500, 502, 504))
+        self.tokenttl = jackal.config.tokenttl
+        self.__csrf = None
+        self.__fetched = 0
+        self.__session = None
+        self.__lock = None
+        self.__slots = None
+        self.__executor = None
+        self.__loop = asyncio.new_event_loop()
+        self.__thread = threading.Thread(target=self.__loop.run_forever, name='rest', daemon=True)
+        self.__thread.start()
+
+    def run(self, coroutines):
+        """ Runs the coroutines concurrently, from any other thread """
+        return asyncio.run_coroutine_threadsafe(self.__gather(coroutines), self.__loop).result()
+
+    async def __gather(self, coroutines):
+        return await asyncio.gather(*coroutines)
+
+    def close(self):
+        """ Closes the connections and ends the event loop thread """
+        if self.__session:
+            asyncio.run_coroutine_threadsafe(self.__session.close(), self.__loop).result()
+            self.__session = None
+        self.__loop.call_soon_threadsafe(self.__loop.stop)
+        self.__thread.join()
+        self.__loop.close()
+        if self.__executor:
+            self.__executor.shutdown(wait=False)
+
+    def slot(self):
+        # created in the loop, bounds the requests in flight
+        if not self.__slots:
+            self.__slots = asyncio.Semaphore(self.connections)
+        return self.__slots
+
+    async def blocking(self, function, *args):
+        # eg. JThrottle.acquire, called within a slot: with a thread per slot
+        # the waits never starve the default executor (DNS resolution)
+        if not self.__executor:
+            self.__executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.connections, thread_name_prefix='rest-wait')
+        return await asyncio.get_running_loop().run_in_executor(self.__executor, function, *args)
+
+    def __client(self):
+        if not self.__session:
+            connector = aiohttp.TCPConnector(limit=self.connections, ssl=False, force_close=not jackal.config.keepalive)
+            timeout = aiohttp.ClientTimeout(sock_connect=self.timeout, sock_read=self.timeout)
+            self.__session = aiohttp.ClientSession(connector=connector, timeout=timeout, auth=self.auth, trust_env=True)
+            self.__lock = asyncio.Lock()
+        return self.__session
+
+    async def __request(self, method, url, **kwargs):
+        for attempt in range(self.retries + 1):
+            if attempt:
+                jackal.metrics.inc('jackal_http_retries_total', method=method)
+            if attempt > 1:
+                await asyncio.sleep(min(self.backoff * 2 ** (attempt - 1), Retry.DEFAULT_BACKOFF_MAX))
+            last = attempt == self.retries
+            try:
+                async with self.__client().request(method, url, **kwargs) as response:
+                    text = await response.text()
+            except aiohttp.ClientConnectorError:
+                # like urllib3, connection failures are retried for any method
+                if last:
+                    raise
+                continue
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                if last or method not in Retry.DEFAULT_ALLOWED_METHODS:
+                    raise
+                continue
+            if last or not self.__retry.is_retry(method, response.status):
+                jackal.metrics.inc('jackal_http_responses_total', method=method, status=response.status)
+                return (response.status, response.headers, text)
+
+    async def __get_token(self, stale):
+        # one request for all the submissions waiting for a new token
+        async with self.__lock:
+            if self.__csrf == stale:
+                try:
+                    jackal.metrics.inc('jackal_token_requests_total')
+                    (status, headers, text) = await self.__request('GET', self.token)
+                    jackal.logger.debug('GET %s' % self.token)
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    jackal.logger.error('GET %s %s' % (self.token, str(e) or type(e).__name__))
+                    jackal.metrics.inc('jackal_http_errors_total', method='GET')
+                    return None
+                self.__csrf = headers.get('x-csrf-token')
+                self.__fetched = time.monotonic()
+                jackal.logger.debug('Got token %s' % self.__csrf)
+            return self.__csrf
+
+    async def __renew(self, current):
+        # before it expires, while the other submissions go on with the current one
+        if self.__lock.locked():
+            return current
+        jackal.logger.debug('Renewing token %s' % current)
+        return await self.__get_token(current) or current
+
+    async def submit(self, body, method, url):
+        self.__client()
+        stale = None
+        csrf = self.__csrf
+        if csrf and self.tokenttl and time.monotonic() - self.__fetched > 0.8 * self.tokenttl:
+            csrf = await self.__renew(csrf)
+        for recursion in (False, True):
+            if not csrf:
+                csrf = await self.__get_token(stale)
+                if not csrf:
+                    jackal.logger.error('Server %s forbids GET token requests. Check plugin and server configuration.' % (jackal.config.baseurl))
+                    return False
+            headers = {}
+            headers['X-CSRF-TOKEN'] = csrf
+            headers['Content-Type'] = 'application/json'
+            if jackal.config.gzip:
+                headers['Content-Encoding'] = 'gzip'
+            try:
+                (status, _, text) = await self.__request(method, url, data=body, headers=headers)
+                jackal.logger.debug('%s %s %d bytes' % (method, url, len(body)))
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                jackal.logger.error('%s %s %s' % (method, url, str(e) or type(e).__name__))
+                jackal.metrics.inc('jackal_http_errors_total', method=method)
+                return False
+            if status != 403:
+                break
+            if recursion:
+                jackal.logger.error('Server %s forbids %s requests. Check plugin and server configuration (eg. authentication).' % (jackal.config.baseurl, method))
+            else:
+                stale = csrf
+                csrf = None
+        return (status, text)
@@ -0,0 +1,242 @@
+""" Columnar batch of measures
+
+The plugins produce thousands of records like
+
+    {'client_id': ..., 'at': ..., 'device_id': ..., 'measures': [{'measure_id': ..., 'value': ...}, ...]}
+
+A MeasureBatch keeps them in columns instead: the client id once, the
+timestamps, the device ids and the measure ids interned in tables and
+referenced by index, the values in an array of doubles. Records are built
+only when indexed or iterated, and the batch is serialized directly to the
+measuresmatrix JSON.
+"""
+
+from array import array
+import json
+import math
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+FLOAT = 0
+INT = 1
+OTHER = 2
+
+
+class MeasureBatch():
+
+    __slots__ = ('clientid', 'at', 'device', 'devices', 'deviceidx', 'starts', 'measure', 'names', 'nameidx', 'values', 'kinds', 'others')
+
+    def __init__(self, clientid):
+        self.clientid = clientid
+        self.at = []
+        # records devices, index into the devices table
+        self.device = array('L')
+        self.devices = []
+        self.deviceidx = {}
+        # measures of record i are starts[i]:starts[i + 1]
+        self.starts = array('L', [0])
+        # measures ids, index into the names table
+        self.measure = array('L')
+        self.names = []
+        self.nameidx = {}
+        # values are stored as doubles, ints are flagged to be serialized back
+        # as ints, anything else (eg. dates) is kept apart
+        self.values = array('d')
+        self.kinds = array('b')
+        self.others = {}
+
+    def __intern(self, table, index, value):
+        idx = index.get(value)
+        if idx is None:
+            idx = index[value] = len(table)
+            table.append(value)
+        return idx
+
+    def append(self, at, device_id, measures):
+        """ Appends a record, measures are (measure_id, value) pairs """
+        self.at.append(at)
+        self.device.append(self.__intern(self.devices, self.deviceidx, device_id))
+        for (measure_id, value) in measures:
+            self.measure.append(self.__intern(self.names, self.nameidx, measure_id))
+            if type(value) is float:
+                self.values.append(value)
+                self.kinds.append(FLOAT)
+            elif type(value) is int and -2 ** 53 <= value <= 2 ** 53:
+                self.values.append(value)
+                self.kinds.append(INT)
+            else:
+                self.others[len(self.values)] = value
+                self.values.append(0.0)
+                self.kinds.append(OTHER)
+        self.starts.append(len(self.values))
+
+    def append_rows(self, at, devices, names, values, kinds):
+        """ Appends a record for each timestamp of at and device id of devices,
+        all with the measures names: values holds their doubles row by row (any
+        contiguous buffer of doubles), kinds the kind of each measure
+        (FLOAT or INT)
+        """
+        count = len(names)
+        measure = [self.__intern(self.names, self.nameidx, name) for name in names]
+        first = len(self.values)
+        self.at.extend(at)
+        self.device.extend([self.__intern(self.devices, self.deviceidx, device_id) for device_id in devices])
+        self.starts.extend(range(first + count, first + count * len(at) + 1, count))
+        self.measure.extend(measure * len(at))
+        self.values.frombytes(memoryview(values).cast('B'))
+        self.kinds.extend(list(kinds) * len(at))
+
+    def extend(self, other):
+        devices = [self.__intern(self.devices, self.deviceidx, device_id) for device_id in other.devices]
+        names = [self.__intern(self.names, self.nameidx, measure_id) for measure_id in other.names]
+        offset = len(self.values)
+        self.at.extend(other.at)
+        self.device.extend(devices[idx] for idx in other.device)
+        self.starts.extend(start + offset for start in other.starts[1:])
+        self.measure.extend(names[idx] for idx in other.measure)
+        self.values.extend(other.values)
+        self.kinds.extend(other.kinds)
+        self.others.update((idx + offset, value) for (idx, value) in other.others.items())
+
+    def __repr__(self):
+        return self.dumps().decode('utf-8')
+
+    def __len__(self):
+        return len(self.at)
+
+    def __bool__(self):
+        return bool(self.at)
+
+    def value(self, idx):
+        kind = self.kinds[idx]
+        if kind == FLOAT:
+            return self.values[idx]
+        if kind == INT:
+            return int(self.values[idx])
+        return self.others[idx]
+
+    def measures(self, record):
+        """ (measure_id, value) pairs of a record """
+        return [(self.names[self.measure[idx]], self.value(idx)) for idx in range(self.starts[record], self.starts[record + 1])]
+
+    def record(self, record):
+        measures = [{'measure_id': measure_id, 'value': value} for (measure_id, value) in self.measures(record)]
+        return {'client_id': self.clientid, 'at': self.at[record], 'device_id': self.devices[self.device[record]], 'measures': measures}
+
+    def records(self):
+        for record in range(len(self)):
+            yield self.record(record)
+
+    def __iter__(self):
+        return self.records()
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            (start, stop, step) = key.indices(len(self))
+            if step != 1:
+                return self.select(range(start, stop, step))
+            return self.__slice(start, max(start, stop))
+        if key < 0:
+            key += len(self)
+        if not 0 <= key < len(self):
+            raise IndexError('MeasureBatch index out of range')
+        return self.record(key)
+
+    def __share(self):
+        batch = MeasureBatch(self.clientid)
+        # tables are shared: they only grow, so the indexes stay valid
+        batch.devices = self.devices
+        batch.deviceidx = self.deviceidx
+        batch.names = self.names
+        batch.nameidx = self.nameidx
+        return batch
+
+    def __slice(self, start, stop):
+        batch = self.__share()
+        first = self.starts[start]
+        last = self.starts[stop]
+        batch.at = self.at[start:stop]
+        batch.device = self.device[start:stop]
+        batch.starts = array('L', (offset - first for offset in self.starts[start:stop + 1]))
+        batch.measure = self.measure[first:last]
+        batch.values = self.values[first:last]
+        batch.kinds = self.kinds[first:last]
+        batch.others = {idx - first: value for (idx, value) in self.others.items() if first <= idx < last}
+        return batch
+
+    def select(self, records):
+        """ New batch with the given records only """
+        batch = self.__share()
+        for record in records:
+            batch.at.append(self.at[record])
+            batch.device.append(self.device[record])
+            for idx in range(self.starts[record], self.starts[record + 1]):
+                if self.kinds[idx] == OTHER:
+                    batch.others[len(batch.values)] = self.others[idx]
+                batch.measure.append(self.measure[idx])
+                batch.values.append(self.values[idx])
+                batch.kinds.append(self.kinds[idx])
+            batch.starts.append(len(batch.values))
+        return batch
+
+    def pieces(self):
+        """ measuresmatrix JSON of each record """
+        clientid = json.dumps(self.clientid)
+        devices = [json.dumps(device) for device in self.devices]
+        names = ['{"measure_id": %s, "value": ' % json.dumps(name) for name in self.names]
+        values = self.values
+        kinds = self.kinds
+        records = []
+        for record in range(len(self.at)):
+            measures = []
+            for idx in range(self.starts[record], self.starts[record + 1]):
+                kind = kinds[idx]
+                if kind == FLOAT and math.isfinite(values[idx]):
+                    value = float.__repr__(values[idx])
+                elif kind == INT:
+                    value = int.__repr__(int(values[idx]))
+                else:
+                    value = json.dumps(self.value(idx))
+                measures.append('%s%s}' % (names[self.measure[idx]], value))
+            records.append('{"client_id": %s, "at": %s, "device_id": %s, "measures": [%s]}' % (clientid, json.dumps(self.at[record]), devices[self.device[record]], ', '.join(measures)))
+        return records
+
+    def dumps(self):
+        """ measuresmatrix JSON, as bytes """
+        return join(self.pieces())
+
+
+def join(pieces):
+    """ JSON array of the JSON pieces, as bytes """
+    return ('[%s]' % ', '.join(pieces)).encode('utf-8')
+
+
+def dumps(data):
+    """ measuresmatrix JSON of a MeasureBatch or of a list of records, as bytes """
+    if isinstance(data, MeasureBatch):
+        return data.dumps()
+    if orjson:
+        try:
+            return orjson.dumps(data)
+        except TypeError:
+            pass
+    return json.dumps(data).encode('utf-8')
+
+
+def entries(data):
+    """ (client_id, at, device_id, (measure_id, value) pairs) of each record
+    of a MeasureBatch or of a list
+    """
+    if isinstance(data, MeasureBatch):
+        return ((data.clientid, data.at[record], data.devices[data.device[record]], data.measures(record)) for record in range(len(data)))
+    return ((record['client_id'], record['at'], record['device_id'], [(measure['measure_id'], measure['value']) for measure in record['measures']]) for record in data)
+
+
+def pieces(data):
+    """ measuresmatrix JSON of each record of a MeasureBatch or of a list """
+    if isinstance(data, MeasureBatch):
+        return data.pieces()
+    return [json.dumps(record) for record in data]
@@ -0,0 +1,58 @@
+""" Quarter-hour curves expansion
+
+A curve is a day of quarter-hour values (the E1...E96 attributes of the POD
+Ea/Er elements) or a row of consecutive quarter-hour values (Deval CSV). Each
+curve is converted at once into the list of its timestamps and an array of
+doubles, which the plugins append to their MeasureBatch as a block of
+records (MeasureBatch.append_rows), without building the records one by one.
+"""
+
+from array import array
+import functools
+
+from jackal.timestamp import timestamps
+
+
+@functools.lru_cache(maxsize=256)
+def indexes(names):
+    # quarter-hour index (0 based) of attribute names E1...E100
+    return tuple(int(name[1:]) - 1 for name in names)
+
+
+def day(date, columns, is_dst=False):
+    """ Timestamps and values of the quarter-hour attributes of a day
+
+    The columns are dicts of attribute names and values: all of them must
+    have the attributes of the first one. Returns the timestamps and the
+    doubles of the columns at each timestamp, row by row.
+    """
+    names = tuple(columns[0])
+    quarters = indexes(names)
+    table = timestamps.quarters(date)
+    if table is not None and all(0 <= index < 96 for index in quarters):
+        stamps = [table[index] for index in quarters]
+    else:
+        stamps = [timestamps.quarter(date, index, is_dst) for index in quarters]
+    return stamps, array('d', [float(column[name]) for name in names for column in columns])
+
+
+def row(dt, cells):
+    """ Timestamps and values of the numeric cells of a row of quarter-hours
+
+    The first cell is at dt, each following one 15 minutes later: the cells
+    that are not numbers are skipped.
+    """
+    stamps = timestamps.series(dt, len(cells))
+    try:
+        return stamps, array('d', [float(cell) for cell in cells])
+    except ValueError:
+        pass
+    valid = []
+    values = array('d')
+    for (stamp, cell) in zip(stamps, cells):
+        try:
+            values.append(float(cell))
+        except ValueError:
+            continue
+        valid.append(stamp)
+    return valid, values
@@ -1,36 +1,38 @@
 import csv
-from datetime import datetime, timedelta
-from tzlocal import get_localzone
+from datetime import datetime
+from jackal import curve
+from jackal.batch import FLOAT, MeasureBatch
+from jackal.timestamp import timestamps
 
 class deval():
 
     def __init__(self):
         self.clientid = getattr(self, 'clientid', '-1')
+        self.batchsize = getattr(self, 'batchsize', 10000)
 
     def parse(self, buf):
-        lines = csv.reader(buf.splitlines(), delimiter=';')
-        lines = list(lines)
-        requests = []
+        requests = MeasureBatch(self.clientid)
+        method = 'POST'
+        for (batch, method) in self.iterparse(buf.splitlines()):
+            requests.extend(batch)
+        return requests, method
+
+    def iterparse(self, f):
+        lines = csv.reader(f, delimiter=';')
+        requests = MeasureBatch(self.clientid)
         method = 'POST'
         for row in lines:
             (pod, num, measure_id, date, time) = row[0:5]
             dt = datetime.strptime('%s %s' % (date, time), '%d.%m.%y %H:%M')
-            td = timedelta()
-            tz = get_localzone()
-            dst = tz.localize(dt).dst()
+            dst = timestamps.dst(dt)
             self.__validate(date, time, len(row[5:]), dst)
-            for col in row[5:]:
-                try:
-                    ts = tz.normalize(tz.localize(dt) + td).isoformat()
-                    measures = []
-                    measures.append({'measure_id': measure_id, 'value': float(col)})
-                    json = {'client_id': self.clientid, 'at': ts, 'device_id': pod, 'measures': measures}
-                    requests.append(json)
-                except ValueError:
-                    continue
-                finally:
-                    td += timedelta(minutes=15)
-        return requests, method
+            (stamps, values) = curve.row(dt, row[5:])
+            requests.append_rows(stamps, [pod] * len(stamps), (measure_id,), values, (FLOAT,))
+            if len(requests) >= self.batchsize:
+                yield requests, method
+                requests = MeasureBatch(self.clientid)
+        if requests:
+            yield requests, method
 
     def __validate(self, date, time, length, dst):
         if time not in ('00:15', '02:15'):
@@ -1,105 +1,187 @@
-from datetime import datetime, timedelta
+from datetime import datetime
 from lxml import etree, objectify
-from tzlocal import get_localzone
+from jackal import curve
+from jackal.batch import FLOAT, MeasureBatch
+from jackal.timestamp import timestamps
 import re
 import os
 
+# decimal separator
+COMMA = re.compile(r'(\d+),(\d+)')
+# bytes read at a time by the streaming parser
+CHUNK = 1048576
+
 class pod():
 
     def __init__(self):
         self.clientid = getattr(self, 'clientid', '-1')
-        self.pods = []
+        self.batchsize = getattr(self, 'batchsize', 10000)
+        self.pods = set()
         # PODs list filter
         if self.filtr and os.path.isfile(self.filtr):
             with open(self.filtr, 'r') as f:
                 buf = f.read()
             f.close()
-            self.pods = list(filter(None, buf.splitlines()))
+            self.pods = set(filter(None, buf.splitlines()))
 
     def parse(self, buf):
         # delete xml header
         buf = re.sub(r'<\?xml.*\?>', '', buf)
-        # replaces decimal separator
-        buf = re.sub(r'(\d+),(\d+)', '\\1.\\2', buf)
         try:
             parser = objectify.makeparser(huge_tree=True, recover=True)
             tree = objectify.fromstring(buf, parser=parser)
         except etree.XMLSyntaxError as e:
             raise ValueError(e)
+        return self.__tree(tree)
+
+    def parseinput(self, source):
+        # the bytes go straight to lxml, decoded as the XML header declares
+        try:
+            parser = objectify.makeparser(huge_tree=True, recover=True)
+            tree = objectify.parse(source.stream(), parser=parser).getroot()
+        except etree.XMLSyntaxError as e:
+            raise ValueError(e)
+        if tree is None:
+            raise ValueError('Invalid format: empty document')
+        return self.__tree(tree)
+
+    def iterparseinput(self, source):
+        # one POD element at a time, the file read once: the Motivazione is
+        # the same for all the PODs of a flow, the method is the one of the
+        # first POD element wanted (POST without Motivazione)
+        method = None
+        parsed = set()
+        requests = MeasureBatch(self.clientid)
+        for child in self.__children(source):
+            wanted = len(parsed)
+            found = self.__element(child, parsed, requests)
+            if method is None and len(parsed) > wanted:
+                method = found or 'POST'
+            if len(requests) >= self.batchsize:
+                yield requests, method
+                requests = MeasureBatch(self.clientid)
+        if requests:
+            yield requests, method
+
+    def __children(self, source):
+        # children of the root, removed from the tree once processed
+        parser = etree.XMLPullParser(events=('start', 'end'), huge_tree=True, recover=True, remove_blank_text=True)
+        parser.set_element_class_lookup(objectify.ObjectifyElementClassLookup())
+        stream = source.stream()
+        depth = 0
+        root = None
+        try:
+            while True:
+                chunk = stream.read(CHUNK)
+                if chunk:
+                    parser.feed(chunk)
+                else:
+                    parser.close()
+                for (event, element) in parser.read_events():
+                    if event == 'start':
+                        if depth == 0:
+                            root = element
+                        depth += 1
+                        continue
+                    depth -= 1
+                    if depth == 1:
+                        yield element
+                        root.remove(element)
+                if not chunk:
+                    break
+        except etree.XMLSyntaxError as e:
+            raise ValueError(e)
+        if root is None:
+            raise ValueError('Invalid format: empty document')
 
-        parsed = []
-        requests = []
+    def __tree(self, tree):
+        parsed = set()
+        requests = MeasureBatch(self.clientid)
         method = 'POST'
         for child in tree.iterchildren():
-            measures = []
-            if child.tag == 'IdentificativiFlusso':
-                continue
-            Pod = str(child.Pod)
-            if self.pods and Pod not in self.pods or Pod in parsed:
-                continue
-            parsed.append(Pod)
-            if hasattr(child, 'DataMisura'):
-                DataMisura = str(child.DataMisura)
-                dt = datetime.strptime(DataMisura, '%d/%m/%Y')
-            if hasattr(child, 'MeseAnno'):
-                MeseAnno = str(child.MeseAnno)
-                dt = datetime.strptime('01/%s' % MeseAnno, '%d/%m/%Y')
-            tz = get_localzone()
-            ts = tz.normalize(tz.localize(dt)).isoformat()
-
-            if hasattr(child, 'Motivazione'):
-                Motivazione = int(child.Motivazione)
-                if Motivazione == 1:
-                    method = 'POST'
-                if Motivazione == 2:
-                    method = 'PUT'
-                if Motivazione == 3:
-                    method = 'DELETE'
-
-            if hasattr(child, 'DatiPdp'):
-                self.__append(measures, 'PotDisp', self.__attr(child.DatiPdp, 'PotDisp', 'float'))
-                self.__append(measures, 'Tensione', self.__attr(child.DatiPdp, 'Tensione', 'float'))
-
-            if hasattr(child, 'Consumo'):
-                self.__append(measures, 'EaM', self.__attr(child.Consumo, 'EaM', 'float'))
-                self.__append(measures, 'DataInizioPeriodo', self.__attr(child.Consumo, 'DataInizioPeriodo', 'date'))
-
-            eaer = []
-            if hasattr(child, 'Curva'):
-                if self.__attr(child.Curva, 'TipoDato', 'str') == 'S':
-                    continue
-                if self.__attr(child.Curva, 'Validato', 'str') == 'N':
-                    continue
-                eaer = self.__eaer(child.Curva, dt, Pod)
-
-            if hasattr(child, 'Misura'):
-                if self.__attr(child.Misura, 'TipoDato', 'str') == 'S':
-                    continue
-                if self.__attr(child.Misura, 'Validato', 'str') == 'N':
-                    continue
-                self.__append(measures, 'PotMax', self.__attr(child.Misura, 'PotMax', 'float'))
-                self.__append(measures, 'EaF1', self.__attr(child.Misura, 'EaF1', 'float'))
-                self.__append(measures, 'EaF2', self.__attr(child.Misura, 'EaF2', 'float'))
-                self.__append(measures, 'EaF3', self.__attr(child.Misura, 'EaF3', 'float'))
-                self.__append(measures, 'ErF1', self.__attr(child.Misura, 'ErF1', 'float'))
-                self.__append(measures, 'ErF2', self.__attr(child.Misura, 'ErF2', 'float'))
-                self.__append(measures, 'ErF3', self.__attr(child.Misura, 'ErF3', 'float'))
-                self.__append(measures, 'PotF1', self.__attr(child.Misura, 'PotF1', 'float'))
-                self.__append(measures, 'PotF2', self.__attr(child.Misura, 'PotF2', 'float'))
-                self.__append(measures, 'PotF3', self.__attr(child.Misura, 'PotF3', 'float'))
-                eaer = self.__eaer(child.Misura, dt, Pod)
-
-            json = {'client_id': self.clientid, 'at': ts, 'device_id': Pod, 'measures': measures}
-            requests.append(json)
-            requests += eaer
+            method = self.__element(child, parsed, requests) or method
         return (requests, method)
 
+    def __wanted(self, child, parsed):
+        # the first element of each POD, if in the filter
+        if child.tag == 'IdentificativiFlusso':
+            return False
+        Pod = str(child.Pod)
+        if self.pods and Pod not in self.pods or Pod in parsed:
+            return False
+        parsed.add(Pod)
+        return True
+
+    def __method(self, child):
+        if hasattr(child, 'Motivazione'):
+            Motivazione = int(child.Motivazione)
+            if Motivazione == 1:
+                return 'POST'
+            if Motivazione == 2:
+                return 'PUT'
+            if Motivazione == 3:
+                return 'DELETE'
+        return None
+
+    def __element(self, child, parsed, requests):
+        # appends the records of a POD element, returns its method if any
+        if not self.__wanted(child, parsed):
+            return None
+        Pod = str(child.Pod)
+        measures = []
+        if hasattr(child, 'DataMisura'):
+            DataMisura = str(child.DataMisura)
+            dt = datetime.strptime(DataMisura, '%d/%m/%Y')
+        if hasattr(child, 'MeseAnno'):
+            MeseAnno = str(child.MeseAnno)
+            dt = datetime.strptime('01/%s' % MeseAnno, '%d/%m/%Y')
+        ts = timestamps.localize(dt)
+
+        method = self.__method(child)
+
+        if hasattr(child, 'DatiPdp'):
+            self.__append(measures, 'PotDisp', self.__attr(child.DatiPdp, 'PotDisp', 'float'))
+            self.__append(measures, 'Tensione', self.__attr(child.DatiPdp, 'Tensione', 'float'))
+
+        if hasattr(child, 'Consumo'):
+            self.__append(measures, 'EaM', self.__attr(child.Consumo, 'EaM', 'float'))
+            self.__append(measures, 'DataInizioPeriodo', self.__attr(child.Consumo, 'DataInizioPeriodo', 'date'))
+
+        eaer = []
+        if hasattr(child, 'Curva'):
+            if self.__attr(child.Curva, 'TipoDato', 'str') == 'S':
+                return method
+            if self.__attr(child.Curva, 'Validato', 'str') == 'N':
+                return method
+            eaer = self.__eaer(child.Curva, dt, Pod)
+
+        if hasattr(child, 'Misura'):
+            if self.__attr(child.Misura, 'TipoDato', 'str') == 'S':
+                return method
+            if self.__attr(child.Misura, 'Validato', 'str') == 'N':
+                return method
+            self.__append(measures, 'PotMax', self.__attr(child.Misura, 'PotMax', 'float'))
+            self.__append(measures, 'EaF1', self.__attr(child.Misura, 'EaF1', 'float'))
+            self.__append(measures, 'EaF2', self.__attr(child.Misura, 'EaF2', 'float'))
+            self.__append(measures, 'EaF3', self.__attr(child.Misura, 'EaF3', 'float'))
+            self.__append(measures, 'ErF1', self.__attr(child.Misura, 'ErF1', 'float'))
+            self.__append(measures, 'ErF2', self.__attr(child.Misura, 'ErF2', 'float'))
+            self.__append(measures, 'ErF3', self.__attr(child.Misura, 'ErF3', 'float'))
+            self.__append(measures, 'PotF1', self.__attr(child.Misura, 'PotF1', 'float'))
+            self.__append(measures, 'PotF2', self.__attr(child.Misura, 'PotF2', 'float'))
+            self.__append(measures, 'PotF3', self.__attr(child.Misura, 'PotF3', 'float'))
+            eaer = self.__eaer(child.Misura, dt, Pod)
+
+        requests.append(ts, Pod, measures)
+        if eaer:
+            requests.extend(eaer)
+        return method
 
     def __append(self, lst, name, value):
-        lst.append({'measure_id': name, 'value': value}) if value is not None else None
+        lst.append((name, value)) if value is not None else None
 
     def __eaer(self, tree, dt, pod):
-        requests = []
+        requests = MeasureBatch(self.clientid)
         # e.tag -> Ea or Er
         # e.text -> day of month
         # e.attrib -> quarter of an hour datas
@@ -112,36 +194,43 @@ class pod():
                 if 'Dst' in child.attrib:
                     dst = child.attrib['Dst']
                 eas[day] = eas.setdefault(day, {})
-                eas[day][dst] = child.attrib
-                eas[day][dst].pop('Dst', None)
+                eas[day][dst] = self.__values(child.attrib)
             if child.tag == 'Er':
                 day = child.text
                 dst = '0'
                 if 'Dst' in child.attrib:
                     dst = child.attrib['Dst']
                 ers[child.text] = ers.setdefault(child.text, {})
-                ers[child.text][dst] = child.attrib
-                ers[child.text][dst].pop('Dst', None)
+                ers[child.text][dst] = self.__values(child.attrib)
 
-        tz = get_localzone()
         for day in eas:
             dt = datetime(dt.year, dt.month, int(day))
             for dst in eas[day]:
+                if dst not in ers.get(day, {}):
+                    raise ValueError('Invalid format: missing Er for Dst %s day %s' % (dst, day))
                 self.__validate(dst, day, len(eas[day][dst]), 'Ea')
                 self.__validate(dst, day, len(ers[day][dst]), 'Er')
-                for e in eas[day][dst]:
-                    td = (int(e[1:]) - 1) * timedelta(minutes=15)
-                    ts = tz.normalize(tz.localize(dt + td, is_dst = bool(dst != '3'))).isoformat()
-                    ea = eas[day][dst][e]
-                    er = ers[day][dst][e]
-                    measures = []
-                    measures.append({'measure_id': 'Ea', 'value': float(ea)})
-                    measures.append({'measure_id': 'Er', 'value': float(er)})
-                    json = {'client_id': self.clientid, 'at': ts, 'device_id': pod, 'measures': measures}
-                    requests.append(json)
+                (stamps, values) = curve.day(dt, (eas[day][dst], ers[day][dst]), is_dst = bool(dst != '3'))
+                requests.append_rows(stamps, [pod] * len(stamps), ('Ea', 'Er'), values, (FLOAT, FLOAT))
         return requests
 
 
+    def __decimal(self, value):
+        # like replacing r'(\d+),(\d+)' in the whole file, as fast as possible
+        # for the usual single comma
+        if ',' not in value:
+            return value
+        (head, sep, tail) = value.partition(',')
+        if ',' in tail:
+            return COMMA.sub('\\1.\\2', value)
+        if head[-1:].isdigit() and tail[:1].isdigit():
+            return '%s.%s' % (head, tail)
+        return value
+
+    def __values(self, attrib):
+        # quarter-hour values of Ea/Er, without Dst
+        return {name: self.__decimal(value) for (name, value) in attrib.items() if name != 'Dst'}
+
     def __attr(self, tree, name, typ):
         if hasattr(tree, name):
             value = getattr(tree, name)
@@ -150,9 +239,8 @@ class pod():
             if typ == 'int':
                 value = int(value)
             if typ == 'float':
-                value = float(value)
+                value = float(self.__decimal(str(value)))
             if typ == 'date':
-                tz = get_localzone()
                 value = str(value)
                 if re.search('[0-3][0-9]/[0-1][0-9]/\d{4}', value):
                     pass
@@ -161,7 +249,7 @@ class pod():
                 else:
                     raise ValueError('Invalid format for attribute %s: %s' % (name, value))
                 dt = datetime.strptime(value, '%d/%m/%Y')
-                value = tz.normalize(tz.localize(dt)).isoformat()
+                value = timestamps.localize(dt)
             return value
 
     #    Dst: 0=no DST     - potenziali 96 quarti d'ora;
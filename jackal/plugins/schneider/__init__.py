@@ -1,29 +1,107 @@
 import csv
 import datetime
-from dateutil import tz
+import itertools
+from jackal.batch import FLOAT, INT, MeasureBatch
+from jackal.timestamp import timestamps
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# separators of the 'YYYY-MM-DD HH:MM:SS' local time stamps
+SEPARATORS = {4: '-', 7: '-', 10: ' ', 13: ':', 16: ':'}
+DIGITS = [idx for idx in range(19) if idx not in SEPARATORS]
 
 class schneider():
 
     def __init__(self):
        self.clientid = getattr(self, 'clientid', '-1')
+       self.batchsize = getattr(self, 'batchsize', 10000)
 
     def parse(self, buf):
-        lines = csv.reader(buf.splitlines(), delimiter=';')
-        lines = list(lines)
-        requests = []
+        requests = MeasureBatch(self.clientid)
+        method = 'POST'
+        for (batch, method) in self.iterparse(buf.splitlines()):
+            requests.extend(batch)
+        return requests, method
+
+    def iterparse(self, f):
+        lines = csv.reader(f, delimiter=';')
+        header = list(itertools.islice(lines, 7))
         method = 'POST'
-        (gwname, gwns, gwip, gwmac, devname, devid, devtyp, devtypname, time, cron) = lines[1]
-        bulks = lines[4][3:]
-        for row in lines[7:]:
+        (gwname, gwns, gwip, gwmac, devname, devid, devtyp, devtypname, time, cron) = header[1]
+        bulks = header[4][3:]
+        rows = []
+        for row in lines:
+            rows.append(row)
+            if len(rows) >= self.batchsize:
+                yield self.__batch(rows, devid, bulks), method
+                rows = []
+        if rows:
+            yield self.__batch(rows, devid, bulks), method
+
+    def __batch(self, rows, devid, bulks):
+        requests = None
+        if numpy is not None:
+            requests = self.__columns(rows, devid, bulks)
+        if requests is None:
+            requests = self.__rows(rows, devid, bulks)
+        return requests
+
+    def __rows(self, rows, devid, bulks):
+        requests = MeasureBatch(self.clientid)
+        for row in rows:
             (err, diff, dt) = row[0:3]
             row = [float(x.replace(",", ".")) for x in row[3:]]
             dt = datetime.datetime.strptime(dt, '%Y-%m-%d %H:%M:%S')
-            dt = dt.replace(tzinfo=tz.tzoffset(None, int(diff)*60))
-            ts = dt.isoformat()
+            ts = timestamps.fixed(dt, int(diff))
             measures = []
-            measures.append({'measure_id': 'Errore', 'value': int(err)})
+            measures.append(('Errore', int(err)))
             for id in range(0, len(row)):
-                measures.append({'measure_id': bulks[id], 'value': row[id]})
-            json = {'client_id': self.clientid, 'at': ts, 'device_id': int(devid), 'measures': measures}
-            requests.append(json)
-        return requests, method
+                measures.append((bulks[id], row[id]))
+            requests.append(ts, int(devid), measures)
+        return requests
+
+    def __columns(self, rows, devid, bulks):
+        # the whole block at once, None if anything differs from the usual
+        # layout: __rows() then gives the same records (or errors) row by row
+        lengths = set(map(len, rows))
+        if len(lengths) != 1:
+            return None
+        count = lengths.pop() - 3
+        if not 0 < count <= len(bulks):
+            return None
+        try:
+            device = int(devid)
+            errors = {err: int(err) for err in set(row[0] for row in rows)}
+            suffixes = {diff: timestamps.suffix(int(diff)) for diff in set(row[1] for row in rows)}
+            for date in set(row[2][:10] for row in rows):
+                datetime.date.fromisoformat(date)
+            # decimal commas replaced in bulk, parsed like float()
+            cells = ';'.join([';'.join(row[3:]) for row in rows]).replace(',', '.').split(';')
+            if len(cells) != len(rows) * count:
+                return None
+            values = numpy.array(cells, dtype=numpy.float64).reshape(len(rows), count)
+        except ValueError:
+            return None
+        if any(not -2 ** 53 <= err <= 2 ** 53 for err in errors.values()):
+            return None
+        stamps = numpy.array([row[2] for row in rows])
+        if stamps.dtype != numpy.dtype('<U19'):
+            return None
+        codes = stamps.view(numpy.uint32).reshape(len(rows), 19)
+        digits = codes[:, DIGITS] - ord('0')
+        if (digits > 9).any() or any((codes[:, idx] != ord(separator)).any() for (idx, separator) in SEPARATORS.items()):
+            return None
+        if (digits[:, 8] * 10 + digits[:, 9] > 23).any() or (digits[:, 10] > 5).any() or (digits[:, 12] > 5).any():
+            return None
+        # ISO 8601 local time, followed by the UTC offset of the row
+        codes[:, 10] = ord('T')
+        at = [stamp + suffixes[row[1]] for (stamp, row) in zip(stamps.tolist(), rows)]
+        matrix = numpy.empty((len(rows), count + 1), dtype=numpy.float64)
+        matrix[:, 0] = [errors[row[0]] for row in rows]
+        matrix[:, 1:] = values
+        requests = MeasureBatch(self.clientid)
+        requests.append_rows(at, [device] * len(at), ['Errore'] + bulks[:count], matrix, [INT] + [FLOAT] * count)
+        return requests
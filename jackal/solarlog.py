@@ -0,0 +1,134 @@
+""" Solar-Log CSV exports
+
+A Solar-Log 1000/2000 export has a row every few minutes: the local date and
+time, then a block of columns for each inverter, its number (WR) followed by
+its measures. The header names these columns, so it is read once and
+compiled into a plan: for each inverter block the column of its number and,
+for each measure, its column, its name and its scale factor. The rows are
+then converted by the plan alone.
+
+Rows as wide as the header follow its plan. Headers that do not name the
+blocks (or name unknown measures), and rows of another width, fall back to
+the fixed layout of the plugin: a block of WR and its names repeated up to
+the end of the row.
+"""
+
+from array import array
+import csv
+import datetime
+
+from jackal.batch import FLOAT, INT, MeasureBatch
+from jackal.timestamp import timestamps
+
+# measures known in the headers and their scale factors
+MEASURES = {
+    # W -> KW
+    'Pac': 0.001,
+    # Wh -> KWh
+    'DaySum': 0.001,
+    'Status': 1,
+    'Error': 1,
+    'Pdc1': 1,
+    'Pdc2': 1,
+    'Pdc3': 1,
+    'Udc1': 1,
+    'Udc2': 1,
+    'Udc3': 1,
+    'Temp': 1,
+    'Uac': 1,
+}
+INVERTER = 'WR'
+
+
+class JSolarLog():
+
+    # measures of each inverter block in the fixed layout
+    names = []
+
+    def __init__(self):
+        self.clientid = getattr(self, 'clientid', '-1')
+        self.batchsize = getattr(self, 'batchsize', 10000)
+
+    def parse(self, buf):
+        requests = MeasureBatch(self.clientid)
+        method = 'POST'
+        for (batch, method) in self.iterparse(buf.splitlines()):
+            requests.extend(batch)
+        return requests, method
+
+    def plan(self, header):
+        """ Inverter blocks of the header, columns counted after date and time
+
+        Returns a list of (inverter column, [(column, name, scale), ...]), or
+        None if the header does not describe the blocks.
+        """
+        header = [name.strip().lstrip('#') for name in header[2:]]
+        if not header or header[0] != INVERTER:
+            return None
+        blocks = []
+        for (column, name) in enumerate(header):
+            if name == INVERTER:
+                blocks.append((column, []))
+            elif name in MEASURES:
+                blocks[-1][1].append((column, name, MEASURES[name]))
+            else:
+                return None
+        if not all(measures for (column, measures) in blocks):
+            return None
+        return blocks
+
+    def fixed(self, width):
+        """ Inverter blocks of the fixed layout in a row of width columns """
+        size = len(self.names) + 1
+        blocks = []
+        for offset in range(0, width, size):
+            blocks.append((offset, [(offset + idx + 1, name, MEASURES.get(name, 1)) for (idx, name) in enumerate(self.names)]))
+        return blocks
+
+    def compile(self, blocks):
+        """ The blocks as (inverter columns, names, kinds, [(column, scale), ...])
+
+        The names and kinds are those of every block, the columns and scales
+        those of all the measures of a row. The names are None if the blocks do
+        not have the same measures.
+        """
+        inverters = [inverter for (inverter, measures) in blocks]
+        if not blocks:
+            return (inverters, None, None, [])
+        columns = [(column, scale) for (inverter, measures) in blocks for (column, name, scale) in measures]
+        names = [[name for (column, name, scale) in measures] for (inverter, measures) in blocks]
+        if any(measures != names[0] for measures in names):
+            return (inverters, None, None, columns)
+        kinds = [INT if scale == 1 else FLOAT for (column, name, scale) in blocks[0][1]]
+        return (inverters, names[0], kinds, columns)
+
+    def iterparse(self, f):
+        lines = csv.reader(f, delimiter=';')
+        header = next(lines, None) or []
+        # layouts by number of columns after date and time
+        layouts = {}
+        blocks = self.plan(header)
+        if blocks:
+            layouts[len(header) - 2] = (blocks, self.compile(blocks))
+        requests = MeasureBatch(self.clientid)
+        method = 'POST'
+        for row in lines:
+            (date, time) = row[0:2]
+            datestring = '%s %s' % (date, time)
+            dt = datetime.datetime.strptime(datestring, '%d/%m/%y %H:%M:%S')
+            ts = timestamps.wall(dt)
+            values = [int(x) for x in row[2:]]
+            if len(values) not in layouts:
+                blocks = self.fixed(len(values))
+                layouts[len(values)] = (blocks, self.compile(blocks))
+            (blocks, (inverters, names, kinds, columns)) = layouts[len(values)]
+            if names is not None and values and -2 ** 53 <= min(values) and max(values) <= 2 ** 53:
+                requests.append_rows([ts] * len(inverters), [values[inverter] for inverter in inverters], names, array('d', [values[column] * scale for (column, scale) in columns]), kinds)
+            else:
+                for (inverter, measures) in blocks:
+                    requests.append(ts, values[inverter], [(name, values[column] * scale) for (column, name, scale) in measures])
+            if len(requests) >= self.batchsize:
+                yield requests, method
+                requests = MeasureBatch(self.clientid)
+        if requests:
+            yield requests, method
@@ -0,0 +1,130 @@
+""" Timestamps formatting shared by the plugins
+
+The plugins format one ISO 8601 timestamp for every value they parse, most
+of them quarter-hours of the same few days. The local time zone is looked up
+once, the UTC offset of each day is computed once (and cached) and, on the
+days without a DST transition, the timestamps are built from the naive date
+and the offset of the day. The days with a DST transition fall back to the
+time zone library, through a bounded LRU cache, so the results are exactly
+those of pytz localize/normalize (or of dateutil for wall()).
+
+Time zones never change their UTC offset twice within a day: a day, or a
+span of at most one day, having the same offset at both ends has no DST
+transition.
+"""
+
+import datetime
+import functools
+
+from dateutil import tz
+from tzlocal import get_localzone
+
+QUARTER = datetime.timedelta(minutes=15)
+DAY = datetime.timedelta(days=1)
+
+
+class JTimestamp():
+
+    def __init__(self, size=65536):
+        self.__zone = None
+        self.__local = None
+        self.exact = functools.lru_cache(maxsize=size)(self.exact)
+        self.offset = functools.lru_cache(maxsize=None)(self.offset)
+        self.suffix = functools.lru_cache(maxsize=None)(self.suffix)
+        self.daily = functools.lru_cache(maxsize=1024)(self.daily)
+        self.quarters = functools.lru_cache(maxsize=1024)(self.quarters)
+        self.walldaily = functools.lru_cache(maxsize=1024)(self.walldaily)
+
+    @property
+    def zone(self):
+        if not self.__zone:
+            self.__zone = get_localzone()
+        return self.__zone
+
+    @property
+    def local(self):
+        if not self.__local:
+            self.__local = tz.gettz()
+        return self.__local
+
+    def exact(self, dt, is_dst=False):
+        zone = self.zone
+        return zone.normalize(zone.localize(dt, is_dst=is_dst)).isoformat()
+
+    def daily(self, date):
+        # offset suffix of a day without DST transitions, None otherwise
+        zone = self.zone
+        midnight = datetime.datetime(date.year, date.month, date.day)
+        start = zone.localize(midnight, is_dst=False)
+        if start.utcoffset() != zone.localize(midnight, is_dst=True).utcoffset():
+            return None
+        if zone.normalize(start + DAY).utcoffset() != start.utcoffset():
+            return None
+        return start.isoformat()[19:]
+
+    def quarters(self, date):
+        # the 96 quarter-hours of a day without DST transitions
+        suffix = self.daily(date)
+        if suffix is None:
+            return None
+        midnight = datetime.datetime(date.year, date.month, date.day)
+        return tuple('%s%s' % ((midnight + i * QUARTER).isoformat(), suffix) for i in range(96))
+
+    def localize(self, dt, is_dst=False):
+        """ Same as zone.normalize(zone.localize(dt, is_dst)).isoformat() """
+        suffix = self.daily(dt.date())
+        if suffix is None:
+            return self.exact(dt, is_dst)
+        return '%s%s' % (dt.isoformat(), suffix)
+
+    def quarter(self, date, index, is_dst=False):
+        """ Same as localize(date + index * 15 minutes, is_dst) """
+        quarters = self.quarters(date)
+        if quarters is None or not 0 <= index < 96:
+            return self.localize(datetime.datetime(date.year, date.month, date.day) + index * QUARTER, is_dst)
+        return quarters[index]
+
+    def series(self, dt, count, step=QUARTER):
+        """ Same as zone.normalize(zone.localize(dt) + i * step).isoformat()
+        for i in range(count), as long as the series spans at most a day
+        """
+        zone = self.zone
+        start = zone.localize(dt)
+        span = (count - 1) * step
+        if count < 1 or span > DAY or zone.normalize(start + span).utcoffset() != start.utcoffset() or start.utcoffset() != zone.localize(dt, is_dst=True).utcoffset():
+            return [zone.normalize(start + i * step).isoformat() for i in range(count)]
+        suffix = start.isoformat()[len(dt.isoformat()):]
+        return ['%s%s' % ((dt + i * step).isoformat(), suffix) for i in range(count)]
+
+    def dst(self, dt):
+        return self.zone.localize(dt).dst()
+
+    def offset(self, minutes):
+        return tz.tzoffset(None, minutes * 60)
+
+    def suffix(self, minutes):
+        return datetime.datetime(2000, 1, 1, tzinfo=self.offset(minutes)).isoformat()[19:]
+
+    def fixed(self, dt, minutes):
+        """ Same as dt.replace(tzinfo=tz.tzoffset(None, minutes * 60)).isoformat() """
+        return '%s%s' % (dt.isoformat(), self.suffix(minutes))
+
+    def walldaily(self, date):
+        # dateutil local offset suffix of a day without DST transitions
+        local = self.local
+        midnight = datetime.datetime(date.year, date.month, date.day, tzinfo=local)
+        if not tz.datetime_exists(midnight) or tz.datetime_ambiguous(midnight):
+            return None
+        if (midnight + DAY).utcoffset() != midnight.utcoffset():
+            return None
+        return midnight.isoformat()[19:]
+
+    def wall(self, dt):
+        """ Same as dt.replace(tzinfo=tz.gettz()).isoformat() """
+        suffix = self.walldaily(dt.date())
+        if suffix is None:
+            return dt.replace(tzinfo=self.local).isoformat()
+        return '%s%s' % (dt.isoformat(), suffix)
+
+
+timestamps = JTimestamp()
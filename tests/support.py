@@ -0,0 +1,166 @@
+""" Shared helpers of the tests
+
+The stub of the IEnergyDa REST API of the benchmarks, with a budget of
+requests it accepts before failing, the configuration and runs of the daemon
+in this process and the payloads of the plugins. Imported by the tests
+before jackal, to set the local time zone of the gateways before the
+timestamps are cached.
+"""
+
+import os
+
+os.environ['TZ'] = 'Europe/Rome'
+
+import hashlib
+import json
+import shutil
+import tempfile
+import time
+
+from benchmarks import generators, stub
+import jackal
+from jackal import batch
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class BudgetHandler(stub.StubHandler):
+    """ Fails the requests with 502 once the budget of the server is spent """
+
+    def do_POST(self):
+        server = self.server
+        with server.lock:
+            spent = server.budget is not None and server.budget <= 0
+            if server.budget is not None and not spent:
+                server.budget -= 1
+        if not spent:
+            return super(BudgetHandler, self).do_POST()
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        with server.lock:
+            server.stats['errors'] += 1
+        self.send_response(502)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    do_PUT = do_POST
+    do_PATCH = do_POST
+    do_DELETE = do_POST
+
+
+def server():
+    """ A stub server, accepting every request until budget is set """
+    started = stub.start()
+    started.RequestHandlerClass = BudgetHandler
+    started.budget = None
+    return started
+
+
+def configure(directory, text):
+    """ Sets up jackal with the configuration text, written in directory """
+    ini = os.path.join(directory, 'jackal.ini')
+    with open(ini, 'w') as f:
+        f.write(text)
+    jackal.setup(ini)
+    return ini
+
+
+def run(infiles, timeout=60):
+    """ Runs the daemon until the infiles left their basedir """
+    # the plugins are loaded from the working directory
+    cwd = os.getcwd()
+    os.chdir(ROOT)
+    try:
+        app = jackal.JApp()
+    finally:
+        os.chdir(cwd)
+    app.start()
+    try:
+        app.periodic()
+        started = time.monotonic()
+        while any(os.path.isfile(infile) for infile in infiles) and time.monotonic() - started < timeout:
+            time.sleep(0.05)
+    finally:
+        app.stop()
+    return not any(os.path.isfile(infile) for infile in infiles)
+
+
+def mkdtemp():
+    return tempfile.mkdtemp(prefix='jackal-test-')
+
+
+def plugin(name, batchsize=10000):
+    """ An instance of the plugin, with the class attributes set by JApp """
+    module = __import__('jackal.plugins.%s' % name, fromlist=[name])
+    cls = getattr(module, name)
+    cls.name = name
+    cls.clientid = '5'
+    cls.filtr = None
+    cls.batchsize = batchsize
+    return cls()
+
+
+def payload(parts):
+    """ The records sent for the (data, method) parts, and their methods """
+    records = []
+    methods = set()
+    for (data, method) in parts:
+        records.extend(json.loads(batch.dumps(data)))
+        methods.add(method)
+    return (records, methods)
+
+
+def digest(records):
+    return hashlib.sha256(json.dumps(records, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def parsings(name):
+    """ The ways the daemon parses a file with the plugin: whole, streamed in
+    small batches (read or memory mapped) and parse() of the text
+    """
+    def whole(infile):
+        with jackal.JInput(infile, 'utf-8') as source:
+            return [source.parse(plugin(name))]
+    def streamed(infile):
+        with jackal.JInput(infile, 'utf-8') as source:
+            return list(source.batches(plugin(name, 700)))
+    def mapped(infile):
+        with jackal.JInput(infile, 'utf-8', 1) as source:
+            return list(source.batches(plugin(name, 700)))
+    def text(infile):
+        with open(infile, 'r') as f:
+            return [plugin(name).parse(f.read())]
+    return {'whole': whole, 'streamed': streamed, 'mapped': mapped, 'text': text}
+
+
+class PinnedOutput():
+    """ Mixin of the tests pinning the payloads of a plugin
+
+    The synthetic files of the benchmarks (seeded, with the DST transitions
+    of March and October) are parsed in every way of parsings(): all of them
+    must send the very same measuresmatrix payload, with the records count
+    and SHA-256 of pinned, (file, records, SHA-256) tuples. The digests were
+    checked against the output of the original plugins, which built lists of
+    dicts, in Europe/Rome.
+    """
+
+    name = None
+    pinned = ()
+    scale = 0.2
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = mkdtemp()
+        generators.generate(cls.name, cls.directory, len(cls.pinned), cls.scale)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.directory, ignore_errors=True)
+
+    def test_payload(self):
+        for (way, parse) in parsings(self.name).items():
+            for (filename, count, pinned) in self.pinned:
+                with self.subTest(parsing=way, file=filename):
+                    (records, methods) = payload(parse(os.path.join(self.directory, filename)))
+                    self.assertEqual(methods, {'POST'})
+                    self.assertEqual(len(records), count)
+                    self.assertEqual(digest(records), pinned)
@@ -0,0 +1,68 @@
+""" asyncio submission engine against the stub of the REST API """
+
+import support
+
+import os
+import shutil
+import unittest
+
+from benchmarks import generators
+import jackal
+
+
+class TestAsyncio(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = support.server()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.directory = support.mkdtemp()
+        self.basedir = os.path.join(self.directory, 'deval')
+        os.makedirs(os.path.join(self.basedir, 'ok'))
+        os.makedirs(os.path.join(self.basedir, 'ko'))
+        (self.name,) = generators.generate('deval', self.basedir, 1, 0.2)
+        self.infile = os.path.join(self.basedir, self.name)
+        with open(self.infile, 'r') as f:
+            # a record for each value of the rows
+            self.total = sum(len([cell for cell in line.rstrip('\n').split(';')[5:] if cell]) for line in f)
+        support.configure(self.directory, '[jackal]\nloglevel=CRITICAL\nbaseurl=%s\nretries=0\nengine=asyncio\nconnections=4\nchunkrecords=500\nchunkworkers=4\n[deval]\nclientid=5\nbasedir=%s\nokdir=ok\nkodir=ko\n' % (self.server.url, self.basedir))
+        self.server.budget = None
+        self.server.reset()
+
+    def tearDown(self):
+        jackal.rest.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_accepted(self):
+        self.assertTrue(support.run([self.infile]))
+        self.assertEqual(os.listdir(os.path.join(self.basedir, 'ok')), [self.name])
+        self.assertEqual(self.server.stats['records'], self.total)
+        self.assertEqual(self.server.stats['tokens'], 1)
+        self.assertEqual(self.server.stats['errors'], 0)
+
+    def test_bad_gateway(self):
+        # 502 after the first chunks: the file goes to kodir with its progress
+        self.server.budget = 3
+        self.assertTrue(support.run([self.infile]))
+        failed = os.path.join(self.basedir, 'ko', self.name)
+        self.assertTrue(os.path.isfile(failed))
+        self.assertTrue(os.path.isfile('%s.chunks' % failed))
+        self.assertGreater(self.server.stats['errors'], 0)
+        accepted = self.server.stats['records']
+        self.assertEqual(accepted, 3 * 500)
+        # moved back, the chunks not accepted are sent
+        self.server.budget = None
+        os.rename(failed, self.infile)
+        self.assertTrue(support.run([self.infile]))
+        self.assertEqual(os.listdir(os.path.join(self.basedir, 'ok')), [self.name])
+        self.assertEqual(self.server.stats['records'], self.total)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+""" Compaction of okdir and kodir into archives by day or month """
+
+import support
+
+import datetime
+import os
+import shutil
+import threading
+import time
+import unittest
+import zipfile
+
+import jackal
+
+
+class TestArchiver(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = support.mkdtemp()
+        support.configure(self.directory, '[jackal]\nloglevel=CRITICAL\n')
+        self.okdir = os.path.join(self.directory, 'ok')
+        os.makedirs(self.okdir)
+        self.archivedir = os.path.join(self.okdir, 'archive')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def write(self, name, day, content='a;b\n'):
+        # a file processed at noon of day
+        infile = os.path.join(self.okdir, name)
+        with open(infile, 'w') as f:
+            f.write(content)
+        mtime = time.mktime(datetime.datetime.combine(day, datetime.time(12)).timetuple())
+        os.utime(infile, (mtime, mtime))
+        return infile
+
+    def index(self):
+        with open(os.path.join(self.archivedir, 'index.tsv'), 'r') as f:
+            return [line.rstrip('\n').split('\t') for line in f]
+
+    def test_compact(self):
+        today = datetime.date.today()
+        for (name, days) in (('a.csv', 2), ('b.csv', 2), ('c.csv', 1), ('d.csv', 0), ('e.csv.chunks', 3)):
+            self.write(name, today - datetime.timedelta(days=days))
+        jackal.JArchiver([self.okdir]).compact(self.okdir)
+        # the files of today, and the chunks progress, are left
+        self.assertEqual(sorted(os.listdir(self.okdir)), ['archive', 'd.csv', 'e.csv.chunks'])
+        before = '%s.zip' % (today - datetime.timedelta(days=2)).isoformat()
+        yesterday = '%s.zip' % (today - datetime.timedelta(days=1)).isoformat()
+        self.assertEqual(sorted(os.listdir(self.archivedir)), sorted([before, yesterday, 'index.tsv']))
+        with zipfile.ZipFile(os.path.join(self.archivedir, before)) as archive:
+            self.assertEqual(sorted(archive.namelist()), ['a.csv', 'b.csv'])
+            self.assertEqual(archive.read('a.csv'), b'a;b\n')
+        self.assertEqual([(name, archive, size) for (name, archive, mtime, size) in self.index()], [('a.csv', before, '4'), ('b.csv', before, '4'), ('c.csv', yesterday, '4')])
+        # the same name processed again goes into the same archive
+        self.write('a.csv', today - datetime.timedelta(days=2), 'again\n')
+        jackal.JArchiver([self.okdir]).compact(self.okdir)
+        with zipfile.ZipFile(os.path.join(self.archivedir, before)) as archive:
+            self.assertEqual(archive.read('a.csv~1'), b'again\n')
+        self.assertEqual(self.index()[-1][0:2], ['a.csv~1', before])
+        self.assertFalse([name for name in os.listdir(self.archivedir) if name.endswith('.tmp')])
+
+    def test_month(self):
+        first = datetime.date.today().replace(day=1)
+        last = first - datetime.timedelta(days=1)
+        self.write('a.csv', last)
+        self.write('b.csv', last.replace(day=1))
+        self.write('c.csv', first)
+        jackal.JArchiver([self.okdir], 'month').compact(self.okdir)
+        self.assertEqual(sorted(os.listdir(self.okdir)), ['archive', 'c.csv'])
+        with zipfile.ZipFile(os.path.join(self.archivedir, '%s.zip' % last.strftime('%Y-%m'))) as archive:
+            self.assertEqual(sorted(archive.namelist()), ['a.csv', 'b.csv'])
+
+    def test_expire(self):
+        today = datetime.date.today()
+        for days in (1, 4, 10):
+            self.write('%d.csv' % days, today - datetime.timedelta(days=days))
+        archiver = jackal.JArchiver([self.okdir], 'day', 5)
+        archiver.compact(self.okdir)
+        archiver.expire(self.okdir)
+        # ended 9 days ago, the others within 5 days
+        self.assertEqual(len([name for name in os.listdir(self.archivedir) if name.endswith('.zip')]), 2)
+        self.assertEqual(sorted(name for (name, archive, mtime, size) in self.index()), ['1.csv', '4.csv'])
+
+    def test_busy(self):
+        # never while files are waiting or processed
+        self.write('a.csv', datetime.date.today() - datetime.timedelta(days=1))
+        archiver = jackal.JArchiver([self.okdir], idle=lambda: False)
+        compacting = threading.Thread(target=archiver.compact, args=(self.okdir,))
+        compacting.start()
+        time.sleep(0.2)
+        archiver.stop()
+        compacting.join(5)
+        self.assertFalse(compacting.is_alive())
+        self.assertEqual(os.listdir(self.okdir), ['a.csv'])
+
+
+if __name__ == '__main__':
+    unittest.main()
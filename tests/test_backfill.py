@@ -0,0 +1,92 @@
+""" Backfill of an archive of input files
+
+The directories of the daemon are never backfilled, nor the ones inside or
+containing them, and the files accepted are skipped when run again.
+"""
+
+import support
+
+import os
+import shutil
+import unittest
+
+from benchmarks import generators
+import jackal
+
+
+class TestBackfill(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = support.server()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.directory = support.mkdtemp()
+        self.basedir = os.path.join(self.directory, 'deval')
+        os.makedirs(os.path.join(self.basedir, 'ok', 'archive'))
+        os.makedirs(os.path.join(self.directory, 'failed'))
+        self.archive = os.path.join(self.directory, 'archive')
+        os.makedirs(os.path.join(self.archive, '2020'))
+        self.names = generators.generate('deval', os.path.join(self.archive, '2020'), 3, 0.1)
+        self.checkpoint = os.path.join(self.directory, 'deval.checkpoint')
+        support.configure(self.directory, '[jackal]\nloglevel=CRITICAL\nbaseurl=%s\nretries=0\n[deval]\nclientid=5\nbasedir=%s\nokdir=ok\nkodir=%s\n' % (self.server.url, self.basedir, os.path.join(self.directory, 'failed')))
+        self.server.budget = None
+        self.server.reset()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def backfill(self, directory):
+        return jackal.JBackfill('deval', directory, 2, 0, self.checkpoint)
+
+    def test_daemon_directories(self):
+        for directory in (self.basedir, os.path.join(self.basedir, 'ok'), os.path.join(self.basedir, 'ok', 'archive'), os.path.join(self.directory, 'failed'), self.directory):
+            self.assertFalse(self.backfill(directory).load(), directory)
+        self.assertTrue(self.backfill(self.archive).load())
+        # through a symbolic link too
+        os.symlink(os.path.join(self.basedir, 'ok'), os.path.join(self.directory, 'link'))
+        self.assertFalse(self.backfill(os.path.join(self.directory, 'link')).load())
+
+    def test_checkpoint(self):
+        self.assertTrue(self.backfill(self.archive).run())
+        with open(self.checkpoint, 'r') as f:
+            self.assertEqual(sorted(os.path.basename(line.rstrip('\n')) for line in f), sorted(self.names))
+        total = self.server.stats['records']
+        self.assertGreater(total, 0)
+        # the files are left where they are
+        self.assertEqual(sorted(os.listdir(os.path.join(self.archive, '2020'))), sorted(self.names))
+        # run again, all of them are skipped
+        self.server.reset()
+        self.assertTrue(self.backfill(self.archive).run())
+        self.assertEqual(self.server.stats['requests'], 0)
+        # a file added to the archive is the only one sent
+        (name,) = generators.generate('deval', self.directory, 1, 0.1)
+        os.rename(os.path.join(self.directory, name), os.path.join(self.archive, 'added.csv'))
+        self.assertTrue(self.backfill(self.archive).run())
+        with open(os.path.join(self.archive, 'added.csv'), 'r') as f:
+            # a record for each value of the rows
+            added = sum(len([cell for cell in line.rstrip('\n').split(';')[5:] if cell]) for line in f)
+        self.assertEqual(self.server.stats['records'], added)
+
+    def test_failed(self):
+        # the server stops accepting after the first file
+        self.server.budget = 1
+        self.assertFalse(self.backfill(self.archive).run())
+        with open(self.checkpoint, 'r') as f:
+            accepted = [line.rstrip('\n') for line in f]
+        self.assertLessEqual(len(accepted), 1)
+        # the failed ones are retried
+        self.server.budget = None
+        self.server.reset()
+        self.assertTrue(self.backfill(self.archive).run())
+        with open(self.checkpoint, 'r') as f:
+            self.assertEqual(len(f.readlines()), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
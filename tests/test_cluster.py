@@ -0,0 +1,146 @@
+""" Basedirs shared by several nodes
+
+Each file is claimed by a single node, the files claimed by a node gone are
+moved back into basedir, and the lease of a node is renewed on a thread of
+its own.
+"""
+
+import support
+
+import os
+import shutil
+import threading
+import time
+import unittest
+
+from benchmarks import generators
+import jackal
+
+
+class TestCluster(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = support.mkdtemp()
+        support.configure(self.directory, '[jackal]\nloglevel=CRITICAL\n')
+        self.basedir = os.path.join(self.directory, 'deval')
+        os.makedirs(self.basedir)
+        self.infiles = []
+        for idx in range(50):
+            self.infiles.append(os.path.join(self.basedir, '%02d.csv' % idx))
+            with open(self.infiles[-1], 'w') as f:
+                f.write('%d\n' % idx)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_claim(self):
+        # nodes racing for the same files
+        nodes = [jackal.JCluster(node) for node in ('a', 'b', 'c')]
+        claimed = {}
+        def claim(node):
+            node.heartbeat(self.basedir)
+            for infile in self.infiles:
+                path = node.claim(infile)
+                if path:
+                    claimed.setdefault(infile, []).append(node.node)
+        threads = [threading.Thread(target=claim, args=(node,)) for node in nodes for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(claimed), self.infiles)
+        self.assertTrue(all(len(names) == 1 for names in claimed.values()))
+        self.assertEqual(sum(len(os.listdir(node.claims(self.basedir))) for node in nodes), len(self.infiles))
+        self.assertEqual(os.listdir(self.basedir), ['.claims'])
+
+    def test_recover(self):
+        (a, b) = (jackal.JCluster('a', 60), jackal.JCluster('b', 60))
+        a.heartbeat(self.basedir)
+        a.claim(self.infiles[0])
+        b.heartbeat(self.basedir)
+        b.claim(self.infiles[1])
+        # both alive
+        self.assertEqual(b.recover(self.basedir), [])
+        # a is gone since 2 leases
+        alive = '%s.alive' % a.claims(self.basedir)
+        os.utime(alive, (time.time() - 120, time.time() - 120))
+        self.assertEqual(b.recover(self.basedir), [self.infiles[0]])
+        self.assertTrue(os.path.isfile(self.infiles[0]))
+        # the claims of b, when it starts again
+        self.assertEqual(b.recover(self.basedir, own=True), [self.infiles[1]])
+        self.assertEqual(os.listdir(b.claims(self.basedir)), [])
+
+    def test_release_existing(self):
+        a = jackal.JCluster('a')
+        a.heartbeat(self.basedir)
+        claimed = a.claim(self.infiles[0])
+        # written again meanwhile
+        with open(self.infiles[0], 'w') as f:
+            f.write('new\n')
+        self.assertIsNone(a.release(claimed))
+        self.assertTrue(os.path.isfile(claimed))
+
+    def test_shards(self):
+        nodes = [jackal.JCluster(node, 60, 'a, b,c') for node in ('a', 'b', 'c')]
+        owners = [[node.node for node in nodes if node.wanted(infile)] for infile in self.infiles]
+        self.assertTrue(all(len(names) == 1 for names in owners))
+        self.assertEqual(set(name for (name,) in owners), {'a', 'b', 'c'})
+        # abandoned by their node: every node takes them
+        for infile in self.infiles:
+            os.utime(infile, (time.time() - 120, time.time() - 120))
+        self.assertTrue(all(node.wanted(infile) for node in nodes for infile in self.infiles))
+        # a node not among the nodes claims every file
+        self.assertEqual(jackal.JCluster('d', 60, 'a,b,c').nodes, [])
+
+
+class TestLease(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = support.server()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.directory = support.mkdtemp()
+        self.basedir = os.path.join(self.directory, 'deval')
+        os.makedirs(os.path.join(self.basedir, 'ok'))
+        os.makedirs(os.path.join(self.basedir, 'ko'))
+        self.server.reset()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_heartbeat(self):
+        support.configure(self.directory, '[jackal]\nloglevel=CRITICAL\nbaseurl=%s\nretries=0\nnode=a\nlease=3\n[deval]\nclientid=5\nbasedir=%s\nokdir=ok\nkodir=ko\n' % (self.server.url, self.basedir))
+        # claims of b, gone
+        b = jackal.JCluster('b', 3)
+        (name,) = generators.generate('deval', self.basedir, 1, 0.1)
+        b.heartbeat(self.basedir)
+        b.claim(os.path.join(self.basedir, name))
+        cwd = os.getcwd()
+        os.chdir(support.ROOT)
+        try:
+            app = jackal.JApp()
+        finally:
+            os.chdir(cwd)
+        # started without the scheduler, as blocked
+        app.start()
+        try:
+            alive = os.path.join(self.basedir, '.claims', 'a.alive')
+            os.utime(alive, (time.time() - 60, time.time() - 60))
+            started = time.monotonic()
+            while not os.path.isfile(os.path.join(self.basedir, 'ok', name)) and time.monotonic() - started < 30:
+                time.sleep(0.05)
+            self.assertLess(time.time() - os.path.getmtime(alive), 5)
+        finally:
+            app.stop()
+        self.assertTrue(os.path.isfile(os.path.join(self.basedir, 'ok', name)))
+        self.assertGreater(self.server.stats['records'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,45 @@
+""" Payloads of the Deval plugin, quarter-hour rows around the DST days """
+
+import support
+
+import datetime
+import os
+import unittest
+
+from jackal import curve
+
+
+class TestDeval(support.PinnedOutput, unittest.TestCase):
+
+    name = 'deval'
+    pinned = (
+        ('bench0000.csv', 5944, '9b2160418d6b998f63f2db9ebfd563cf0248d701d91182ffe5f07711d49eadee'),
+        ('bench0001.csv', 5952, '06f9cffd7be3b228771a1c97468f58e1be764aaff01046c53d8b3b9c0c173be4'),
+    )
+
+    def test_missing_values(self):
+        # the empty and non numeric cells are skipped
+        infile = os.path.join(self.directory, 'missing.csv')
+        with open(infile, 'w') as f:
+            f.write('IT001E1;1;EA;01.06.20;00:15;%s\n' % ';'.join(['1,5' if index == 3 else '' if index == 5 else '0.25' for index in range(96)]))
+        for (way, parse) in support.parsings(self.name).items():
+            with self.subTest(parsing=way):
+                (records, methods) = support.payload(parse(infile))
+                self.assertEqual(len(records), 94)
+                self.assertEqual(records[0], {'client_id': '5', 'at': '2020-06-01T00:15:00+02:00', 'device_id': 'IT001E1', 'measures': [{'measure_id': 'EA', 'value': 0.25}]})
+                self.assertNotIn('2020-06-01T01:00:00+02:00', [record['at'] for record in records])
+                self.assertNotIn('2020-06-01T01:30:00+02:00', [record['at'] for record in records])
+
+
+class TestCurve(unittest.TestCase):
+
+    def test_day(self):
+        # on the day of the DST start, the 8th quarter is followed by 03:00
+        (stamps, values) = curve.day(datetime.datetime(2020, 3, 29), ({'E8': '1.5', 'E9': '2'}, {'E8': '3', 'E9': '4.25'}))
+        self.assertEqual(stamps, ['2020-03-29T01:45:00+01:00', '2020-03-29T03:00:00+02:00'])
+        # row by row, the columns at each timestamp
+        self.assertEqual(list(values), [1.5, 3.0, 2.0, 4.25])
+
+
+if __name__ == '__main__':
+    unittest.main()
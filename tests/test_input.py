@@ -0,0 +1,159 @@
+""" Input files of the plugins, memory mapped, read or decompressed """
+
+import support
+
+import gc
+import gzip
+import lzma
+import mmap
+import os
+import shutil
+import sys
+import unittest
+import zipfile
+
+from benchmarks import generators
+import jackal
+
+
+class TestInput(unittest.TestCase):
+
+    content = 'IT001E1;1;EA;01.06.20;00:15;0,25\r\nIT001E2;1;EA;01.06.20;00:15;1\nIT001E3;1;EA;01.06.20;00:15;2\n'
+
+    def setUp(self):
+        self.directory = support.mkdtemp()
+        self.infile = os.path.join(self.directory, 'input.csv')
+        with open(self.infile, 'w', newline='') as f:
+            f.write(self.content)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_mapped(self):
+        with jackal.JInput(self.infile, 'utf-8', 1) as source:
+            self.assertIsInstance(source.buffer(), mmap.mmap)
+            self.assertEqual(source.size, len(self.content))
+        # smaller than mmapsize, or mmapsize 0
+        for mmapsize in (0, len(self.content) + 1):
+            with jackal.JInput(self.infile, 'utf-8', mmapsize) as source:
+                self.assertEqual(source.buffer(), self.content.encode('utf-8'))
+
+    def test_same_content(self):
+        for mmapsize in (0, 1):
+            with self.subTest(mmapsize=mmapsize):
+                with jackal.JInput(self.infile, 'utf-8', mmapsize) as source:
+                    self.assertEqual([line.rstrip('\r\n') for line in source.lines()], self.content.splitlines())
+                    self.assertEqual(source.text(), self.content.replace('\r\n', '\n'))
+                    self.assertEqual(source.stream().read(), self.content.encode('utf-8'))
+                    # read again from the beginning
+                    self.assertEqual(len(list(source.lines())), 3)
+
+    def test_lines_abandoned(self):
+        # a plugin failing midway leaves the lines generator behind, collected
+        # after the file is closed
+        unraisable = []
+        hook = sys.unraisablehook
+        sys.unraisablehook = unraisable.append
+        try:
+            for mmapsize in (0, 1):
+                source = jackal.JInput(self.infile, 'utf-8', mmapsize)
+                lines = source.lines()
+                next(lines)
+                source.close()
+                del lines
+                gc.collect()
+        finally:
+            sys.unraisablehook = hook
+        self.assertEqual([str(error.exc_value) for error in unraisable], [])
+
+    def test_missing(self):
+        with self.assertRaises(OSError):
+            jackal.JInput(os.path.join(self.directory, 'missing.csv'))
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+
+class TestCompressed(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = support.server()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.directory = support.mkdtemp()
+        self.basedir = os.path.join(self.directory, 'deval')
+        os.makedirs(os.path.join(self.basedir, 'ok'))
+        os.makedirs(os.path.join(self.basedir, 'ko'))
+        self.names = generators.generate('deval', self.directory, 2, 0.1)
+        self.plain = os.path.join(self.directory, self.names[0])
+        with open(self.plain, 'rb') as f:
+            self.content = f.read()
+        self.server.reset()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def records(self, infile, member=None):
+        with jackal.JInput(infile, 'utf-8', 0, member) as source:
+            return support.payload([source.parse(support.plugin('deval'))])[0]
+
+    def compressed(self, directory):
+        # the first file compressed in every way, and a zip of both
+        with gzip.open(os.path.join(directory, 'a.csv.gz'), 'wb') as f:
+            f.write(self.content)
+        with lzma.open(os.path.join(directory, 'b.csv.xz'), 'wb') as f:
+            f.write(self.content)
+        with zipfile.ZipFile(os.path.join(directory, 'c.zip'), 'w', zipfile.ZIP_DEFLATED) as archive:
+            for name in self.names:
+                archive.write(os.path.join(self.directory, name), 'export/%s' % name)
+            archive.writestr('export/readme.txt', 'not a CSV')
+        return [os.path.join(directory, name) for name in ('a.csv.gz', 'b.csv.xz', 'c.zip')]
+
+    def test_same_content(self):
+        (gz, xz, zipped) = self.compressed(self.directory)
+        for (infile, member, compression) in ((gz, None, 'gz'), (xz, None, 'xz'), (zipped, 'export/%s' % self.names[0], 'zip')):
+            with self.subTest(compression=compression):
+                # never memory mapped
+                with jackal.JInput(infile, 'utf-8', 1, member) as source:
+                    self.assertEqual(source.compression, compression)
+                    self.assertEqual(source.buffer(), self.content)
+                    self.assertEqual(source.text(), self.content.decode('utf-8'))
+                    self.assertEqual(''.join(source.lines()), self.content.decode('utf-8'))
+                self.assertEqual(self.records(infile, member), self.records(self.plain))
+        with self.assertRaises(ValueError):
+            jackal.JInput(zipped)
+
+    def test_matches(self):
+        (gz, xz, zipped) = self.compressed(self.directory)
+        self.assertTrue(jackal.JInput.matches(gz, '*.csv'))
+        self.assertTrue(jackal.JInput.matches(xz, '*.csv'))
+        self.assertTrue(jackal.JInput.matches(zipped, '*.csv'))
+        self.assertFalse(jackal.JInput.matches(zipped, '*.xml'))
+        self.assertEqual(jackal.JInput.members(zipped, '*.csv'), ['export/%s' % name for name in self.names])
+        self.assertEqual(jackal.JInput.members(gz, '*.csv'), [None])
+        self.assertEqual(sorted(jackal.JInput.find(self.directory, '*.csv')), sorted([gz, xz, zipped] + [os.path.join(self.directory, name) for name in self.names]))
+
+    def test_corrupted(self):
+        (gz, xz, zipped) = self.compressed(self.directory)
+        with open(gz, 'r+b') as f:
+            f.truncate(len(self.content) // 10)
+        with self.assertRaises(jackal.JInput.errors):
+            with jackal.JInput(gz) as source:
+                source.buffer()
+
+    def test_run(self):
+        support.configure(self.directory, '[jackal]\nloglevel=CRITICAL\nbaseurl=%s\nretries=0\n[deval]\nclientid=5\nbasedir=%s\nokdir=ok\nkodir=ko\npattern=*.csv\n' % (self.server.url, self.basedir))
+        infiles = self.compressed(self.basedir)
+        self.assertTrue(support.run(infiles))
+        # moved as they are, the records of the first file 3 times
+        self.assertEqual(sorted(os.listdir(os.path.join(self.basedir, 'ok'))), ['a.csv.gz', 'b.csv.xz', 'c.zip'])
+        with open(os.path.join(self.basedir, 'ok', 'a.csv.gz'), 'rb') as f:
+            self.assertEqual(gzip.decompress(f.read()), self.content)
+        self.assertEqual(self.server.stats['records'], 3 * len(self.records(self.plain)) + len(self.records(os.path.join(self.directory, self.names[1]))))
@@ -0,0 +1,79 @@
+""" Ledger of the files and measures already accepted
+
+A file whose content was accepted goes to okdir without being sent again,
+and the measures of a file the server accepted in part are not sent twice.
+"""
+
+import support
+
+import os
+import shutil
+import unittest
+
+from benchmarks import generators
+
+
+class TestLedger(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = support.server()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.directory = support.mkdtemp()
+        self.basedir = os.path.join(self.directory, 'deval')
+        os.makedirs(os.path.join(self.basedir, 'ok'))
+        os.makedirs(os.path.join(self.basedir, 'ko'))
+        self.source = os.path.join(self.directory, 'source')
+        os.makedirs(self.source)
+        (self.name,) = generators.generate('deval', self.source, 1, 0.2)
+        self.infile = os.path.join(self.basedir, self.name)
+        support.configure(self.directory, '[jackal]\nloglevel=CRITICAL\nbaseurl=%s\nretries=0\nchunkrecords=500\nledger=%s\n[deval]\nclientid=5\nbasedir=%s\nokdir=ok\nkodir=ko\n' % (self.server.url, os.path.join(self.directory, 'ledger.db'), self.basedir))
+        self.server.budget = None
+        self.server.reset()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def process(self, name=None):
+        infile = os.path.join(self.basedir, name or self.name)
+        shutil.copy(os.path.join(self.source, self.name), infile)
+        self.assertTrue(support.run([infile]))
+        records = self.server.stats['records']
+        self.server.reset()
+        return records
+
+    def test_same_content(self):
+        self.assertGreater(self.process(), 0)
+        os.unlink(os.path.join(self.basedir, 'ok', self.name))
+        # another name, same content: moved without any request
+        self.assertEqual(self.process('copy.csv'), 0)
+        self.assertTrue(os.path.isfile(os.path.join(self.basedir, 'ok', 'copy.csv')))
+        self.assertEqual(self.server.stats['requests'], 0)
+
+    def test_accepted_measures(self):
+        with open(os.path.join(self.source, self.name), 'r') as f:
+            # a record for each value of the rows
+            total = sum(len([cell for cell in line.rstrip('\n').split(';')[5:] if cell]) for line in f)
+        # the server accepts 2 chunks, then fails
+        self.server.budget = 2
+        accepted = self.process()
+        self.server.budget = None
+        failed = os.path.join(self.basedir, 'ko', self.name)
+        self.assertTrue(os.path.isfile(failed))
+        self.assertEqual(accepted, 2 * 500)
+        # moved back, the measures already accepted are not sent again
+        os.rename(failed, self.infile)
+        self.assertTrue(support.run([self.infile]))
+        self.assertTrue(os.path.isfile(os.path.join(self.basedir, 'ok', self.name)))
+        self.assertEqual(self.server.stats['records'], total - accepted)
+        self.assertEqual(self.server.stats['errors'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+""" Runtime metrics in Prometheus text format """
+
+import support
+
+import os
+import shutil
+import unittest
+
+from benchmarks import generators
+import jackal
+
+
+class TestMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = support.mkdtemp()
+        support.configure(self.directory, '[jackal]\nloglevel=CRITICAL\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_render(self):
+        metrics = jackal.JMetrics()
+        metrics.inc('jackal_files_total', plugin='deval')
+        metrics.inc('jackal_files_total', plugin='deval')
+        metrics.inc('jackal_bytes_read_total', 100, plugin='pod')
+        metrics.observe('jackal_parse_seconds', 0.3, plugin='deval')
+        metrics.gauge('jackal_queue_depth', lambda: 4, plugin='deval')
+        metrics.gauge('jackal_outbox_bytes', lambda: 1 / 0)
+        lines = metrics.render().splitlines()
+        self.assertIn('# HELP jackal_files_total Files processed', lines)
+        self.assertIn('# TYPE jackal_files_total counter', lines)
+        self.assertIn('jackal_files_total{plugin="deval"} 2', lines)
+        self.assertIn('jackal_bytes_read_total{plugin="pod"} 100', lines)
+        self.assertIn('# TYPE jackal_parse_seconds histogram', lines)
+        self.assertIn('jackal_parse_seconds_bucket{plugin="deval",le="0.25"} 0', lines)
+        self.assertIn('jackal_parse_seconds_bucket{plugin="deval",le="0.5"} 1', lines)
+        self.assertIn('jackal_parse_seconds_bucket{plugin="deval",le="+Inf"} 1', lines)
+        self.assertIn('jackal_parse_seconds_sum{plugin="deval"} 0.3', lines)
+        self.assertIn('jackal_parse_seconds_count{plugin="deval"} 1', lines)
+        self.assertIn('# TYPE jackal_queue_depth gauge', lines)
+        self.assertIn('jackal_queue_depth{plugin="deval"} 4', lines)
+        # a gauge failing is left out
+        self.assertFalse([line for line in lines if 'jackal_outbox_bytes' in line])
+
+    def test_labels(self):
+        metrics = jackal.JMetrics()
+        metrics.inc('jackal_custom_total', path='C:\\"in"')
+        lines = metrics.render().splitlines()
+        self.assertIn('# TYPE jackal_custom_total untyped', lines)
+        self.assertIn('jackal_custom_total{path="C:\\\\\\"in\\""} 1', lines)
+
+
+class TestRun(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = support.server()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.directory = support.mkdtemp()
+        self.basedir = os.path.join(self.directory, 'deval')
+        os.makedirs(os.path.join(self.basedir, 'ok'))
+        os.makedirs(os.path.join(self.basedir, 'ko'))
+        self.server.reset()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_run(self):
+        statsfile = os.path.join(self.directory, 'jackal.prom')
+        support.configure(self.directory, '[jackal]\nloglevel=CRITICAL\nbaseurl=%s\nretries=0\nstatsfile=%s\nstatsinterval=1\n[deval]\nclientid=5\nbasedir=%s\nokdir=ok\nkodir=ko\n' % (self.server.url, statsfile, self.basedir))
+        names = generators.generate('deval', self.basedir, 2, 0.1)
+        self.assertTrue(support.run([os.path.join(self.basedir, name) for name in names]))
+        lines = jackal.metrics.render().splitlines()
+        self.assertIn('jackal_files_total{plugin="deval"} 2', lines)
+        self.assertIn('jackal_files_ok_total{plugin="deval"} 2', lines)
+        self.assertIn('jackal_records_total{plugin="deval"} %d' % self.server.stats['records'], lines)
+        self.assertIn('jackal_http_responses_total{method="POST",status="201"} %d' % self.server.stats['requests'], lines)
+        self.assertIn('jackal_parse_seconds_count{plugin="deval"} 2', lines)
+        # written atomically into the stats file
+        jackal.metrics.dump(statsfile)
+        with open(statsfile, 'r') as f:
+            self.assertIn('# TYPE jackal_files_total counter\n', f.read())
+        self.assertFalse(os.path.exists('%s.tmp' % statsfile))
+
+
+if __name__ == '__main__':
+    unittest.main()
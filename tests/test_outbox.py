@@ -0,0 +1,140 @@
+""" Durable outbox of the data the server did not accept
+
+The entries survive a restart and are replayed in order, up to a torn write
+left by a crash, and the files whose data is queued go to okdir.
+"""
+
+import support
+
+import os
+import shutil
+import time
+import unittest
+import warnings
+
+from benchmarks import generators
+import jackal
+from jackal.batch import MeasureBatch
+
+
+def data(device):
+    data = MeasureBatch('5')
+    data.append('2020-03-29T02:00:00+01:00', device, [('Ea', 1.5), ('Er', 2)])
+    return data
+
+
+def replay(outbox):
+    # what the replayer sends, acknowledging each entry
+    replayed = []
+    entry = outbox.get()
+    while entry:
+        (segment, offset, method, records, name) = entry
+        replayed.append((method, records[0]['device_id'], name))
+        outbox.ack(segment, offset)
+        entry = outbox.get()
+    return replayed
+
+
+class TestOutbox(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = support.mkdtemp()
+        support.configure(self.directory, '[jackal]\nloglevel=CRITICAL\n')
+        self.outbox = os.path.join(self.directory, 'outbox')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_restart(self):
+        outbox = jackal.JOutbox(self.outbox, 1048576)
+        for device in ('a', 'b', 'c'):
+            self.assertTrue(outbox.put(data(device), 'POST', '%s.csv' % device))
+        (segment, offset, method, records, name) = outbox.get()
+        self.assertEqual(records, [{'client_id': '5', 'at': '2020-03-29T02:00:00+01:00', 'device_id': 'a', 'measures': [{'measure_id': 'Ea', 'value': 1.5}, {'measure_id': 'Er', 'value': 2}]}])
+        outbox.ack(segment, offset)
+        outbox.close()
+        # restarted after the first entry was acknowledged
+        outbox = jackal.JOutbox(self.outbox, 1048576)
+        self.assertEqual(replay(outbox), [('POST', 'b', 'b.csv'), ('POST', 'c', 'c.csv')])
+        outbox = jackal.JOutbox(self.outbox, 1048576)
+        self.assertIsNone(outbox.get())
+        self.assertEqual(outbox.size, 0)
+
+    def test_torn_write(self):
+        outbox = jackal.JOutbox(self.outbox, 1048576)
+        for device in ('a', 'b'):
+            self.assertTrue(outbox.put(data(device), 'POST', '%s.csv' % device))
+        outbox.close()
+        # crashed while appending the third entry
+        (segment,) = [name for name in os.listdir(self.outbox) if name.endswith('.seg')]
+        with open(os.path.join(self.outbox, segment), 'ab') as f:
+            f.write(jackal.JOutbox.header.pack(jackal.JOutbox.magic, 1000, 0) + b'torn')
+        outbox = jackal.JOutbox(self.outbox, 1048576)
+        self.assertEqual(replay(outbox), [('POST', 'a', 'a.csv'), ('POST', 'b', 'b.csv')])
+        # the next entries go to a new segment
+        self.assertTrue(outbox.put(data('c'), 'POST', 'c.csv'))
+        self.assertEqual(replay(outbox), [('POST', 'c', 'c.csv')])
+        outbox.close()
+
+    def test_close(self):
+        outbox = jackal.JOutbox(self.outbox, 1048576)
+        self.assertTrue(outbox.put(data('a'), 'POST', 'a.csv'))
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always', ResourceWarning)
+            outbox.close()
+            del outbox
+        self.assertEqual([str(warning.message) for warning in caught], [])
+        # still replayed from the segment closed
+        self.assertEqual(replay(jackal.JOutbox(self.outbox, 1048576)), [('POST', 'a', 'a.csv')])
+
+
+class TestReplay(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = support.server()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.directory = support.mkdtemp()
+        self.basedir = os.path.join(self.directory, 'deval')
+        os.makedirs(os.path.join(self.basedir, 'ok'))
+        os.makedirs(os.path.join(self.basedir, 'ko'))
+        (self.name,) = generators.generate('deval', self.basedir, 1, 0.2)
+        self.server.budget = None
+        self.server.reset()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_replay(self):
+        support.configure(self.directory, '[jackal]\nloglevel=CRITICAL\nbaseurl=%s\nretries=0\nchunkrecords=1000\noutbox=%s\n[deval]\nclientid=5\nbasedir=%s\nokdir=ok\nkodir=ko\n' % (self.server.url, os.path.join(self.directory, 'outbox'), self.basedir))
+        # the server fails after the first chunk
+        self.server.budget = 1
+        self.assertTrue(support.run([os.path.join(self.basedir, self.name)]))
+        self.assertTrue(os.path.isfile(os.path.join(self.basedir, 'ok', self.name)))
+        accepted = self.server.stats['records']
+        # replayed after a restart, once the server is back
+        self.server.budget = None
+        replayer = jackal.JReplayer(jackal.JOutbox(os.path.join(self.directory, 'outbox'), jackal.config.outboxsize))
+        replayer.start()
+        started = time.monotonic()
+        while replayer.outbox.size and time.monotonic() - started < 30:
+            time.sleep(0.05)
+        replayer.stop()
+        replayer.join(10)
+        self.assertFalse(replayer.is_alive())
+        self.assertEqual(replayer.outbox.size, 0)
+        with open(os.path.join(self.basedir, 'ok', self.name), 'r') as f:
+            # one record for each value of the rows
+            total = sum(len([cell for cell in line.rstrip('\n').split(';')[5:] if cell]) for line in f)
+        self.assertTrue(0 < accepted < total)
+        self.assertEqual(self.server.stats['records'], total)
+
+
+if __name__ == '__main__':
+    unittest.main()
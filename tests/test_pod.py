@@ -0,0 +1,59 @@
+""" Payloads of the POD XML plugin, streamed one POD element at a time """
+
+import support
+
+import os
+import unittest
+
+import jackal
+
+
+class CountingInput(jackal.JInput):
+    """ Counts the times the content is read from the beginning """
+
+    def __init__(self, *args):
+        super(CountingInput, self).__init__(*args)
+        self.streams = 0
+
+    def stream(self):
+        self.streams += 1
+        return super(CountingInput, self).stream()
+
+
+class TestPod(support.PinnedOutput, unittest.TestCase):
+
+    name = 'pod'
+    pinned = (
+        ('bench0000.xml', 5946, 'd0efe9e8446501759cc78318b675a8c048eb79edf029808664eb1068a2f09e96'),
+        ('bench0001.xml', 5962, 'ac07c38562b1baa98fd759303c039e6f902fe9a99310c943d84f6a1c5d2f0832'),
+    )
+
+    def test_read_once(self):
+        with CountingInput(os.path.join(self.directory, 'bench0000.xml'), 'utf-8') as source:
+            batches = list(source.batches(support.plugin(self.name, 700)))
+            self.assertEqual(source.streams, 1)
+        self.assertGreater(len(batches), 1)
+
+    def test_method(self):
+        # the Motivazione of the PODs, in every parsing way
+        with open(os.path.join(self.directory, 'bench0000.xml'), 'r') as f:
+            text = f.read()
+        infile = os.path.join(self.directory, 'delete.xml')
+        with open(infile, 'w') as f:
+            f.write(text.replace('<Motivazione>1</Motivazione>', '<Motivazione>3</Motivazione>'))
+        for (way, parse) in support.parsings(self.name).items():
+            with self.subTest(parsing=way):
+                (records, methods) = support.payload(parse(infile))
+                self.assertEqual(methods, {'DELETE'})
+                self.assertEqual(len(records), 5946)
+        # without Motivazione
+        with open(infile, 'w') as f:
+            f.write(text.replace('<Motivazione>1</Motivazione>', ''))
+        for (way, parse) in support.parsings(self.name).items():
+            with self.subTest(parsing=way):
+                (records, methods) = support.payload(parse(infile))
+                self.assertEqual(methods, {'POST'})
+
+
+if __name__ == '__main__':
+    unittest.main()
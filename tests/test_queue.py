@@ -0,0 +1,95 @@
+""" Work queue of the long-lived processing threads
+
+Files queued again while waiting are not duplicated and are handed out only
+after delay seconds without events, and a processing thread outlives the
+files it fails on.
+"""
+
+import support
+
+import os
+import shutil
+import threading
+import time
+import unittest
+
+from benchmarks import generators
+import jackal
+
+
+class TestQueue(unittest.TestCase):
+
+    def test_debounce(self):
+        queue = jackal.JQueue()
+        started = time.monotonic()
+        queue.put('deval', '/basedir/a.csv', 0.3)
+        time.sleep(0.15)
+        # written again meanwhile: waits another delay from now
+        queue.put('deval', '/basedir/a.csv', 0.3)
+        queue.put('deval', '/basedir/b.csv')
+        self.assertEqual(queue.depth('deval'), 2)
+        self.assertEqual(queue.get('deval'), ['/basedir/b.csv'])
+        self.assertEqual(queue.get('deval'), ['/basedir/a.csv'])
+        self.assertGreaterEqual(time.monotonic() - started, 0.45)
+        self.assertEqual(queue.depth('deval'), 0)
+
+    def test_plugins(self):
+        queue = jackal.JQueue()
+        queue.put('pod', '/basedir/a.xml')
+        queue.put('deval', '/basedir/a.csv')
+        queue.put('deval', '/basedir/a.csv')
+        self.assertEqual(queue.get('deval'), ['/basedir/a.csv'])
+        self.assertEqual(queue.get('pod'), ['/basedir/a.xml'])
+
+    def test_stop(self):
+        queue = jackal.JQueue()
+        got = []
+        waiting = threading.Thread(target=lambda: got.append(queue.get('deval')))
+        waiting.start()
+        time.sleep(0.1)
+        queue.stop()
+        waiting.join(5)
+        self.assertFalse(waiting.is_alive())
+        self.assertEqual(got, [None])
+
+
+class TestThreads(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = support.server()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.directory = support.mkdtemp()
+        self.basedir = os.path.join(self.directory, 'pod')
+        os.makedirs(os.path.join(self.basedir, 'ok'))
+        os.makedirs(os.path.join(self.basedir, 'ko'))
+        self.server.reset()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_failed_file(self):
+        support.configure(self.directory, '[jackal]\nloglevel=CRITICAL\nbaseurl=%s\nretries=0\n[pod]\nclientid=5\nbasedir=%s\nokdir=ok\nkodir=ko\n' % (self.server.url, self.basedir))
+        (name,) = generators.generate('pod', self.directory, 1, 0.2)
+        with open(os.path.join(self.directory, name), 'r') as f:
+            lines = f.read().split('\n')
+        # an Ea day without its Er
+        del lines[[index for (index, line) in enumerate(lines) if line.startswith('<Er ')][0]]
+        with open(os.path.join(self.basedir, 'bad.xml'), 'w') as f:
+            f.write('\n'.join(lines))
+        shutil.copy(os.path.join(self.directory, name), os.path.join(self.basedir, 'good.xml'))
+        # the thread fails on the first file and processes the second
+        self.assertTrue(support.run([os.path.join(self.basedir, 'bad.xml'), os.path.join(self.basedir, 'good.xml')]))
+        self.assertEqual(sorted(os.listdir(os.path.join(self.basedir, 'ko'))), ['bad.xml'])
+        self.assertEqual(sorted(os.listdir(os.path.join(self.basedir, 'ok'))), ['good.xml'])
+        self.assertGreater(self.server.stats['records'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+""" Resume of the files the server stopped accepting midway
+
+A file moved into kodir keeps the progress of its chunks: moved back into
+basedir, only the chunks not accepted are sent again, unless the content or
+the parsing or chunking layout changed, and then all of them.
+"""
+
+import support
+
+import os
+import shutil
+import unittest
+
+from benchmarks import generators
+
+
+class TestResume(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = support.server()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.directory = support.mkdtemp()
+        self.basedir = os.path.join(self.directory, 'deval')
+        os.makedirs(os.path.join(self.basedir, 'ok'))
+        os.makedirs(os.path.join(self.basedir, 'ko'))
+        self.source = os.path.join(self.directory, 'source')
+        os.makedirs(self.source)
+        (self.name,) = generators.generate('deval', self.source, 1, 0.3)
+        self.infile = os.path.join(self.basedir, self.name)
+        self.server.budget = None
+        self.server.reset()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def process(self, batchsize):
+        support.configure(self.directory, '[jackal]\nloglevel=CRITICAL\nbaseurl=%s\nretries=0\nchunkrecords=500\n[deval]\nclientid=5\nbasedir=%s\nokdir=ok\nkodir=ko\nbatch=%d\n' % (self.server.url, self.basedir, batchsize))
+        self.assertTrue(support.run([self.infile]))
+
+    def records(self):
+        # the records of the file, all accepted
+        shutil.copy(os.path.join(self.source, self.name), self.infile)
+        self.process(10000)
+        os.unlink(os.path.join(self.basedir, 'ok', self.name))
+        records = self.server.stats['records']
+        self.server.reset()
+        return records
+
+    def fail(self, batchsize, budget):
+        # the server accepts budget chunks of the file, then fails
+        shutil.copy(os.path.join(self.source, self.name), self.infile)
+        self.server.budget = budget
+        self.process(batchsize)
+        self.server.budget = None
+        failed = os.path.join(self.basedir, 'ko', self.name)
+        self.assertTrue(os.path.isfile(failed))
+        self.assertTrue(os.path.isfile('%s.chunks' % failed))
+        accepted = self.server.stats['records']
+        self.server.reset()
+        os.rename(failed, self.infile)
+        return accepted
+
+    def retry(self, batchsize):
+        self.process(batchsize)
+        self.assertTrue(os.path.isfile(os.path.join(self.basedir, 'ok', self.name)))
+        self.assertFalse(os.path.isfile(os.path.join(self.basedir, 'ko', '%s.chunks' % self.name)))
+        return self.server.stats['records']
+
+    def test_resume(self):
+        total = self.records()
+        accepted = self.fail(700, 4)
+        self.assertTrue(0 < accepted < total)
+        self.assertEqual(self.retry(700), total - accepted)
+
+    def test_resume_other_batch(self):
+        # the chunks are numbered otherwise, all of them are sent again
+        total = self.records()
+        self.fail(700, 4)
+        self.assertEqual(self.retry(10000), total)
+
+    def test_resume_other_content(self):
+        total = self.records()
+        self.fail(700, 4)
+        # same name and size, other content: the last digit of the last value
+        with open(self.infile, 'r+b') as f:
+            f.seek(-2, os.SEEK_END)
+            digit = f.read(1)
+            f.seek(-2, os.SEEK_END)
+            f.write(b'1' if digit == b'0' else b'0')
+        self.assertEqual(self.retry(700), total)
+
+
+if __name__ == '__main__':
+    unittest.main()
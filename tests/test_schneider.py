@@ -0,0 +1,45 @@
+""" Payloads of the Schneider EGX300 plugin, columnar and row by row """
+
+import support
+
+import os
+import unittest
+
+import jackal.plugins.schneider
+
+
+class TestSchneider(support.PinnedOutput, unittest.TestCase):
+
+    name = 'schneider'
+    pinned = (
+        ('bench0000.csv', 1000, '46449d536cf386f8946a473f4738f457bc6b5b56f33cd7266a3baa8069a952f7'),
+        ('bench0001.csv', 1000, '2da41946cd5ca0dfca7d5e0daa4ecce2944afb8c23eb2615aa2ef5a56e9706c5'),
+    )
+
+    def test_rows(self):
+        # without NumPy, the rows give the very same payload
+        numpy = jackal.plugins.schneider.numpy
+        jackal.plugins.schneider.numpy = None
+        try:
+            self.test_payload()
+        finally:
+            jackal.plugins.schneider.numpy = numpy
+
+    def test_irregular_rows(self):
+        # a short row sends its block row by row
+        with open(os.path.join(self.directory, 'bench0000.csv'), 'r') as f:
+            lines = f.read().split('\n')
+        lines[10] = ';'.join(lines[10].split(';')[:-1])
+        infile = os.path.join(self.directory, 'irregular.csv')
+        with open(infile, 'w') as f:
+            f.write('\n'.join(lines))
+        parse = support.parsings(self.name)['whole']
+        (records, methods) = support.payload(parse(infile))
+        (pinned, methods) = support.payload(parse(os.path.join(self.directory, 'bench0000.csv')))
+        self.assertEqual(len(records), len(pinned))
+        self.assertEqual(records[3]['measures'], pinned[3]['measures'][:-1])
+        self.assertEqual(records[4:], pinned[4:])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+""" Payloads of the Solar-Log plugins, by header plan and fixed layout """
+
+import support
+
+import os
+import unittest
+
+
+class TestSolarLog1(support.PinnedOutput, unittest.TestCase):
+
+    name = 'solarlog1'
+    pinned = (
+        ('bench0000.csv', 2000, '4ac106731224595b6220a3f78898cda534727d8b1e6a7eab28be1e27ac758df8'),
+        ('bench0001.csv', 2000, '333c77c3f5dd6619bc69b43217695efc764f17e137269c88fc0591a27f2a9896'),
+    )
+
+    def payload(self, text):
+        infile = os.path.join(self.directory, 'small.csv')
+        with open(infile, 'w') as f:
+            f.write(text)
+        results = {}
+        for (way, parse) in support.parsings(self.name).items():
+            results[way] = support.payload(parse(infile))[0]
+        # the same records in every way
+        (first, *others) = results.values()
+        for records in others:
+            self.assertEqual(records, first)
+        return first
+
+    def test_plan(self):
+        # blocks named by the header, in its order and with its measures
+        records = self.payload('#Datum;Uhrzeit;WR;Uac;Pac;WR;DaySum\n01/06/20;12:00:00;1;230;1500;2;2500\n')
+        self.assertEqual(records, [
+            {'client_id': '5', 'at': '2020-06-01T12:00:00+02:00', 'device_id': 1, 'measures': [{'measure_id': 'Uac', 'value': 230}, {'measure_id': 'Pac', 'value': 1.5}]},
+            {'client_id': '5', 'at': '2020-06-01T12:00:00+02:00', 'device_id': 2, 'measures': [{'measure_id': 'DaySum', 'value': 2.5}]},
+        ])
+
+    def test_fixed(self):
+        # unknown names: the fixed layout of the plugin
+        records = self.payload('#Datum;Uhrzeit;A;B\n01/06/20;12:00:00;3;1000;2000;0;0;1;2;3;4;5;230\n')
+        self.assertEqual([record['device_id'] for record in records], [3])
+        self.assertEqual([measure['measure_id'] for measure in records[0]['measures']], ['Pac', 'DaySum', 'Status', 'Error', 'Pdc1', 'Pdc2', 'Udc1', 'Udc2', 'Temp', 'Uac'])
+        self.assertEqual(records[0]['measures'][0]['value'], 1.0)
+
+
+class TestSolarLog2(support.PinnedOutput, unittest.TestCase):
+
+    name = 'solarlog2'
+    pinned = (
+        ('bench0000.csv', 2000, '193a6c9ab04224553890d534ef008505a485e5390f4960b53e7cb5d911791500'),
+        ('bench0001.csv', 2000, '097d0619fcf51cac0462d76f731c8ab90772869106b56e4c9fab44a8e14832c9'),
+    )
+
+
+if __name__ == '__main__':
+    unittest.main()
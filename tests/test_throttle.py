@@ -0,0 +1,86 @@
+""" Requests in flight and records per second towards the REST API """
+
+import support
+
+import shutil
+import threading
+import time
+import unittest
+
+import jackal
+
+
+class TestThrottle(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = support.mkdtemp()
+        support.configure(self.directory, '[jackal]\nloglevel=CRITICAL\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def waiting(self, throttle, count):
+        # threads waiting for a request slot, and the ones that got it
+        started = []
+        threads = [threading.Thread(target=lambda: started.append(throttle.acquire(1)), daemon=True) for _ in range(count)]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.2)
+        return (threads, started)
+
+    def test_window(self):
+        throttle = jackal.JThrottle(maxinflight=2)
+        first = throttle.acquire(1)
+        throttle.acquire(1)
+        (threads, started) = self.waiting(throttle, 1)
+        self.assertEqual(started, [])
+        throttle.release(1, first, False)
+        threads[0].join(5)
+        self.assertEqual(len(started), 1)
+        self.assertEqual(throttle.inflight, 2)
+
+    def test_wake_all(self):
+        # slow start: a request answered frees its slot and widens the window
+        throttle = jackal.JThrottle(adaptive=True, maxinflight=8)
+        first = throttle.acquire(1)
+        throttle.acquire(1)
+        (threads, started) = self.waiting(throttle, 2)
+        self.assertEqual(started, [])
+        throttle.release(1, first, False)
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(len(started), 2)
+        self.assertEqual(throttle.window, 3)
+        self.assertEqual(throttle.inflight, 3)
+
+    def test_congestion(self):
+        throttle = jackal.JThrottle(adaptive=True, maxinflight=16, maxrate=1000)
+        for _ in range(6):
+            throttle.release(1, throttle.acquire(1), False)
+        self.assertEqual(throttle.window, 8)
+        started = throttle.acquire(1)
+        throttle.release(1, started, True)
+        self.assertEqual(throttle.window, 4)
+        self.assertEqual(throttle.pace.rate, 500)
+        # the requests in flight meanwhile saw the same congestion
+        throttle.release(1, started, True)
+        self.assertEqual(throttle.window, 4)
+        # then one request more per round trip
+        throttle.release(1, throttle.acquire(1), False)
+        self.assertEqual(throttle.window, 4.25)
+
+    def test_rate(self):
+        throttle = jackal.JThrottle(maxrate=1000)
+        started = time.monotonic()
+        for _ in range(3):
+            throttle.release(250, throttle.acquire(250), False)
+        # the third chunk waits for the records of the first two
+        self.assertGreaterEqual(time.monotonic() - started, 0.49)
+        throttle.limit(100)
+        self.assertEqual(throttle.pace.rate, 100)
+        throttle.limit(5000)
+        self.assertEqual(throttle.pace.rate, 100)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+""" CSRF token shared by the concurrent submissions
+
+The chunks sent at the same time wait for a single token request, and for a
+single new one when the server stops accepting the token.
+"""
+
+import support
+
+import shutil
+import time
+import unittest
+
+import jackal
+from jackal.batch import MeasureBatch
+
+
+class SlowTokenHandler(support.BudgetHandler):
+    """ Answers the token requests after a while """
+
+    def do_GET(self):
+        time.sleep(0.2)
+        return super(SlowTokenHandler, self).do_GET()
+
+
+class Token():
+
+    engine = 'requests'
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = support.server()
+        cls.server.RequestHandlerClass = SlowTokenHandler
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.directory = support.mkdtemp()
+        support.configure(self.directory, '[jackal]\nloglevel=CRITICAL\nbaseurl=%s\nretries=0\nengine=%s\nconnections=8\nchunkrecords=10\nchunkworkers=8\n' % (self.server.url, self.engine))
+        self.server.token = 'bench'
+        self.server.reset()
+        self.data = MeasureBatch('5')
+        for quarter in range(80):
+            self.data.append('2020-03-29T%02d:%02d:00+01:00' % (quarter // 4, quarter % 4 * 15), 'pod', [('Ea', quarter)])
+
+    def tearDown(self):
+        jackal.rest.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_single_flight(self):
+        self.assertTrue(jackal.rest.submit(self.data))
+        self.assertEqual(self.server.stats['requests'], 8)
+        self.assertEqual(self.server.stats['tokens'], 1)
+
+    def test_rotated(self):
+        self.assertTrue(jackal.rest.submit(self.data))
+        # every chunk in flight is refused with the old token
+        self.server.token = 'rotated'
+        self.server.reset()
+        self.assertTrue(jackal.rest.submit(self.data))
+        self.assertEqual(self.server.stats['requests'], 8)
+        self.assertEqual(self.server.stats['tokens'], 1)
+
+
+class TestToken(Token, unittest.TestCase):
+    pass
+
+
+class TestAsyncToken(Token, unittest.TestCase):
+
+    engine = 'asyncio'
+
+
+if __name__ == '__main__':
+    unittest.main()